@@ -0,0 +1,166 @@
+"""Online database backup."""
+
+import asyncio
+import gzip
+import sqlite3
+import tempfile
+import time
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any, BinaryIO
+
+from django.apps import apps
+from django.db import connections
+from loguru import logger
+
+# Pages copied per SQLite backup step
+BACKUP_PAGES_PER_STEP = 256
+# Seconds to pause between two backup steps so writers are not starved
+BACKUP_STEP_DELAY = 0.005
+# Size of the buffer used while compressing
+BACKUP_BUFFER_SIZE = 1024 * 1024
+
+
+def backup_file_name(vendor: str) -> str:
+    """Return a timestamped backup file name for the given database vendor."""
+    extension = "sqlite3" if vendor == "sqlite" else "copy"
+    return f"tg-totp_{datetime.now(UTC).strftime('%Y%m%d_%H%M%S')}.{extension}.gz"
+
+
+def backup_database(
+    output: Path,
+    pages: int = BACKUP_PAGES_PER_STEP,
+    step_delay: float = BACKUP_STEP_DELAY,
+    using: str = "default",
+) -> dict[str, Any]:
+    """Take an online backup of the database and write it gzip compressed to output.
+
+    SQLite databases are copied with the online backup API a few pages at a time, PostgreSQL databases are streamed
+    table by table with ``COPY ... TO STDOUT`` from one read only snapshot. Neither holds a lock for the whole run.
+
+    Args:
+        output (Path): Destination file.
+        pages (int): SQLite pages copied per step.
+        step_delay (float): Seconds slept between two steps.
+        using (str): Database alias.
+
+    Returns
+    -------
+        dict: Backup statistics with written bytes, duration in seconds and throughput in bytes per second.
+
+    Raises
+    ------
+        ValueError: If the database vendor can't be backed up.
+    """
+    connection = connections[using]
+    started = time.monotonic()
+    output.parent.mkdir(parents=True, exist_ok=True)
+    if connection.vendor == "sqlite":
+        _backup_sqlite(connection.settings_dict["NAME"], output, pages, step_delay)
+    elif connection.vendor == "postgresql":
+        _backup_postgresql(connection, output, step_delay)
+    else:
+        msg = f"Backup is not supported for {connection.vendor}"
+        raise ValueError(msg)
+    duration = time.monotonic() - started
+    size = output.stat().st_size
+    stats = {"bytes": size, "duration": duration, "throughput": size / duration if duration else float(size)}
+    logger.info(f"Backed up database to {output} {stats}")
+    return stats
+
+
+def _backup_sqlite(database: str, output: Path, pages: int, step_delay: float) -> None:
+    """Copy a SQLite database with the online backup API, then compress it."""
+
+    def pause(_status: int, remaining: int, total: int) -> None:
+        logger.debug(f"Backup copied {total - remaining}/{total} pages")
+        time.sleep(step_delay)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        snapshot = Path(temp_dir, "snapshot.sqlite3")
+        source = sqlite3.connect(database)
+        destination = sqlite3.connect(snapshot)
+        try:
+            with destination:
+                source.backup(destination, pages=pages, progress=pause)
+        finally:
+            destination.close()
+            source.close()
+        with snapshot.open("rb") as src, gzip.open(output, "wb") as dst:
+            _copy_with_pauses(src, dst, step_delay)
+
+
+def _backup_postgresql(connection: Any, output: Path, step_delay: float) -> None:
+    """Stream every table of the app with COPY into a compressed file.
+
+    All tables are copied in one repeatable read transaction, so they come from the same snapshot even while secrets,
+    tombstones and jobs are written meanwhile. Readers and writers are not blocked by it.
+    """
+    connection.ensure_connection()
+    try:
+        with gzip.open(output, "wb") as dst, connection.connection.cursor() as cursor:
+            cursor.execute("BEGIN ISOLATION LEVEL REPEATABLE READ READ ONLY")
+            try:
+                for model in apps.get_app_config("sqlitedb").get_models():
+                    table = model._meta.db_table  # noqa: SLF001
+                    dst.write(f"-- table {table}\n".encode())
+                    cursor.copy_expert(f'COPY "{table}" TO STDOUT WITH (FORMAT csv, HEADER)', dst)
+                    time.sleep(step_delay)
+            finally:
+                # Nothing was written, ending the snapshot is all that is left to do
+                cursor.execute("ROLLBACK")
+    finally:
+        # Connections are per thread, don't leave one behind in a backup thread
+        connection.close()
+
+
+def _copy_with_pauses(src: BinaryIO, dst: Any, step_delay: float) -> None:
+    """Copy a stream in chunks, pausing between them."""
+    while chunk := src.read(BACKUP_BUFFER_SIZE):
+        dst.write(chunk)
+        time.sleep(step_delay)
+
+
+def prune_backups(backup_dir: Path, keep: int) -> None:
+    """Delete all but the newest keep backups in backup_dir.
+
+    Raises
+    ------
+        ValueError: If keep is less than 1, the backup just taken would be deleted too.
+    """
+    if keep < 1:
+        msg = f"At least one backup must be kept, got {keep}"
+        raise ValueError(msg)
+    for old_backup in sorted(backup_dir.glob("tg-totp_*.gz"))[:-keep]:
+        old_backup.unlink()
+
+
+async def periodic_backup(
+    backup_dir: Path,
+    interval: int,
+    keep: int,
+) -> None:
+    """Back up the database every interval seconds, keeping only the newest backups.
+
+    Args:
+        backup_dir (Path): Folder where backups are written.
+        interval (int): Seconds between two backups.
+        keep (int): Number of backups to retain, at least 1.
+
+    Raises
+    ------
+        ValueError: If keep is less than 1.
+    """
+    if keep < 1:
+        msg = f"At least one backup must be kept, got {keep}"
+        raise ValueError(msg)
+    while True:
+        await asyncio.sleep(interval)
+        output = Path(backup_dir, backup_file_name(connections["default"].vendor))
+        try:
+            # Own thread, not the shared ORM thread, so handlers keep reaching the database meanwhile
+            await asyncio.to_thread(backup_database, output)
+        except Exception as e:  # noqa: BLE001
+            logger.error(f"Periodic backup failed {e}")
+            continue
+        await asyncio.to_thread(prune_backups, backup_dir, keep)
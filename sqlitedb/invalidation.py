@@ -0,0 +1,247 @@
+"""Cache invalidation shared between processes."""
+
+import asyncio
+import contextlib
+import json
+import os
+import queue
+import socket
+import threading
+import uuid
+from collections.abc import Callable
+from enum import Enum
+from pathlib import Path
+from typing import Any, Self
+
+from loguru import logger
+
+# Postgres channel used for invalidation messages
+NOTIFY_CHANNEL = "tg_totp_invalidation"
+# Seconds closing a transport waits for queued notifications to be sent
+NOTIFY_CLOSE_TIMEOUT = 5
+
+
+class InvalidationKind(Enum):
+    """What changed."""
+
+    USER = "user"
+    SECRETS = "secrets"
+
+
+class Transport(object):
+    """Carries invalidation messages to other processes. The base transport keeps them in process."""
+
+    def start(self: Self, loop: asyncio.AbstractEventLoop, receive: Callable[[str], None]) -> None:
+        """Start delivering messages from other processes to receive on loop."""
+
+    def send(self: Self, message: str) -> None:
+        """Send message to other processes."""
+
+    def close(self: Self) -> None:
+        """Stop the transport."""
+
+
+class PostgresTransport(Transport):
+    """Broadcast with PostgreSQL ``LISTEN/NOTIFY``, using psycopg2 like Django's connections.
+
+    Messages are published from async ORM code on the event loop, so they are only queued there. A sender thread
+    makes the connection and the ``pg_notify`` round trips.
+    """
+
+    def __init__(self: Self, connection_params: dict[str, Any], channel: str = NOTIFY_CHANNEL) -> None:
+        self.connection_params = connection_params
+        self.channel = channel
+        self._queue: queue.SimpleQueue[str | None] = queue.SimpleQueue()
+        self._thread: threading.Thread | None = None
+        self._listener: Any = None
+        self._sender: Any = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def _connect(self: Self) -> Any:
+        import psycopg2  # noqa: PLC0415
+
+        connection = psycopg2.connect(**self.connection_params)
+        connection.autocommit = True
+        return connection
+
+    def start(self: Self, loop: asyncio.AbstractEventLoop, receive: Callable[[str], None]) -> None:
+        """Listen on the channel and read notifications whenever the connection is readable."""
+        self._listener = self._connect()
+        with self._listener.cursor() as cursor:
+            cursor.execute(f'LISTEN "{self.channel}"')
+
+        def on_readable() -> None:
+            self._listener.poll()
+            while self._listener.notifies:
+                receive(self._listener.notifies.pop(0).payload)
+
+        loop.add_reader(self._listener.fileno(), on_readable)
+        self._loop = loop
+
+    def send(self: Self, message: str) -> None:
+        """Queue a notification of the channel for the sender thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._send_queued, name="invalidation-sender", daemon=True)
+            self._thread.start()
+        self._queue.put(message)
+
+    def _send_queued(self: Self) -> None:
+        """Notify the channel of queued messages until ``close`` queues None."""
+        while (message := self._queue.get()) is not None:
+            try:
+                if self._sender is None or self._sender.closed:
+                    self._sender = self._connect()
+                with self._sender.cursor() as cursor:
+                    cursor.execute("SELECT pg_notify(%s, %s)", (self.channel, message))
+            except Exception as e:  # noqa: BLE001
+                logger.error(f"Unable to broadcast invalidation {e}")
+                if self._sender is not None:
+                    self._sender.close()
+
+    def close(self: Self) -> None:
+        """Send queued notifications and close both connections."""
+        if self._loop is not None:
+            self._loop.remove_reader(self._listener.fileno())
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(NOTIFY_CLOSE_TIMEOUT)
+        for connection in (self._listener, self._sender):
+            if connection is not None:
+                connection.close()
+
+
+class UnixSocketTransport(Transport):
+    """Broadcast with datagrams to every process that has a socket in a shared directory.
+
+    Meant for SQLite deployments where every process runs on the same host.
+    """
+
+    def __init__(self: Self, directory: Path) -> None:
+        self.directory = directory
+        self.path = Path(directory, f"{os.getpid()}_{uuid.uuid4().hex[:8]}.sock")
+        self._socket: socket.socket | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sender.setblocking(False)  # noqa: FBT003
+
+    def start(self: Self, loop: asyncio.AbstractEventLoop, receive: Callable[[str], None]) -> None:
+        """Bind this process' socket and read datagrams whenever it is readable."""
+        self.directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+        with contextlib.suppress(FileNotFoundError):
+            self.path.unlink()
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(str(self.path))
+        self._socket.setblocking(False)  # noqa: FBT003
+
+        def on_readable() -> None:
+            with contextlib.suppress(BlockingIOError):
+                while self._socket:
+                    receive(self._socket.recv(65536).decode())
+
+        loop.add_reader(self._socket.fileno(), on_readable)
+        self._loop = loop
+
+    def send(self: Self, message: str) -> None:
+        """Send message to every other socket, forgetting sockets of processes that are gone."""
+        data = message.encode()
+        for peer in self.directory.glob("*.sock"):
+            if peer == self.path:
+                continue
+            try:
+                self._sender.sendto(data, str(peer))
+            except (ConnectionRefusedError, FileNotFoundError):
+                with contextlib.suppress(FileNotFoundError):
+                    peer.unlink()
+            except BlockingIOError:
+                logger.warning(f"Invalidation queue of {peer} is full, dropping message")
+
+    def close(self: Self) -> None:
+        """Close and remove this process' socket."""
+        if self._socket is not None:
+            if self._loop is not None:
+                self._loop.remove_reader(self._socket.fileno())
+            self._socket.close()
+            self._socket = None
+        with contextlib.suppress(FileNotFoundError):
+            self.path.unlink()
+        self._sender.close()
+
+
+class InvalidationBus(object):
+    """Tells in-process caches, in this and other processes, that data changed.
+
+    Writers publish what changed. Subscribers of that kind are called right away in this process and, through the
+    transport, in every other process sharing the database.
+    """
+
+    def __init__(self: Self) -> None:
+        self.origin = uuid.uuid4().hex
+        self.transport = Transport()
+        self._subscribers: dict[InvalidationKind, list[Callable[[int], Any]]] = {kind: [] for kind in InvalidationKind}
+
+    def subscribe(self: Self, kind: InvalidationKind, callback: Callable[[int], Any]) -> None:
+        """Call callback with the changed key whenever data of kind changes."""
+        self._subscribers[kind].append(callback)
+
+    def publish(self: Self, kind: InvalidationKind, key: int) -> None:
+        """Announce that data of kind for key changed."""
+        self._notify(kind, key)
+        try:
+            self.transport.send(json.dumps({"origin": self.origin, "kind": kind.value, "key": key}))
+        except Exception as e:  # noqa: BLE001
+            logger.error(f"Unable to broadcast invalidation {e}")
+
+    def connect(self: Self, transport: Transport, loop: asyncio.AbstractEventLoop | None = None) -> None:
+        """Start exchanging invalidations with other processes through transport.
+
+        Without a loop invalidations are only sent, which is enough for processes without caches like management
+        commands.
+        """
+        self.transport = transport
+        if loop is not None:
+            transport.start(loop, self._receive)
+        logger.info(f"Cache invalidation bus connected using {type(transport).__name__}")
+
+    def close(self: Self) -> None:
+        """Stop exchanging invalidations."""
+        self.transport.close()
+        self.transport = Transport()
+
+    def _receive(self: Self, message: str) -> None:
+        try:
+            data = json.loads(message)
+            if data["origin"] == self.origin:
+                return
+            self._notify(InvalidationKind(data["kind"]), int(data["key"]))
+        except (ValueError, KeyError) as e:
+            logger.debug(f"Ignoring invalid invalidation message {message} {e}")
+
+    def _notify(self: Self, kind: InvalidationKind, key: int) -> None:
+        for callback in self._subscribers[kind]:
+            callback(key)
+
+
+def create_transport(name: str, socket_dir: Path, using: str = "default") -> Transport | None:
+    """Create the transport called name, None if invalidations should stay in process.
+
+    Args:
+        name (str): ``postgres``, ``unix``, ``auto`` to pick by database vendor, anything else for none.
+        socket_dir (Path): Shared directory of the unix socket transport.
+        using (str): Database alias.
+    """
+    from django.db import connections  # noqa: PLC0415
+
+    connection = connections[using]
+    if name == "auto":
+        name = "postgres" if connection.vendor == "postgresql" else "unix"
+    if name == "postgres":
+        params = connection.get_connection_params()
+        # Only meaningful to Django's own connections
+        params.pop("cursor_factory", None)
+        return PostgresTransport(params)
+    if name == "unix":
+        return UnixSocketTransport(socket_dir)
+    return None
+
+
+invalidation_bus = InvalidationBus()
@@ -0,0 +1,39 @@
+"""Take an online backup of the database."""
+
+from pathlib import Path
+from typing import Any, Self
+
+from django.core.management.base import BaseCommand, CommandParser
+from django.db import connections
+
+from sqlitedb.backup import BACKUP_PAGES_PER_STEP, BACKUP_STEP_DELAY, backup_database, backup_file_name
+
+
+class Command(BaseCommand):
+    """Back up the database without stopping the bot."""
+
+    help = "Take a compressed online backup of the database while the bot keeps running."
+
+    def add_arguments(self: Self, parser: CommandParser) -> None:
+        """Add command arguments."""
+        parser.add_argument("--output", type=Path, help="Backup file. Defaults to a timestamped file in backups/.")
+        parser.add_argument("--pages", type=int, default=BACKUP_PAGES_PER_STEP, help="SQLite pages copied per step.")
+        parser.add_argument(
+            "--step-delay",
+            type=float,
+            default=BACKUP_STEP_DELAY,
+            help="Seconds to pause between steps.",
+        )
+        parser.add_argument("--database", default="default", help="Database alias to back up.")
+
+    def handle(self: Self, *args: Any, **options: Any) -> None:
+        """Run the backup and report throughput."""
+        using = options["database"]
+        output = options["output"] or Path("backups", backup_file_name(connections[using].vendor))
+        stats = backup_database(output, pages=options["pages"], step_delay=options["step_delay"], using=using)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Backed up to {output}: {stats['bytes']} bytes in {stats['duration']:.2f}s "
+                f"({stats['throughput'] / 1024:.1f} KiB/s)",
+            ),
+        )
@@ -0,0 +1,28 @@
+# Generated by Django 6.1 on 2026-10-19 03:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sqlitedb', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SecretTombstone',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('secret_id', models.IntegerField()),
+                ('issuer', models.CharField(max_length=256)),
+                ('account_id', models.CharField(blank=True, max_length=256)),
+                ('deleted_on', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sqlitedb.user')),
+            ],
+            options={
+                'db_table': 'secret_tombstone',
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.1 on 2026-10-19 03:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sqlitedb', '0002_secrettombstone'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='secret',
+            name='last_used',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='secret',
+            name='use_count',
+            field=models.IntegerField(default=0),
+        ),
+    ]
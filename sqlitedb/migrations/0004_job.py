@@ -0,0 +1,35 @@
+# Generated by Django 6.1 on 2026-10-19 03:34
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sqlitedb', '0003_secret_usage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('addurifile', 'ADDURIFILE'), ('export', 'EXPORT'), ('exportqr', 'EXPORTQR')], max_length=20)),
+                ('status', models.CharField(choices=[('queued', 'QUEUED'), ('running', 'RUNNING'), ('done', 'DONE'), ('failed', 'FAILED'), ('cancelled', 'CANCELLED')], default='queued', max_length=20)),
+                ('payload', models.JSONField(default=dict)),
+                ('progress', models.JSONField(default=dict)),
+                ('attempts', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('heartbeat', models.DateTimeField(blank=True, null=True)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sqlitedb.user')),
+            ],
+            options={
+                'db_table': 'job',
+                'indexes': [models.Index(fields=['status', 'run_after'], name='job_status_65b5d2_idx')],
+            },
+        ),
+    ]
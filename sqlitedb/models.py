@@ -1,24 +1,48 @@
 """Models."""
 
+from collections.abc import AsyncIterator, Iterable
+from datetime import UTC, datetime
 from typing import Any, Self
 from urllib.parse import quote
 
 from asgiref.sync import sync_to_async
-from django.db import IntegrityError, models
-from django.db.models import Field
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, Field
+from django.utils import timezone
 from telethon.tl.types import User as TelegramUser
 
 from manage import init_django
+from sqlitedb.invalidation import InvalidationKind, invalidation_bus
 from sqlitedb.lookups import ILike
-from sqlitedb.utils import UserStatus, paginate_queryset
+from sqlitedb.utils import JobKind, JobStatus, UserStatus, paginate_queryset
+from telegram.cache import VersionCounter
 from telegram.exceptions import DuplicateSecretError
-from telegram.utils import or_filters, prepare_user_filter
+from telegram.utils import or_filters, prepare_telegram_user_filter, prepare_user_filter
 from totp.totp import OTP
 
 init_django()
 
 Field.register_lookup(ILike)
 
+reduced_print_template = (
+    "`{otp}` is OTP for account **{account}** issued by **{issuer}**.(ID - `{id}`)."
+    "Valid for {time_left} sec till **{valid_till}**"
+)
+
+# Version of each user's secrets, keyed by telegram id. Bumped on every write so rendered views can be cached.
+secret_versions: VersionCounter[int] = VersionCounter()
+invalidation_bus.subscribe(InvalidationKind.SECRETS, secret_versions.bump)
+
+# Payload keys kept once a job ended, the rest may hold secrets like imported URIs
+JOB_REPORT_KEYS = ("chat_id", "reply_to", "message_id")
+# Statuses of jobs that will not run again
+JOB_FINAL_STATUSES = [JobStatus.DONE.value, JobStatus.FAILED.value, JobStatus.CANCELLED.value]
+
+
+def job_report_payload(payload: dict[str, Any]) -> dict[str, Any]:
+    """Return the part of a job payload needed to report to the user once the job ended."""
+    return {key: payload[key] for key in JOB_REPORT_KEYS if key in payload}
+
 
 class UserManager(models.Manager):  # type: ignore[type-arg]
     """Manager for the User model."""
@@ -33,18 +57,31 @@ class UserManager(models.Manager):  # type: ignore[type-arg]
         -------
             User: The User object corresponding to the specified user ID
         """
-        try:
-            # https://github.com/typeddjango/django-stubs/issues/1493
-            user: User = await self.filter(telegram_id=telegram_user.id).aget()
-        except self.model.DoesNotExist:
-            user_dict = {
-                "telegram_id": telegram_user.id,
-                "name": f"{telegram_user.first_name} {telegram_user.last_name}",
-            }
-            user = await User.objects.acreate(**user_dict)
-
+        # get_or_create retries the lookup on IntegrityError, so concurrent first messages from the same user
+        # can't race each other into a duplicate insert.
+        user: User
+        user, _ = await self.aget_or_create(
+            telegram_id=telegram_user.id,
+            defaults={"name": f"{telegram_user.first_name} {telegram_user.last_name}"},
+        )
         return user
 
+    async def update_settings(self: Self, user: "User", settings: dict[str, Any]) -> None:
+        """Save new settings of a user and invalidate cached copies of the user everywhere.
+
+        Args:
+            user (User): The user to modify.
+            settings (dict): The complete new settings.
+        """
+        user.settings = settings
+        await user.asave(update_fields=["settings", "last_updated"])
+        invalidation_bus.publish(InvalidationKind.USER, user.telegram_id)
+
+    async def blocked_telegram_ids(self: Self) -> set[int]:
+        """Return telegram ids of users who are suspended or temporarily banned."""
+        data = self.exclude(status=UserStatus.ACTIVE.value).values_list("telegram_id", flat=True)
+        return {telegram_id async for telegram_id in data}
+
 
 class User(models.Model):
     """Model for storing user data.
@@ -101,6 +138,56 @@ class User(models.Model):
         return f"User(id={self.id}, name={self.name}, telegram_id={self.telegram_id}, status={self.status})"
 
 
+class SecretView(object):
+    """Lightweight, read-only view of a secret row.
+
+    Built from a ``values_list`` row so read paths skip model instantiation and only carry the columns they format.
+    """
+
+    # Order matters, rows are fetched with these columns and mapped to the view positionally
+    __slots__ = ("id", "secret", "issuer", "account_id", "digits", "period", "algorithm", "joining_date")  # noqa: RUF023
+
+    def __init__(  # noqa: PLR0913, PLR0917
+        self: Self,
+        id: int,  # noqa: A002
+        secret: str,
+        issuer: str,
+        account_id: str,
+        digits: int,
+        period: int,
+        algorithm: str,
+        joining_date: datetime,
+    ) -> None:
+        self.id = id
+        self.secret = secret
+        self.issuer = issuer
+        self.account_id = account_id
+        self.digits = digits
+        self.period = period
+        self.algorithm = algorithm
+        self.joining_date = joining_date
+
+    @classmethod
+    def from_rows(cls: type["SecretView"], rows: Iterable[tuple[Any, ...]]) -> list["SecretView"]:
+        """Build views from ``values_list`` rows fetched with ``SecretView.__slots__``."""
+        return [cls(*row) for row in rows]
+
+    def __str__(self: Self) -> str:
+        """Return a string representation of the secret."""
+        return secret_repr(self)
+
+
+def secret_repr(secret: "Secret | SecretView") -> str:
+    """Return a markdown representation of a secret used in listings."""
+    return (
+        f"Secret [{secret.secret}](spoiler) "
+        f"with ID `{secret.id}` "
+        f"issued by **{secret.issuer}** "
+        f"for account **{secret.account_id}** "
+        f"added on **{secret.joining_date.strftime('%b %d, %Y %I:%M:%S %p')}**"
+    )
+
+
 class SecretManager(models.Manager):  # type: ignore[type-arg]
     """Manager for the User model."""
 
@@ -109,6 +196,7 @@ class SecretManager(models.Manager):  # type: ignore[type-arg]
         try:
             obj = await self.acreate(user=user, **kwargs)
             if isinstance(obj, Secret):
+                invalidation_bus.publish(InvalidationKind.SECRETS, user.telegram_id)
                 return obj
             raise IntegrityError
         except IntegrityError as e:
@@ -139,14 +227,26 @@ class SecretManager(models.Manager):  # type: ignore[type-arg]
         """
         user_filter = prepare_user_filter(user)
         combined_filter = or_filters(user_filter)
-        data = (
-            self.only("id", "issuer", "account_id", "secret", "joining_date")
-            .filter(combined_filter)
-            .order_by("-last_updated")
-        )
+        data = self.filter(combined_filter).order_by("-last_updated").values_list(*SecretView.__slots__)
 
         # Use the helper function to paginate the queryset
-        return paginate_queryset(data, page, per_page)
+        result = paginate_queryset(data, page, per_page)
+        result["data"] = SecretView.from_rows(result["data"])
+        return result
+
+    def for_telegram_id(self: Self, telegram_id: int) -> Any:
+        """Return a queryset of secrets owned by the user with the given telegram ID.
+
+        The user is resolved through a join on the ``user`` table, so no separate user lookup is needed.
+
+        Args:
+            telegram_id (int): Telegram ID of the owner.
+
+        Returns
+        -------
+            QuerySet: Secrets of the user.
+        """
+        return self.filter(**prepare_telegram_user_filter(telegram_id))
 
     async def get_secret(self: Self, user: User, secret_filter: str) -> tuple[Any, int]:
         """Return a paginated list of secrets for a given user.
@@ -159,13 +259,30 @@ class SecretManager(models.Manager):  # type: ignore[type-arg]
         -------
             tuple: Data and the no of records in it
         """
+        return await self._search_secrets(self.filter(**prepare_user_filter(user)), secret_filter)
+
+    async def get_secret_by_telegram_id(self: Self, telegram_id: int, secret_filter: str) -> tuple[Any, int]:
+        """Return secrets matching the filter for a given telegram ID in a single query.
+
+        Args:
+            telegram_id (int): Telegram ID of the owner.
+            secret_filter (str): Text to look for in issuer or account name.
+
+        Returns
+        -------
+            tuple: Data and the no of records in it
+        """
+        return await self._search_secrets(self.for_telegram_id(telegram_id), secret_filter)
+
+    async def _search_secrets(self: Self, data: Any, secret_filter: str) -> tuple[Any, int]:
+        """Search secrets by issuer or account name."""
         # Retrieve the records for the given user
         try:
             filter_kwargs = {
                 "account_id__icontains": secret_filter,
                 "issuer__icontains": secret_filter,
             }
-            return await self.export_secrets(user, filter_kwargs)
+            return await self._filtered_secrets(data, filter_kwargs)
         except self.model.DoesNotExist:
             return [], 0
 
@@ -180,18 +297,74 @@ class SecretManager(models.Manager):  # type: ignore[type-arg]
         -------
             tuple: Data and the no of records in it
         """
+        return await self._filtered_secrets(self.filter(**prepare_user_filter(user)), secret_filter)
+
+    async def export_secrets_by_telegram_id(
+        self: Self,
+        telegram_id: int,
+        secret_filter: dict[str, Any],
+    ) -> tuple[Any, int]:
+        """Return all secrets for a given telegram ID in a single query.
+
+        Args:
+            telegram_id (int): Telegram ID of the owner.
+            secret_filter (Dict[str, str]): Filter Criteria.
+
+        Returns
+        -------
+            tuple: Data and the no of records in it
+        """
+        return await self._filtered_secrets(self.for_telegram_id(telegram_id), secret_filter)
+
+    async def _filtered_secrets(self: Self, data: Any, secret_filter: dict[str, Any]) -> tuple[Any, int]:
+        """Apply OR-ed filter criteria on a user's secrets and evaluate them."""
         # noinspection PyTypeChecker
         try:
-            user_filter = prepare_user_filter(user)
             combined_filter = or_filters(secret_filter)
-            data = self.filter(**user_filter)
             if combined_filter:
                 data = data.filter(combined_filter)
-            result = await sync_to_async(list)(data)  # type: ignore
+            rows = await sync_to_async(list)(data.values_list(*SecretView.__slots__))  # type: ignore
+            result = SecretView.from_rows(rows)
             return result, len(result)
         except self.model.DoesNotExist:
             return [], 0
 
+    async def stream_secrets_by_telegram_id(
+        self: Self,
+        telegram_id: int,
+        secret_filter: dict[str, Any],
+        chunk_size: int,
+        since: datetime | None = None,
+    ) -> AsyncIterator[list[SecretView]]:
+        """Stream secrets for a given telegram ID in fixed size chunks.
+
+        Rows are read with an async (server side where supported) cursor, so only one chunk is held in memory at a time.
+
+        Args:
+            telegram_id (int): Telegram ID of the owner.
+            secret_filter (Dict[str, str]): Filter Criteria.
+            chunk_size (int): Number of rows fetched and yielded at once.
+            since (datetime | None): Only stream secrets modified after this time.
+
+        Yields
+        ------
+            list: Chunk of SecretView rows.
+        """
+        data = self.for_telegram_id(telegram_id)
+        if since:
+            data = data.filter(last_updated__gt=since)
+        combined_filter = or_filters(secret_filter)
+        if combined_filter:
+            data = data.filter(combined_filter)
+        chunk: list[SecretView] = []
+        async for row in data.order_by("id").values_list(*SecretView.__slots__).aiterator(chunk_size=chunk_size):
+            chunk.append(SecretView(*row))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
     async def total_secrets(self: Self, user: User) -> int:
         """Return count of all secrets for a given user.
 
@@ -205,28 +378,46 @@ class SecretManager(models.Manager):  # type: ignore[type-arg]
         count = await self.filter(user=user).acount()
         return int(count)
 
-    def reduced_print(self: Self, secret: "Secret") -> Any:
+    async def total_secrets_by_telegram_id(self: Self, telegram_id: int) -> int:
+        """Return count of all secrets for a given telegram ID in a single query.
+
+        Args:
+            telegram_id (int): Telegram ID of the owner.
+
+        Returns
+        -------
+            int:no of records
+        """
+        count = await self.for_telegram_id(telegram_id).acount()
+        return int(count)
+
+    def reduced_print(self: Self, secret: "Secret | SecretView") -> Any:
         """Print Secret with minial details.
 
         Returns
         -------
             str: String repr of secret.
         """
-        otp, valid_till, time_left = OTP.now(secret=secret.secret)
+        return reduced_print_template.format(**self.reduced_print_values(secret))
 
-        return (
-            "`{otp}` is OTP for account **{account}** issued by **{issuer}**.(ID - `{id}`)."
-            "Valid for {time_left} sec till **{valid_till}**"
-        ).format(
-            otp=otp,
-            account=secret.account_id,
-            issuer=secret.issuer,
-            id=secret.id,
-            time_left=time_left,
-            valid_till=valid_till.strftime("%b %d, %Y %I:%M:%S %p"),
-        )
+    def reduced_print_values(self: Self, secret: "Secret | SecretView") -> dict[str, Any]:
+        """Values of the placeholders in ``reduced_print_template`` for a secret.
+
+        Returns
+        -------
+            dict: Placeholder values.
+        """
+        otp, valid_till, time_left = OTP.now(secret=secret.secret)
+        return {
+            "otp": otp,
+            "account": secret.account_id,
+            "issuer": secret.issuer,
+            "id": secret.id,
+            "time_left": time_left,
+            "valid_till": valid_till.strftime("%b %d, %Y %I:%M:%S %p"),
+        }
 
-    def export_print(self: Self, secret: "Secret") -> str:
+    def export_print(self: Self, secret: "Secret | SecretView") -> str:
         """Print Secret with minial details.
 
         Returns
@@ -240,12 +431,25 @@ class SecretManager(models.Manager):  # type: ignore[type-arg]
 
     async def clear_user_secrets(self: Self, user: User) -> int:
         """Clear all secret for a given user."""
-        deleted, _ = await self.filter(user=user).adelete()
-        return int(deleted)
+        deleted = await sync_to_async(self._delete_with_tombstones)(user, self.filter(user=user))
+        invalidation_bus.publish(InvalidationKind.SECRETS, user.telegram_id)
+        return deleted
 
     async def rm_user_secret(self: Self, user: User, secret_id: int) -> int:
         """Clear secret with given id."""
-        deleted, _ = await self.filter(user=user, id=secret_id).adelete()
+        deleted = await sync_to_async(self._delete_with_tombstones)(user, self.filter(user=user, id=secret_id))
+        invalidation_bus.publish(InvalidationKind.SECRETS, user.telegram_id)
+        return deleted
+
+    def _delete_with_tombstones(self: Self, user: User, data: Any) -> int:
+        """Delete secrets and record a tombstone for each one so delta exports can report the deletion."""
+        with transaction.atomic():
+            tombstones = [
+                SecretTombstone(user=user, secret_id=secret_id, issuer=issuer, account_id=account_id)
+                for secret_id, issuer, account_id in data.values_list("id", "issuer", "account_id")
+            ]
+            SecretTombstone.objects.bulk_create(tombstones)
+            deleted, _ = data.delete()
         return int(deleted)
 
 
@@ -282,6 +486,12 @@ class Secret(models.Model):
     # Date and time when the secret was modified , auto-generated
     last_updated = models.DateTimeField(auto_now=True)
 
+    # Number of times an OTP was generated for the secret, written behind by the usage tracker
+    use_count = models.IntegerField(default=0)
+
+    # Date and time when an OTP was last generated for the secret
+    last_used = models.DateTimeField(null=True, blank=True, db_index=True)
+
     # Use custom manager for this model
     objects = SecretManager()
 
@@ -292,10 +502,273 @@ class Secret(models.Model):
 
     def __str__(self: Self) -> str:
         """Return a string representation of the user object."""
+        return secret_repr(self)
+
+
+class SecretTombstoneManager(models.Manager):  # type: ignore[type-arg]
+    """Manager for the SecretTombstone model."""
+
+    async def deleted_since(self: Self, user: User, since: datetime) -> list["SecretTombstone"]:
+        """Return tombstones of secrets deleted after the given time.
+
+        Args:
+            user (User): User.
+            since (datetime): Lower bound (exclusive) of the deletion time.
+
+        Returns
+        -------
+            list: Tombstones ordered by deletion time.
+        """
+        data = self.filter(user=user, deleted_on__gt=since).order_by("deleted_on")
+        return await sync_to_async(list)(data)  # type: ignore
+
+    async def prune(self: Self, user: User, before: datetime) -> int:
+        """Remove tombstones recorded before the given time."""
+        deleted, _ = await self.filter(user=user, deleted_on__lt=before).adelete()
+        return int(deleted)
+
+    def export_print(self: Self, tombstone: "SecretTombstone") -> str:
+        """Print tombstone as a comment line of an export file.
+
+        Returns
+        -------
+            str: String repr of tombstone.
+        """
         return (
-            f"Secret [{self.secret}](spoiler) "
-            f"with ID `{self.id}` "
-            f"issued by **{self.issuer}** "
-            f"for account **{self.account_id}** "
-            f"added on **{self.joining_date.strftime('%b %d, %Y %I:%M:%S %p')}**"
+            f"# deleted id={tombstone.secret_id} issuer={quote(tombstone.issuer.strip())} "
+            f"account={quote(tombstone.account_id.strip())} on={tombstone.deleted_on.isoformat()}"
+        )
+
+
+class SecretTombstone(models.Model):
+    """Model to remember deleted secrets for delta exports."""
+
+    # Tombstone ID, auto-generated primary key
+    id = models.AutoField(primary_key=True)
+
+    # Foreign Key to user
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+
+    # ID of the deleted secret
+    secret_id = models.IntegerField()
+
+    # Issuer of the deleted secret
+    issuer = models.CharField(max_length=256)
+
+    # Account/Email-id of the deleted secret
+    account_id = models.CharField(max_length=256, blank=True)
+
+    # Date and time when the secret was deleted, auto-generated
+    deleted_on = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    # Use custom manager for this model
+    objects = SecretTombstoneManager()
+
+    class Meta:
+        """Database table name."""
+
+        db_table = "secret_tombstone"
+
+    def __str__(self: Self) -> str:
+        """Return a string representation of the tombstone object."""
+        return f"SecretTombstone(secret_id={self.secret_id}, issuer={self.issuer}, deleted_on={self.deleted_on})"
+
+
+class JobManager(models.Manager):  # type: ignore[type-arg]
+    """Manager for the Job model."""
+
+    async def enqueue(self: Self, user: User, kind: JobKind, payload: dict[str, Any]) -> "Job":
+        """Queue a job for the background workers.
+
+        Args:
+            user (User): Owner of the job.
+            kind (JobKind): What the job does.
+            payload (dict): Arguments of the job.
+
+        Returns
+        -------
+            Job: The queued job.
+        """
+        return await self.acreate(user=user, kind=kind.value, payload=payload)  # type: ignore[no-any-return]
+
+    def claim(self: Self, user_limit: int, scan: int = 50) -> "Job | None":
+        """Mark the oldest runnable queued job as running and return it, None if there is none.
+
+        Jobs of users already running ``user_limit`` jobs are skipped. The status is switched with a conditional
+        update, so a job is claimed only once even with workers in several processes.
+
+        Args:
+            user_limit (int): Maximum number of running jobs per user.
+            scan (int): Number of queued jobs looked at.
+
+        Returns
+        -------
+            Job | None: The claimed job.
+        """
+        now = datetime.now(UTC)
+        running = dict(
+            self.filter(status=JobStatus.RUNNING.value).values_list("user_id").annotate(count=Count("id")),
+        )
+        queued = self.filter(status=JobStatus.QUEUED.value, run_after__lte=now).select_related("user").order_by("id")
+        for job in queued[:scan]:
+            if running.get(job.user_id, 0) >= user_limit:
+                continue
+            claimed = self.filter(id=job.id, status=JobStatus.QUEUED.value).update(
+                status=JobStatus.RUNNING.value,
+                heartbeat=now,
+                attempts=F("attempts") + 1,
+            )
+            if claimed:
+                job.status = JobStatus.RUNNING.value
+                job.attempts += 1
+                return job  # type: ignore[no-any-return]
+        return None
+
+    async def checkpoint(self: Self, job: "Job", progress: dict[str, Any] | None = None) -> bool:
+        """Record that a running job is alive, and optionally how far it got.
+
+        Returns
+        -------
+            bool: Whether the job is still running, False once it was cancelled.
+        """
+        fields: dict[str, Any] = {"heartbeat": datetime.now(UTC)}
+        if progress is not None:
+            job.progress = progress
+            fields["progress"] = progress
+        updated = await self.filter(id=job.id, status=JobStatus.RUNNING.value).aupdate(**fields)
+        return bool(updated)
+
+    async def heartbeat(self: Self, job_ids: Iterable[int]) -> None:
+        """Record that running jobs are alive."""
+        await self.filter(id__in=list(job_ids), status=JobStatus.RUNNING.value).aupdate(heartbeat=datetime.now(UTC))
+
+    async def requeue_stale(self: Self, before: datetime) -> int:
+        """Queue running jobs again whose worker stopped sending heartbeats, e.g. after a restart."""
+        requeued = await self.filter(status=JobStatus.RUNNING.value, heartbeat__lt=before).aupdate(
+            status=JobStatus.QUEUED.value,
+        )
+        return int(requeued)
+
+    async def finish(self: Self, job: "Job", status: JobStatus, error: str = "") -> None:
+        """Move a running job to a final status, dropping its arguments and checkpoint."""
+        job.status = status.value
+        await self.filter(id=job.id, status=JobStatus.RUNNING.value).aupdate(
+            status=status.value,
+            error=error,
+            payload=job_report_payload(job.payload),
+            progress={},
+        )
+
+    async def retry(self: Self, job: "Job", error: str, run_after: datetime) -> None:
+        """Queue a failed running job again, to be picked up after run_after."""
+        job.status = JobStatus.QUEUED.value
+        await self.filter(id=job.id, status=JobStatus.RUNNING.value).aupdate(
+            status=JobStatus.QUEUED.value,
+            error=error,
+            run_after=run_after,
         )
+
+    async def cancel(self: Self, job_id: int, user: User | None = None) -> "Job | None":
+        """Cancel a queued or running job, only among jobs of user if given, dropping its arguments and checkpoint.
+
+        Returns
+        -------
+            Job | None: The cancelled job with the status it had before, None if there was nothing to cancel.
+        """
+        data = self.filter(id=job_id, status__in=[JobStatus.QUEUED.value, JobStatus.RUNNING.value])
+        if user is not None:
+            data = data.filter(user=user)
+        job = await data.select_related("user").afirst()
+        if job is None:
+            return None
+        cancelled = await self.filter(id=job.id, status=job.status).aupdate(
+            status=JobStatus.CANCELLED.value,
+            payload=job_report_payload(job.payload),
+            progress={},
+        )
+        if not cancelled:
+            return None
+        return job  # type: ignore[no-any-return]
+
+    async def purge_finished(self: Self, before: datetime) -> int:
+        """Delete jobs that ended and were queued before a date.
+
+        Returns
+        -------
+            int: Number of deleted jobs.
+        """
+        deleted, _ = await self.filter(status__in=JOB_FINAL_STATUSES, created_on__lt=before).adelete()
+        return int(deleted)
+
+    async def active(self: Self, user: User | None = None) -> list["Job"]:
+        """Return queued and running jobs, only of user if given."""
+        data = self.filter(status__in=[JobStatus.QUEUED.value, JobStatus.RUNNING.value]).select_related("user")
+        if user is not None:
+            data = data.filter(user=user)
+        return await sync_to_async(list)(data.order_by("id"))  # type: ignore
+
+    def status_print(self: Self, job: "Job") -> str:
+        """Print job as a line of the job list.
+
+        Returns
+        -------
+            str: String repr of job.
+        """
+        return (
+            f"`{job.id}` **{job.kind}** of `{job.user.telegram_id}` is {job.status} "
+            f"(attempt {job.attempts}, queued on {job.created_on.strftime('%b %d, %Y %I:%M:%S %p')})"
+        )
+
+
+class Job(models.Model):
+    """Long-running work done by the background workers, kept in the database so it survives restarts."""
+
+    # Job ID, auto-generated primary key
+    id = models.AutoField(primary_key=True)
+
+    # Foreign Key to user
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+
+    # What the job does
+    kind = models.CharField(max_length=20, choices=[(kind.value, kind.name) for kind in JobKind])
+
+    # State of the job
+    status = models.CharField(
+        max_length=20,
+        choices=[(status.value, status.name) for status in JobStatus],
+        default=JobStatus.QUEUED.value,
+    )
+
+    # Arguments of the job, including where to report progress
+    payload = models.JSONField(default=dict)
+
+    # Checkpoint the job resumes from after a restart or retry
+    progress = models.JSONField(default=dict)
+
+    # Number of times a worker picked up the job
+    attempts = models.IntegerField(default=0)
+
+    # Error of the last failed attempt
+    error = models.TextField(blank=True)
+
+    # The job is not picked up before this time, used to back off retries
+    run_after = models.DateTimeField(default=timezone.now)
+
+    # Last time the worker running the job reported it alive
+    heartbeat = models.DateTimeField(null=True, blank=True)
+
+    # Date and time when the job was queued, auto-generated
+    created_on = models.DateTimeField(auto_now_add=True)
+
+    # Use custom manager for this model
+    objects = JobManager()
+
+    class Meta:
+        """Database table name."""
+
+        db_table = "job"
+        indexes = [models.Index(fields=["status", "run_after"])]  # noqa: RUF012
+
+    def __str__(self: Self) -> str:
+        """Return a string representation of the job object."""
+        return f"Job(id={self.id}, kind={self.kind}, status={self.status}, attempts={self.attempts})"
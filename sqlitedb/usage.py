@@ -0,0 +1,123 @@
+"""Write-behind tracking of secret usage."""
+
+import asyncio
+from datetime import UTC, datetime
+from typing import Any, Self
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from loguru import logger
+
+from sqlitedb.invalidation import InvalidationKind, invalidation_bus
+from sqlitedb.models import Secret, SecretView
+from telegram.cache import LRUCache
+
+# Seconds between two writes of buffered usage to the database
+USAGE_FLUSH_INTERVAL = 5
+# Number of secrets updated by a single UPDATE statement
+USAGE_FLUSH_BATCH = 500
+# Number of recently used secrets shown by /get without arguments
+RECENT_SECRETS_SIZE = 5
+# Number of users whose recently used secrets are kept in memory
+RECENT_USERS_SIZE = 4096
+
+
+class UsageTracker(object):
+    """Counts OTPs generated per secret without writing to the database on every request.
+
+    Usage is recorded in memory and flushed to ``use_count`` and ``last_used`` in a few batched ``UPDATE`` statements.
+    The most recently used secrets of each user are kept in memory as well, so they can be shown without a query.
+    """
+
+    def __init__(self: Self, recent_size: int = RECENT_SECRETS_SIZE, users: int = RECENT_USERS_SIZE) -> None:
+        """Create a new tracker.
+
+        Args:
+            recent_size (int): Number of recently used secrets remembered per user.
+            users (int): Number of users whose recently used secrets are kept in memory.
+        """
+        self.recent_size = recent_size
+        self._recent: LRUCache[int, list[SecretView]] = LRUCache(maxsize=users)
+        # Secret id to [uses since last flush, last use]
+        self._pending: dict[int, list[Any]] = {}
+
+    def record(self: Self, telegram_id: int, secrets: list[SecretView]) -> None:
+        """Record that OTPs of secrets were generated for a user."""
+        now = datetime.now(UTC)
+        for secret in secrets:
+            usage = self._pending.setdefault(secret.id, [0, now])
+            usage[0] += 1
+            usage[1] = now
+        if (recent := self._recent.get(telegram_id)) is not None:
+            ids = {secret.id for secret in secrets}
+            recent = [*secrets, *(secret for secret in recent if secret.id not in ids)][: self.recent_size]
+            self._recent.set(telegram_id, recent)
+
+    async def recent_secrets(self: Self, telegram_id: int) -> list[SecretView]:
+        """Return the most recently used secrets of a user, most recent first.
+
+        Served from memory. The first call for a user flushes buffered usage and reads the list once from the database.
+        """
+        if (recent := self._recent.get(telegram_id)) is not None:
+            return recent
+        await sync_to_async(self.flush)()
+        data = (
+            Secret.objects.for_telegram_id(telegram_id)
+            .filter(last_used__isnull=False)
+            .order_by("-last_used", "-use_count")
+            .values_list(*SecretView.__slots__)[: self.recent_size]
+        )
+        recent = SecretView.from_rows(await sync_to_async(list)(data))  # type: ignore[call-arg]
+        self._recent.set(telegram_id, recent)
+        return recent
+
+    def forget(self: Self, telegram_id: int) -> None:
+        """Drop the in-memory recent secrets of a user, e.g. after some of them were deleted."""
+        self._recent.invalidate(telegram_id)
+
+    def flush(self: Self) -> int:
+        """Write buffered usage to the database.
+
+        Returns
+        -------
+            int: Number of secrets updated.
+        """
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        ids = list(pending)
+        try:
+            with transaction.atomic():
+                for start in range(0, len(ids), USAGE_FLUSH_BATCH):
+                    batch = ids[start : start + USAGE_FLUSH_BATCH]
+                    Secret.objects.filter(id__in=batch).update(
+                        use_count=F("use_count")
+                        + Case(
+                            *(When(id=secret_id, then=Value(pending[secret_id][0])) for secret_id in batch),
+                            output_field=IntegerField(),
+                        ),
+                        last_used=Case(*(When(id=secret_id, then=Value(pending[secret_id][1])) for secret_id in batch)),
+                    )
+        except Exception:
+            # Keep the usage for the next flush, merged with anything recorded meanwhile
+            for secret_id, (count, last_used) in pending.items():
+                usage = self._pending.setdefault(secret_id, [0, last_used])
+                usage[0] += count
+                usage[1] = max(usage[1], last_used)
+            raise
+        logger.debug(f"Flushed usage of {len(ids)} secrets")
+        return len(ids)
+
+    async def flush_periodically(self: Self, interval: int = USAGE_FLUSH_INTERVAL) -> None:
+        """Write buffered usage to the database every interval seconds."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await sync_to_async(self.flush)()
+            except Exception as e:  # noqa: BLE001
+                logger.error(f"Unable to flush secret usage {e}")
+
+
+usage_tracker = UsageTracker()
+invalidation_bus.subscribe(InvalidationKind.SECRETS, usage_tracker.forget)
@@ -18,6 +18,24 @@ class UserStatus(Enum):
     TEMP_BANNED = "temporarily banned"
 
 
+class JobKind(Enum):
+    """Kind of background job."""
+
+    ADDURIFILE = "addurifile"
+    EXPORT = "export"
+    EXPORTQR = "exportqr"
+
+
+class JobStatus(Enum):
+    """Job Status."""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
 class ErrorCodes(Enum):
     """List of error codes."""
 
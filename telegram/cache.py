@@ -0,0 +1,239 @@
+"""In-process caches."""
+
+import contextlib
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Hashable
+from pathlib import Path
+from typing import Any, Generic, Self, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class LRUCache(Generic[K, V]):
+    """Bounded least recently used cache with an optional time to live.
+
+    Entries past their time to live are treated as missing. Once the cache is full, the least recently used entry is
+    evicted to make room.
+    """
+
+    def __init__(self: Self, maxsize: int, ttl: float | None = None) -> None:
+        """Create a new cache.
+
+        Args:
+            maxsize (int): Maximum number of entries kept.
+            ttl (float | None): Seconds an entry stays valid, None to keep entries until evicted.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[K, tuple[float, V]] = OrderedDict()
+
+    def get(self: Self, key: K) -> V | None:
+        """Return the cached value for key, None on a miss."""
+        entry = self._data.get(key)
+        if entry is None or self._expired(entry):
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self: Self, key: K, value: V) -> None:
+        """Cache value under key, evicting the least recently used entry when full."""
+        self._data[key] = (time.monotonic(), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self: Self, key: K) -> None:
+        """Drop key from the cache."""
+        self._data.pop(key, None)
+
+    def clear(self: Self) -> None:
+        """Drop every entry."""
+        self._data.clear()
+
+    def __len__(self: Self) -> int:
+        """Return number of cached entries."""
+        return len(self._data)
+
+    def items(self: Self) -> list[tuple[K, V]]:
+        """Return live entries from most to least recently used, without touching recency or counters."""
+        return [(key, entry[1]) for key, entry in reversed(self._data.items()) if not self._expired(entry)]
+
+    def __contains__(self: Self, key: Any) -> bool:
+        """Return whether key is cached, without touching recency or counters."""
+        entry = self._data.get(key)
+        return entry is not None and not self._expired(entry)
+
+    def _expired(self: Self, entry: tuple[float, V]) -> bool:
+        """Return whether an entry outlived the time to live."""
+        return self.ttl is not None and time.monotonic() - entry[0] > self.ttl
+
+    def stats(self: Self) -> dict[str, Any]:
+        """Return size and hit/miss counters of the cache."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class VersionCounter(Generic[K]):
+    """Per key version numbers.
+
+    Derived caches put the current version in their keys, bumping the version makes all of them stale at once.
+    """
+
+    def __init__(self: Self) -> None:
+        self._versions: dict[K, int] = {}
+
+    def get(self: Self, key: K) -> int:
+        """Return current version of key."""
+        return self._versions.get(key, 0)
+
+    def bump(self: Self, key: K) -> int:
+        """Move key to a new version and return it."""
+        version = self._versions.get(key, 0) + 1
+        self._versions[key] = version
+        return version
+
+
+class DiskCache(object):
+    """Content addressed cache of bytes stored as files, capped in total size.
+
+    Files are named after the key and kept in a folder per group, e.g. per user, so a whole group can be dropped at
+    once. Once the cap is exceeded the least recently used files are removed. Recency survives restarts through the
+    file modification time, which is refreshed on every hit. Methods do disk I/O, call them from a thread when on the
+    event loop; they can be called from several threads at once.
+    """
+
+    def __init__(self: Self, directory: Path, max_bytes: int, suffix: str = "") -> None:
+        """Create a new cache. The directory is created and scanned on first use.
+
+        Args:
+            directory (Path): Folder holding the cached files.
+            max_bytes (int): Maximum total size of the cached files.
+            suffix (str): Extension of cached files.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self._sizes: OrderedDict[str, int] | None = None
+        self._total = 0
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def key(*parts: str) -> str:
+        """Return a content hash of parts to be used as key."""
+        return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+    def _index(self: Self) -> OrderedDict[str, int]:
+        """Return group/key to size mapping ordered from least to most recently used."""
+        if self._sizes is None:
+            # Cached files may hold sensitive data, keep them private
+            self.directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+            # Files outside of any group can't be dropped with their group
+            for path in self.directory.glob(f"*{self.suffix}"):
+                path.unlink()
+            files = sorted(
+                (path.stat().st_mtime, f"{path.parent.name}/{path.name.removesuffix(self.suffix)}", path.stat().st_size)
+                for path in self.directory.glob(f"*/*{self.suffix}")
+            )
+            self._sizes = OrderedDict((key, size) for _, key, size in files)
+            self._total = sum(self._sizes.values())
+        return self._sizes
+
+    def _path(self: Self, key: str) -> Path:
+        return Path(self.directory, f"{key}{self.suffix}")
+
+    def get(self: Self, group: str, key: str) -> bytes | None:
+        """Return cached bytes for key of group, None on a miss."""
+        with self._lock:
+            sizes = self._index()
+            key = f"{group}/{key}"
+            if key not in sizes:
+                self.misses += 1
+                return None
+            path = self._path(key)
+            try:
+                data = path.read_bytes()
+                os.utime(path)
+            except FileNotFoundError:
+                self._total -= sizes.pop(key)
+                self.misses += 1
+                return None
+            sizes.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def get_many(self: Self, group: str, keys: list[str]) -> list[bytes | None]:
+        """Return cached bytes for each of keys of group, None for misses."""
+        return [self.get(group, key) for key in keys]
+
+    def set(self: Self, group: str, key: str, data: bytes) -> None:
+        """Store data under key of group and evict least recently used files above the size cap."""
+        with self._lock:
+            sizes = self._index()
+            key = f"{group}/{key}"
+            self._path(key).parent.mkdir(mode=0o700, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=self.directory, delete=False) as temp_file:
+                temp_file.write(data)
+            Path(temp_file.name).replace(self._path(key))
+            self._total += len(data) - sizes.pop(key, 0)
+            sizes[key] = len(data)
+            while self._total > self.max_bytes and len(sizes) > 1:
+                old_key, old_size = sizes.popitem(last=False)
+                self._total -= old_size
+                with contextlib.suppress(FileNotFoundError):
+                    self._path(old_key).unlink()
+
+    def set_many(self: Self, group: str, items: dict[str, bytes]) -> None:
+        """Store data of each key in items under group."""
+        for key, data in items.items():
+            self.set(group, key, data)
+
+    def discard(self: Self, group: str, keys: list[str]) -> None:
+        """Remove files of keys of group."""
+        with self._lock:
+            sizes = self._index()
+            for key in keys:
+                group_key = f"{group}/{key}"
+                self._total -= sizes.pop(group_key, 0)
+                with contextlib.suppress(FileNotFoundError):
+                    self._path(group_key).unlink()
+
+    def discard_group(self: Self, group: str) -> None:
+        """Remove every file of group."""
+        with self._lock:
+            sizes = self._index()
+            for key in [key for key in sizes if key.startswith(f"{group}/")]:
+                self._total -= sizes.pop(key)
+            shutil.rmtree(Path(self.directory, group), ignore_errors=True)
+
+    def stats(self: Self) -> dict[str, Any]:
+        """Return size and hit/miss counters of the cache."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._sizes or {}),
+            "bytes": self._total,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,215 @@
+"""Draining of the update backlog Telegram delivers after downtime."""
+
+import asyncio
+import contextlib
+import re
+import time
+from datetime import UTC, datetime
+from typing import TYPE_CHECKING, Any, Self
+
+from loguru import logger
+from telethon import TelegramClient, functions, types, utils
+
+from telegram.cache import LRUCache
+from telegram.dispatcher import DISPATCH_BACKLOG, update_key
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable
+
+# Seconds old a message must be to count as part of a backlog
+CATCHUP_STALE_AFTER = 30
+# Seconds without backlog updates after which the buffered backlog is handled
+CATCHUP_IDLE = 1.0
+# Number of updates remembered to recognise updates delivered twice
+CATCHUP_SEEN_SIZE = 8192
+# Callbacks only the latest of which matters for the message they belong to
+SUPERSEDED_CALLBACKS = re.compile(rb"^(?:next|prev)_page:")
+
+
+def update_id(update: Any) -> tuple[Any, ...] | None:
+    """Return what identifies an update across deliveries, None for updates without identity."""
+    if isinstance(update, types.UpdateBotCallbackQuery):
+        return ("callback", update.query_id)
+    message = getattr(update, "message", None)
+    if isinstance(message, types.Message):
+        # Edits of a message are updates of their own, every edit of it too
+        return (type(update).__name__, utils.get_peer_id(message.peer_id), message.id, message.edit_date)
+    return None
+
+
+def message_age(update: Any) -> float | None:
+    """Return seconds since the message of an update was sent, None for updates without a message."""
+    date = getattr(getattr(update, "message", None), "date", None)
+    return None if date is None else (datetime.now(UTC) - date).total_seconds()
+
+
+def command_text(update: Any) -> str | None:
+    """Return the text of a message update without media, None for other updates."""
+    message = getattr(update, "message", None)
+    if isinstance(message, types.Message) and not message.media:
+        text: str | None = message.message
+        return text
+    return None
+
+
+class CatchUpFilter(object):
+    """Drops duplicate updates and shrinks backlogs before they are dispatched.
+
+    Updates delivered twice, e.g. by a difference overlapping pushed updates, are recognised by their id and
+    dropped. Once a stale message arrives, updates are buffered until a fresh message arrives or no update arrived
+    for ``CATCHUP_IDLE`` seconds. The buffered backlog is then shrunk: repeated identical commands of a user only
+    run once, and page callbacks superseded by a later one on the same message are answered and dropped.
+    """
+
+    def __init__(self: Self) -> None:
+        self.duplicates = 0
+        self.coalesced = 0
+        self.superseded = 0
+        self.drained = 0
+        self.configure()
+        self._seen: LRUCache[tuple[Any, ...], bool] = LRUCache(maxsize=CATCHUP_SEEN_SIZE)
+        self._buffer: list[Any] = []
+        # Set whenever an update is buffered, so waiting for the backlog to end restarts
+        self._buffered = asyncio.Event()
+        self._drain_task: asyncio.Task[None] | None = None
+        self._lock = asyncio.Lock()
+        self._dispatch: Callable[[Any], Awaitable[None]] | None = None
+        self._client: TelegramClient | None = None
+
+    def configure(
+        self: Self,
+        stale_after: float = CATCHUP_STALE_AFTER,
+        idle: float = CATCHUP_IDLE,
+        backlog: int = DISPATCH_BACKLOG,
+    ) -> None:
+        """Set limits of the filter. Call it before ``install``.
+
+        Args:
+            stale_after (float): Seconds old a message must be to count as part of a backlog.
+            idle (float): Seconds without backlog updates after which the backlog is handled.
+            backlog (int): Number of buffered updates after which the backlog is handled right away.
+        """
+        self.stale_after = stale_after
+        self.idle = idle
+        self.backlog = backlog
+
+    def install(self: Self, client: TelegramClient) -> None:
+        """Filter updates of client before they reach the dispatcher or the worker processes."""
+        self._client = client
+        # Telethon has no public hook in front of its update dispatch
+        self._dispatch = client._dispatch_update  # noqa: SLF001
+        client._dispatch_update = self.submit  # noqa: SLF001
+
+    async def submit(self: Self, update: Any) -> None:
+        """Drop a duplicate update, buffer a backlog update or hand a live update over."""
+        if (key := update_id(update)) is not None:
+            if key in self._seen:
+                self.duplicates += 1
+                return
+            self._seen.set(key, True)  # noqa: FBT003
+        age = message_age(update)
+        stale = age is not None and age > self.stale_after
+        if not stale and not self._buffer:
+            async with self._lock:
+                await self._dispatch(update)  # type: ignore[misc]
+            return
+        self._buffer.append(update)
+        self._buffered.set()
+        # A fresh message means the backlog is over, callbacks carry no date and wait for the backlog to end
+        if (age is not None and not stale) or len(self._buffer) >= self.backlog:
+            await self._drain()
+        elif self._drain_task is None:
+            self._drain_task = asyncio.create_task(self._drain_when_idle())
+
+    async def _drain_when_idle(self: Self) -> None:
+        """Handle the backlog once no update was buffered for ``idle`` seconds."""
+        try:
+            while self._buffered.is_set():
+                self._buffered.clear()
+                with contextlib.suppress(TimeoutError):
+                    async with asyncio.timeout(self.idle):
+                        await self._buffered.wait()
+            await self._drain()
+        finally:
+            self._drain_task = None
+
+    async def _drain(self: Self) -> None:
+        """Shrink the buffered backlog and hand it over in order."""
+        updates, self._buffer = self._buffer, []
+        if not updates:
+            return
+        started = time.perf_counter()
+        kept = self.coalesce(updates)
+        await self._answer_dropped(updates, kept)
+        async with self._lock:
+            for update in kept:
+                try:
+                    await self._dispatch(update)  # type: ignore[misc]
+                except Exception as e:  # noqa: BLE001
+                    logger.error(f"Unable to dispatch update {e}")
+        self.drained += len(updates)
+        logger.info(
+            f"Drained backlog of {len(updates)} updates, handed over {len(kept)} "
+            f"in {round((time.perf_counter() - started) * 1000, 2)}ms",
+        )
+
+    async def _answer_dropped(self: Self, updates: list[Any], kept: list[Any]) -> None:
+        """Answer dropped callbacks, their buttons would keep loading otherwise."""
+        kept_ids = {id(update) for update in kept}
+        dropped = [
+            update
+            for update in updates
+            if isinstance(update, types.UpdateBotCallbackQuery) and id(update) not in kept_ids
+        ]
+        answers = [
+            self._client(functions.messages.SetBotCallbackAnswerRequest(update.query_id, cache_time=0))  # type: ignore[misc]
+            for update in dropped
+        ]
+        for result in await asyncio.gather(*answers, return_exceptions=True):
+            if isinstance(result, Exception):
+                logger.debug(f"Unable to answer superseded callback {result}")
+
+    def coalesce(self: Self, updates: list[Any]) -> list[Any]:
+        """Return updates without repeated commands and superseded page callbacks, keeping the latest of each."""
+        kept: list[Any] = []
+        # User to index in kept and text of their latest message
+        last_message: dict[int, tuple[int, str | None]] = {}
+        # User and message to index in kept of their latest page callback
+        last_page: dict[tuple[int, int], int] = {}
+        for update in updates:
+            user = update_key(update)
+            if isinstance(update, types.UpdateBotCallbackQuery):
+                if SUPERSEDED_CALLBACKS.match(update.data or b""):
+                    page_key = (user, update.msg_id)
+                    if (index := last_page.get(page_key)) is not None:
+                        kept[index] = None
+                        self.superseded += 1
+                    last_page[page_key] = len(kept)
+            elif isinstance(getattr(update, "message", None), types.Message):
+                text = command_text(update)
+                previous = last_message.get(user)
+                if text is not None and previous is not None and previous[1] == text:
+                    kept[previous[0]] = None
+                    self.coalesced += 1
+                last_message[user] = (len(kept), text)
+            kept.append(update)
+        return [update for update in kept if update is not None]
+
+    async def close(self: Self) -> None:
+        """Stop waiting for the backlog to end and drop it."""
+        if self._drain_task is not None:
+            self._drain_task.cancel()
+        self._buffer = []
+
+    def stats(self: Self) -> dict[str, int]:
+        """Return catch-up counters."""
+        return {
+            "drained": self.drained,
+            "duplicates": self.duplicates,
+            "coalesced": self.coalesced,
+            "superseded": self.superseded,
+            "buffered": len(self._buffer),
+        }
+
+
+catch_up = CatchUpFilter()
@@ -1,15 +1,19 @@
 """Handle addurifile command."""
 
-from pathlib import Path
-
 # Import necessary libraries and modules
 from telethon import TelegramClient, events
 
+from sqlitedb.utils import JobKind
+from telegram.dispatcher import LONG_HANDLER_TIMEOUT, Priority, concurrently, handler_priority, handler_timeout
 from telegram.exceptions import FileProcessFailError
+from telegram.jobs import JobContext, job_runner, register_job
+from telegram.ratelimit import RateClass, handler_rate_class
 from telegram.strings import file_process_failed, no_input, processing_request
 
 # Import some helper functions
 from telegram.utils import (
+    IMPORT_CHUNK_SIZE,
+    SpooledFile,
     SupportedCommands,
     bulk_add_secret_data,
     extract_secret_from_uri,
@@ -32,9 +36,14 @@ def addurifile_usage() -> str:
 
 # Register the function to handle the /addurifile command
 @events.register(events.NewMessage(pattern=f"^{SupportedCommands.ADDURIFILE.value}$"))  # type: ignore[untyped-decorator]
+@handler_timeout(LONG_HANDLER_TIMEOUT)
+@handler_priority(Priority.BULK)
+@handler_rate_class(RateClass.BULK)
 async def handle_addurifile_message(event: events.NewMessage.Event) -> None:
     """Handle /addurifile command.
 
+    The file is downloaded into memory and read right away, importing its URIs is queued as a background job.
+
     Args:
         event (events.NewMessage.Event): A new message event.
 
@@ -42,30 +51,65 @@ async def handle_addurifile_message(event: events.NewMessage.Event) -> None:
     -------
         None: This function doesn't return anything.
     """
-    message = None
+    downloaded: list[SpooledFile] = []
+
+    async def download() -> SpooledFile:
+        downloaded.append(await get_uri_file_from_message(event))
+        return downloaded[0]
+
     try:
-        uri_file = await get_uri_file_from_message(event)
-        message = await event.reply(processing_request)
-        uris = process_uri_file(uri_file)
-        parsed_secret, parse_failed = extract_secret_from_uri(uris)
-        user = await get_user(event)
-        import_status, failed_secrets = await bulk_add_secret_data(parsed_secret, user)
-        import_status["invalid"] = len(parse_failed["invalid"])
-        failed_secrets["invalid"] = parse_failed["invalid"]
-        was_failed = False
-        if len(parse_failed["invalid"]) > 0:
-            was_failed = True
-        else:
-            for fail_type, count in import_status.items():
-                if fail_type != "success" and count > 0:
-                    was_failed = True
-        await message.edit(f"Done processing with status `{import_status}`")
-        if was_failed:
-            output_file = import_failure_output_file(failed_secrets)
-            await event.reply(file=output_file)
-            Path(output_file).unlink()
+        uri_file, user = await concurrently(download(), get_user(event))
     except FileNotFoundError:
         await event.reply(no_input)
+        return
+    except BaseException:
+        # The file may have been downloaded before fetching the user failed
+        for file in downloaded:
+            file.close()
+        raise
+    try:
+        with uri_file:
+            uris = process_uri_file(uri_file)
     except FileProcessFailError as e:
-        if message:
-            await message.edit(f"Unable to process\n`{e}`.\n{file_process_failed}")
+        await event.reply(f"Unable to process\n`{e}`.\n{file_process_failed}")
+        return
+    # The URIs travel with the job, so a retry after a restart doesn't need the file again
+    await job_runner.submit(event, user, JobKind.ADDURIFILE, {"uris": uris})
+
+
+@register_job(JobKind.ADDURIFILE)
+async def run_addurifile_job(job: JobContext) -> None:
+    """Import the URIs of an uploaded file in chunks, checkpointing after each one so a retry resumes where it left.
+
+    Args:
+        job (JobContext): The running job.
+    """
+    parsed_secret, parse_failed = extract_secret_from_uri(job.payload["uris"])
+    state = job.state or {
+        "done": 0,
+        "status": {"invalid": 0, "duplicate": 0, "success": 0},
+        "failed": {"invalid": [], "duplicate": []},
+    }
+    import_status, failed_secrets = state["status"], state["failed"]
+    for start in range(state["done"], len(parsed_secret), IMPORT_CHUNK_SIZE):
+        chunk = parsed_secret[start : start + IMPORT_CHUNK_SIZE]
+        chunk_status, chunk_failed = await bulk_add_secret_data(chunk, job.user)
+        for status, count in chunk_status.items():
+            import_status[status] += count
+        for fail_type, failed in chunk_failed.items():
+            failed_secrets[fail_type].extend(failed)
+        state["done"] = start + len(chunk)
+        await job.progress(f"{processing_request} Imported {state['done']}/{len(parsed_secret)} URIs.", state)
+    import_status["invalid"] = len(parse_failed["invalid"])
+    failed_secrets["invalid"] = parse_failed["invalid"]
+    was_failed = False
+    if len(parse_failed["invalid"]) > 0:
+        was_failed = True
+    else:
+        for fail_type, count in import_status.items():
+            if fail_type != "success" and count > 0:
+                was_failed = True
+    await job.edit_status(f"Done processing with status `{import_status}`")
+    if was_failed:
+        with import_failure_output_file(failed_secrets) as output_file:
+            await job.reply(file=output_file)
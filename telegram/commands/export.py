@@ -1,19 +1,29 @@
 """Handle export command."""
 
-import contextlib
-from datetime import UTC, datetime
-from pathlib import Path
-
-import aiofiles
+from datetime import UTC, datetime, timedelta
+from typing import IO
 
 # Import necessary libraries and modules
 from telethon import TelegramClient, events
 
-from sqlitedb.models import Secret
-from telegram.strings import no_export, processing_request
+from sqlitedb.models import Secret, SecretTombstone, User
+from sqlitedb.utils import JobKind
+from telegram.dispatcher import concurrently, dispatcher
+from telegram.jobs import JobContext, job_runner, register_job
+from telegram.ratelimit import RateClass, handler_rate_class
+from telegram.strings import no_export, no_input, processing_request
 
 # Import some helper functions
-from telegram.utils import SupportedCommands, get_user
+from telegram.utils import (
+    EXPORT_CHUNK_SIZE,
+    TOMBSTONE_RETENTION_DAYS,
+    SpooledFile,
+    SupportedCommands,
+    UserState,
+    get_user,
+    parse_export_since,
+    reply_with_file,
+)
 
 
 def add_export_handlers(client: TelegramClient) -> None:
@@ -24,19 +34,24 @@ def add_export_handlers(client: TelegramClient) -> None:
 def export_usage() -> str:
     """Return the usage of add command."""
     return (
-        "You can do 2 types of exports.\n"
+        "You can do 3 types of exports.\n"
         "1. If /export command is sent without any input it will export all the uris.\n"
         "2. If /export command is sent with ID the URI will be exported "
         "for that URI. You can get ID from /list or /get "
-        "command."
+        "command.\n"
+        "3. If /export command is sent with `since:last` or `since:<timestamp>` only the URIs added since the last "
+        "export (or the given ISO timestamp) are exported, along with `# deleted` lines for removed secrets."
     )
 
 
 # Register the function to handle the /export command
-@events.register(events.NewMessage(pattern=f"^{SupportedCommands.EXPORT.value}\\s*(\\d*)$"))  # type: ignore[untyped-decorator]
+@events.register(events.NewMessage(pattern=f"^{SupportedCommands.EXPORT.value}\\s*(\\d*|since:\\S+)$"))  # type: ignore[untyped-decorator]
+@handler_rate_class(RateClass.BULK)
 async def handle_export_message(event: events.NewMessage.Event) -> None:
     """Handle /export command.
 
+    The export itself is queued as a background job.
+
     Args:
         event (events.NewMessage.Event): A new message event.
 
@@ -44,19 +59,82 @@ async def handle_export_message(event: events.NewMessage.Event) -> None:
     -------
         None: This function doesn't return anything.
     """
-    message = await event.reply(processing_request)
     data = event.pattern_match.group(1).strip()
-    secret_filter = {"id__in": [int(data)]} if data else {}
-    user = await get_user(event)
-    data, size = await Secret.objects.export_secrets(user=user, secret_filter=secret_filter)
-    if size == 0:
-        await event.reply(message=no_export)
-    else:
-        uris = [Secret.objects.export_print(secret) for secret in data]
-        output_file = f"export_{datetime.now(UTC).strftime('%Y%m%d_%H%M%S')}.txt"
-        async with aiofiles.open(output_file, mode="w") as file:
-            await file.write("\n".join(uris))
-        await message.delete()
-        await event.reply(message=f"Exported {size} URIs.", file=output_file)
-        with contextlib.suppress(FileNotFoundError):
-            Path(output_file).unlink()
+    user, status = await concurrently(get_user(event), event.reply(processing_request))
+    try:
+        since = parse_export_since(data.removeprefix("since:"), user.settings) if data.startswith("since:") else None
+    except ValueError:
+        await status.edit(no_input)
+        return
+    payload = {"id": int(data) if data.isdigit() else None, "since": since.isoformat() if since else None}
+    await job_runner.submit(event, user, JobKind.EXPORT, payload, status=status)
+
+
+@register_job(JobKind.EXPORT)
+async def run_export_job(job: JobContext) -> None:
+    """Stream the secrets of the job's user into a file and send it.
+
+    Args:
+        job (JobContext): The running job.
+    """
+    user = job.user
+    since = datetime.fromisoformat(job.payload["since"]) if job.payload["since"] else None
+    secret_filter = {"id__in": [job.payload["id"]]} if job.payload["id"] else {}
+    # Taken before reading so secrets modified while exporting are picked by the next delta export
+    export_started = datetime.now(UTC)
+    size = 0
+    with SpooledFile(f"export_{job.id}_{export_started.strftime('%Y%m%d_%H%M%S')}.txt") as file:
+        async for chunk in Secret.objects.stream_secrets_by_telegram_id(
+            telegram_id=user.telegram_id,
+            secret_filter=secret_filter,
+            chunk_size=EXPORT_CHUNK_SIZE,
+            since=since,
+        ):
+            uris = "\n".join(Secret.objects.export_print(secret) for secret in chunk)
+            file.write((f"\n{uris}" if size else uris).encode())
+            size += len(chunk)
+            await job.progress(f"{processing_request} Exported {size} URIs so far.")
+            await dispatcher.yield_to_interactive()
+        deleted = await export_tombstones(file, user, since, separator=bool(size))
+        if size == 0 and deleted == 0:
+            await job.reply(message=no_export)
+        else:
+            await job.delete_status()
+            summary = f"Exported {size} URIs."
+            if since:
+                summary = f"Exported {size} URIs and {deleted} deletions since {since.isoformat()}."
+            await reply_with_file(job, message=summary, file=file)
+    # Only once delivered, a failed send leaves the next delta export starting where this one did
+    if not secret_filter:
+        await save_export_watermark(user, export_started)
+
+
+async def export_tombstones(file: IO[bytes], user: User, since: datetime | None, *, separator: bool) -> int:
+    """Write deleted secret lines of a delta export.
+
+    Args:
+        file (IO[bytes]): Export file being written.
+        user (User): User whose deletions are exported.
+        since (datetime | None): Lower bound of the delta export. Nothing is written for a full export.
+        separator (bool): Whether the file already has content and needs a line break first.
+
+    Returns
+    -------
+        int: Number of deletions written.
+    """
+    if not since:
+        return 0
+    tombstones = await SecretTombstone.objects.deleted_since(user=user, since=since)
+    if tombstones:
+        lines = "\n".join(SecretTombstone.objects.export_print(tombstone) for tombstone in tombstones)
+        file.write((f"\n{lines}" if separator else lines).encode())
+    return len(tombstones)
+
+
+async def save_export_watermark(user: User, export_started: datetime) -> None:
+    """Remember when the last full or delta export started and drop tombstones no longer needed."""
+    await User.objects.update_settings(user, {**user.settings, UserState.LAST_EXPORT.value: export_started.isoformat()})
+    await SecretTombstone.objects.prune(
+        user=user,
+        before=export_started - timedelta(days=TOMBSTONE_RETENTION_DAYS),
+    )
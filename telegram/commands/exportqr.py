@@ -1,17 +1,19 @@
 """Handle exportqr command."""
 
-import contextlib
-from pathlib import Path
 from urllib.parse import quote_plus
 
 # Import necessary libraries and modules
 from telethon import TelegramClient, events
 
 from sqlitedb.models import Secret
+from sqlitedb.utils import JobKind
+from telegram.dispatcher import concurrently
+from telegram.jobs import JobContext, job_runner, register_job
+from telegram.ratelimit import RateClass, handler_rate_class
 from telegram.strings import no_export, processing_request
 
 # Import some helper functions
-from telegram.utils import SupportedCommands, all_files, create_qr, get_user
+from telegram.utils import SupportedCommands, create_qr, get_user, reply_with_file
 
 
 def add_exportqr_handlers(client: TelegramClient) -> None:
@@ -31,9 +33,12 @@ def exportqr_usage() -> str:
 
 # Register the function to handle the /exportqr command
 @events.register(events.NewMessage(pattern=f"^{SupportedCommands.EXPORTQR.value}\\s*(\\d*)$"))  # type: ignore[untyped-decorator]
+@handler_rate_class(RateClass.BULK)
 async def handle_exportqr_message(event: events.NewMessage.Event) -> None:
     """Handle /exportqr command.
 
+    Rendering the QR codes is queued as a background job.
+
     Args:
         event (events.NewMessage.Event): A new message event.
 
@@ -41,27 +46,29 @@ async def handle_exportqr_message(event: events.NewMessage.Event) -> None:
     -------
         None: This function doesn't return anything.
     """
-    message = await event.reply(processing_request)
     data = event.pattern_match.group(1).strip()
-    secret_filter = {"id__in": [int(data)]} if data else {}
-    user = await get_user(event)
+    user, status = await concurrently(get_user(event), event.reply(processing_request))
+    await job_runner.submit(event, user, JobKind.EXPORTQR, {"id": int(data) if data else None}, status=status)
+
+
+@register_job(JobKind.EXPORTQR)
+async def run_exportqr_job(job: JobContext) -> None:
+    """Render QR codes of the secrets of the job's user and send them.
+
+    Args:
+        job (JobContext): The running job.
+    """
+    user = job.user
+    secret_filter = {"id__in": [job.payload["id"]]} if job.payload["id"] else {}
     data, size = await Secret.objects.export_secrets(user=user, secret_filter=secret_filter)
     if size == 0:
-        await event.reply(message=no_export)
+        await job.reply(message=no_export)
     else:
         qr_meta = {}
         for secret in data:
             uri = Secret.objects.export_print(secret)
             qr_meta[uri] = secret
         zip_file_name = f"{user.id}_{quote_plus(user.name)}"
-        os_path = create_qr(qr_meta, zip_file_name)
-        await message.delete()
-        await event.reply(
-            message=f"Exported {len(qr_meta)} qr images.",
-            file=str(os_path),
-        )
-        if Path(os_path).is_dir():
-            all_files(os_path)
-        else:
-            with contextlib.suppress(FileNotFoundError):
-                Path(os_path).unlink()
+        with await create_qr(qr_meta, zip_file_name, user.telegram_id) as zip_file:
+            await job.delete_status()
+            await reply_with_file(job, message=f"Exported {len(qr_meta)} qr images.", file=zip_file)
@@ -3,6 +3,8 @@
 # Import necessary libraries and modules
 from telethon import TelegramClient, events
 
+from telegram.ratelimit import RateClass, handler_rate_class
+
 # Import some helper functions
 from telegram.strings import command_not_found
 from telegram.utils import get_regex
@@ -15,6 +17,7 @@ def add_general_handlers(client: TelegramClient) -> None:
 
 # Register the function to handle any new message that matches the specified pattern
 @events.register(events.NewMessage(pattern=get_regex()))  # type: ignore[untyped-decorator]
+@handler_rate_class(RateClass.UNKNOWN)
 async def handle_any_message(event: events.NewMessage.Event) -> None:
     """Handle any new message.
 
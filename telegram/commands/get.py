@@ -3,11 +3,16 @@
 # Import necessary libraries and modules
 from telethon import TelegramClient, events
 
-from sqlitedb.models import Secret
-from telegram.strings import no_input, no_result
+from sqlitedb.models import Secret, reduced_print_template
+from sqlitedb.usage import usage_tracker
+from telegram.strings import no_recent_secrets, no_result
 
 # Import some helper functions
-from telegram.utils import SupportedCommands, get_user
+from telegram.utils import MarkdownTemplate, SupportedCommands, get_telegram_id, join_parsed
+
+found_template = MarkdownTemplate("Here are the TOTP for **{size}** found secrets.")
+recent_template = MarkdownTemplate("Here are the TOTP for your **{size}** recently used secrets.")
+secret_template = MarkdownTemplate(f"➡️ {reduced_print_template}")
 
 
 def add_get_handlers(client: TelegramClient) -> None:
@@ -20,7 +25,8 @@ def get_usage() -> str:
     return (
         "/get command expect filter as input to the command.\n"
         "If any URI(s) contain issuer or account name which matches with filter. "
-        "It will be returned along with ID and OTP."
+        "It will be returned along with ID and OTP.\n"
+        "Without a filter, OTP of your recently used secrets are returned."
     )
 
 
@@ -36,19 +42,25 @@ async def handle_get_message(event: events.NewMessage.Event) -> None:
     -------
         None: This function doesn't return anything.
     """
-    try:
-        data = event.pattern_match.group(1).strip()
-        if not data:
-            raise ValueError
-        user = await get_user(event)
-
-        data, size = await Secret.objects.get_secret(user=user, secret_filter=data)
-        if size > 0:
-            response = f"Here are the TOTP for **{size}** found secrets.\n\n"
-            for secret in data:
-                response += f"➡️ {Secret.objects.reduced_print(secret)}\n"
-            await event.reply(response)
-        else:
-            await event.reply(no_result)
-    except ValueError:
-        await event.reply(no_input)
+    telegram_id = get_telegram_id(event)
+    secret_filter = event.pattern_match.group(1).strip()
+    if secret_filter:
+        data, size = await Secret.objects.get_secret_by_telegram_id(
+            telegram_id=telegram_id,
+            secret_filter=secret_filter,
+        )
+        header = found_template.format(size=size)
+    else:
+        data = await usage_tracker.recent_secrets(telegram_id)
+        size = len(data)
+        header = recent_template.format(size=size)
+    if size > 0:
+        usage_tracker.record(telegram_id, data)
+        parts = [header, ("\n\n", [])]
+        for secret in data:
+            parts.append(secret_template.format(**Secret.objects.reduced_print_values(secret)))
+            parts.append(("\n", []))
+        response, entities = join_parsed(*parts)
+        await event.reply(response, formatting_entities=entities)
+    else:
+        await event.reply(no_result if secret_filter else no_recent_secrets)
@@ -27,6 +27,7 @@ Here's a list of supported commands:
 12. `/start`: Start using the bot (usage: `/start`).
 13. `/temp`: Get otp without saving TOTP (usage: `/temp <arguments>`).
 14. `/total`: Get the total count of secrets(usage: `/total`).
+15. `/jobs`: List or cancel running imports and exports (usage: `/jobs [cancel <ID>]`).
 
 For more information on each command, type `/help <command>`.
 
@@ -0,0 +1,52 @@
+"""Handle jobs command."""
+
+# Import necessary libraries and modules
+from telethon import TelegramClient, events
+
+from sqlitedb.models import Job
+from telegram.jobs import job_runner
+from telegram.strings import job_cancelled, no_jobs, no_result
+
+# Import some helper functions
+from telegram.utils import SupportedCommands, get_user, is_admin
+
+
+def add_jobs_handlers(client: TelegramClient) -> None:
+    """Add /jobs command Event Handler."""
+    client.add_event_handler(handle_jobs_message)
+
+
+def jobs_usage() -> str:
+    """Return the usage of jobs command."""
+    return (
+        "Imports and exports run in the background.\n"
+        "1. If /jobs command is sent without any input it will list your queued and running requests.\n"
+        "2. If /jobs command is sent with `cancel <ID>` that request is cancelled.\n"
+        "Admins see and cancel requests of every user."
+    )
+
+
+# Register the function to handle the /jobs command
+@events.register(events.NewMessage(pattern=f"^{SupportedCommands.JOBS.value}(?:\\s+cancel\\s+(\\d+))?$"))  # type: ignore[untyped-decorator]
+async def handle_jobs_message(event: events.NewMessage.Event) -> None:
+    """Handle /jobs command.
+
+    Args:
+        event (events.NewMessage.Event): A new message event.
+
+    Returns
+    -------
+        None: This function doesn't return anything.
+    """
+    user = await get_user(event)
+    # Admins act on every user's jobs
+    owner = None if is_admin(user.telegram_id) else user
+    if job_id := event.pattern_match.group(1):
+        cancelled = await job_runner.cancel(int(job_id), owner)
+        await event.reply(job_cancelled if cancelled else no_result)
+        return
+    jobs = await Job.objects.active(owner)
+    if not jobs:
+        await event.reply(no_jobs)
+        return
+    await event.reply("\n".join(Job.objects.status_print(job) for job in jobs))
@@ -1,11 +1,15 @@
 """List User Conversation."""
 
+import asyncio
+
 from asgiref.sync import sync_to_async
 from loguru import logger
 from telethon import Button, TelegramClient, events
 
-from sqlitedb.models import Secret, User
-from telegram.utils import PAGE_SIZE, SupportedCommands, get_user
+from sqlitedb.models import Secret, User, secret_versions
+from telegram.cache import LRUCache
+from telegram.dispatcher import concurrently
+from telegram.utils import PAGE_CACHE_SIZE, PAGE_CACHE_TTL, PAGE_SIZE, SupportedCommands, UserSettings, get_user
 
 
 def add_list_handlers(client: TelegramClient) -> None:
@@ -23,6 +27,15 @@ def list_usage() -> str:
     )
 
 
+# Rendered pages keyed by telegram id, secrets version, page number and page size
+page_cache: LRUCache[tuple[int, int, int, int], tuple[str, list[list[Button]] | None, bool]] = LRUCache(
+    maxsize=PAGE_CACHE_SIZE,
+    ttl=PAGE_CACHE_TTL,
+)
+# Keep references to running prefetches so they are not garbage collected
+prefetch_tasks: set[asyncio.Task[None]] = set()
+
+
 @events.register(events.CallbackQuery(pattern=r"(next|prev)_page:(\d+)"))  # type: ignore[untyped-decorator]
 async def navigate_pages(event: events.callbackquery.CallbackQuery.Event) -> None:
     """Event handler to navigate between pages of records.
@@ -33,12 +46,48 @@ async def navigate_pages(event: events.callbackquery.CallbackQuery.Event) -> Non
     _, page = event.data.decode("utf-8").split(":")
     page = int(page)
 
-    await event.answer()
-    user = await get_user(event)
-    response, buttons = await send_paginated_records(user, page)
+    _, user = await concurrently(event.answer(), get_user(event))
+    response, buttons = await get_paginated_records(user, page)
     await event.edit(response, buttons=buttons, parse_mode="markdown")
 
 
+async def get_paginated_records(user: User, page: int) -> tuple[str, list[list[Button]] | None]:
+    """Return the rendered page from cache, rendering it on a miss, and prefetch the next page in background.
+
+    Args:
+        user (User): The user whose secrets are listed.
+        page (int): The current page number.
+
+    Returns
+    -------
+        Tuple[str, List]: A tuple containing the response message and the list of buttons.
+    """
+    response, buttons, has_next = await get_rendered_page(user, page)
+    if has_next:
+        task = asyncio.create_task(prefetch_page(user, page + 1))
+        prefetch_tasks.add(task)
+        task.add_done_callback(prefetch_tasks.discard)
+    return response, buttons
+
+
+async def get_rendered_page(user: User, page: int) -> tuple[str, list[list[Button]] | None, bool]:
+    """Return a rendered page and whether a next page exists, using the page cache."""
+    page_size = int(user.settings.get(UserSettings.PAGE_SIZE.value, PAGE_SIZE))
+    key = (user.telegram_id, secret_versions.get(user.telegram_id), page, page_size)
+    if (rendered := page_cache.get(key)) is None:
+        rendered = await render_paginated_records(user, page)
+        page_cache.set(key, rendered)
+    return rendered
+
+
+async def prefetch_page(user: User, page: int) -> None:
+    """Render a page ahead of time so the next button press is served from cache."""
+    try:
+        await get_rendered_page(user, page)
+    except Exception as e:  # noqa: BLE001
+        logger.debug(f"Unable to prefetch page {page} {e}")
+
+
 async def send_paginated_records(user: User, page: int) -> tuple[str, list[list[Button]] | None]:
     """Fetch and send paginated records for the given user.
 
@@ -50,6 +99,21 @@ async def send_paginated_records(user: User, page: int) -> tuple[str, list[list[
     -------
         Tuple[str, List]: A tuple containing the response message and the list of buttons.
     """
+    response, buttons, _ = await render_paginated_records(user, page)
+    return response, buttons
+
+
+async def render_paginated_records(user: User, page: int) -> tuple[str, list[list[Button]] | None, bool]:
+    """Render a page of records for the given user.
+
+    Args:
+        user (User): The Telegram ID of the user.
+        page (int): The current page number.
+
+    Returns
+    -------
+        Tuple[str, List, bool]: The response message, the list of buttons and whether a next page exists.
+    """
     user_settings = user.settings
 
     page_size = user_settings.get("page_size", PAGE_SIZE)
@@ -81,7 +145,7 @@ async def send_paginated_records(user: User, page: int) -> tuple[str, list[list[
     if not buttons[0]:
         buttons = None  # type: ignore[assignment]
 
-    return response, buttons
+    return response, buttons, bool(result["has_next"])
 
 
 # Register the function to handle the /list command
@@ -95,5 +159,5 @@ async def handle_list_command(event: events.NewMessage.Event) -> None:
     logger.debug("Received request to list all secrets")
     page = 1
     user = await get_user(event)
-    response, buttons = await send_paginated_records(user, page)
+    response, buttons = await get_paginated_records(user, page)
     await event.reply(response, buttons=buttons)
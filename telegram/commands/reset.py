@@ -6,10 +6,11 @@ from loguru import logger
 from telethon import Button, TelegramClient, events
 
 from sqlitedb.models import Secret
+from telegram.dispatcher import concurrently
 from telegram.strings import ignore
 
 # Import some helper functions
-from telegram.utils import SupportedCommands, get_user
+from telegram.utils import SupportedCommands, discard_qr_pngs, get_user
 
 reset_yes_data = b"reset_yes"
 reset_yes_description = "Yes!"
@@ -47,14 +48,17 @@ async def handle_reset_confirm_response(
     -------
         None: This function doesn't return anything.
     """
-    await event.answer()
     logger.debug("Received reset callback")
     if event.data == reset_yes_data:
-        user = await get_user(event)
+        _, user = await concurrently(event.answer(), get_user(event))
         size = await Secret.objects.clear_user_secrets(user=user)
+        # Cached QR codes encode the secrets themselves
+        await discard_qr_pngs(user.telegram_id)
         await event.edit(f"Deleted {size} secrets.")
     elif event.data == reset_no_data:
-        await event.edit(ignore)
+        await concurrently(event.answer(), event.edit(ignore))
+    else:
+        await event.answer()
 
 
 # Register the function to handle the /reset command
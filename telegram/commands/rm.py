@@ -7,7 +7,7 @@ from sqlitedb.models import Secret
 from telegram.strings import no_input
 
 # Import some helper functions
-from telegram.utils import SupportedCommands, get_user
+from telegram.utils import SupportedCommands, discard_qr_pngs, get_user
 
 
 def add_rm_handlers(client: TelegramClient) -> None:
@@ -43,7 +43,10 @@ async def handle_rm_message(event: events.NewMessage.Event) -> None:
             raise ValueError
         secret_id = int(data)
         user = await get_user(event)
+        data, _ = await Secret.objects.export_secrets(user=user, secret_filter={"id__in": [secret_id]})
         size = await Secret.objects.rm_user_secret(user=user, secret_id=secret_id)
+        # Cached QR codes encode the secret itself
+        await discard_qr_pngs(user.telegram_id, [Secret.objects.export_print(secret) for secret in data])
         await event.reply(f"Delete {size} secret.")
     except ValueError:
         await event.reply(no_input)
@@ -3,6 +3,7 @@
 from loguru import logger
 from telethon import Button, TelegramClient, events
 
+from telegram.dispatcher import concurrently
 from telegram.strings import invalid_setting, user_fetch_failed
 from telegram.user_settings import modify_page_size
 from telegram.utils import SupportedCommands, UserSettings, get_user
@@ -34,13 +35,11 @@ async def handle_settings_list_settings(
     Args:
         event (CallbackQuery.Event): The callback query event.
     """
-    await event.answer()
-
     response = "**Available settings**:\n\n"
     for setting in UserSettings:
         response += f"- `{setting.name}`: {setting.description}\n"
 
-    await event.edit(response, parse_mode="markdown")
+    await concurrently(event.answer(), event.edit(response, parse_mode="markdown"))
 
 
 @events.register(events.CallbackQuery(pattern="current_settings"))  # type: ignore[untyped-decorator]
@@ -52,13 +51,14 @@ async def handle_settings_current_settings(
     Args:
         event (CallbackQuery.Event): The callback query event.
     """
-    await event.answer()
-
     response = "**Current settings**:\n\n"
     try:
-        user = await get_user(event)
+        _, user = await concurrently(event.answer(), get_user(event))
         settings = user.settings
         for setting in settings:
+            if setting not in UserSettings._value2member_map_:
+                # Internal state like export watermark
+                continue
             setting_enum = UserSettings(setting)
             description = setting_enum.description
             response += f"- `{setting_enum} {settings[setting]}`: __{description}__\n"
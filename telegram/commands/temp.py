@@ -7,9 +7,11 @@ from telegram.exceptions import InvalidSecretError
 from telegram.strings import invalid_secret, no_input
 
 # Import some helper functions
-from telegram.utils import SupportedCommands
+from telegram.utils import MarkdownTemplate, SupportedCommands
 from totp.totp import OTP
 
+temp_template = MarkdownTemplate("`{otp}` is OTP. Valid for {time_left} sec till **{valid_till}**")
+
 
 def add_temp_handlers(client: TelegramClient) -> None:
     """Add /temp command Event Handler."""
@@ -41,12 +43,12 @@ async def handle_temp_message(event: events.NewMessage.Event) -> None:
         if not data:
             raise ValueError
         otp, valid_till, time_left = OTP.now(secret=data)
-        response = ("`{otp}` is OTP. Valid for {time_left} sec till **{valid_till}**").format(
+        response, entities = temp_template.format(
             otp=otp,
             time_left=time_left,
             valid_till=valid_till.strftime("%b %d, %Y %I:%M:%S %p"),
         )
-        await event.reply(response)
+        await event.reply(response, formatting_entities=entities)
     except InvalidSecretError:
         await event.reply(invalid_secret)
     except ValueError:
@@ -6,7 +6,7 @@ from telethon import TelegramClient, events
 from sqlitedb.models import Secret
 
 # Import some helper functions
-from telegram.utils import SupportedCommands, get_user
+from telegram.utils import SupportedCommands, get_telegram_id
 
 
 def add_total_handlers(client: TelegramClient) -> None:
@@ -34,6 +34,5 @@ async def handle_total_message(event: events.NewMessage.Event) -> None:
     -------
         None: This function doesn't return anything.
     """
-    user = await get_user(event)
-    size = await Secret.objects.total_secrets(user=user)
+    size = await Secret.objects.total_secrets_by_telegram_id(telegram_id=get_telegram_id(event))
     await event.reply(f"There are {size} secrets in total.")
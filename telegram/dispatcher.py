@@ -0,0 +1,270 @@
+"""Concurrent dispatch of updates, ordered per user."""
+
+import asyncio
+import contextlib
+import functools
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable, Coroutine
+from enum import Enum
+from typing import Any, Self
+
+from loguru import logger
+from telethon import TelegramClient, events, utils
+
+from telegram.ratelimit import RateClass, rate_limiter
+from telegram.strings import request_timed_out, slow_down, too_many_requests
+
+# Number of interactive handlers running at the same time
+DISPATCH_CONCURRENCY = 16
+# Number of bulk handlers running at the same time, on top of the interactive ones
+BULK_CONCURRENCY = 2
+# Seconds bulk work pauses between chunks while interactive handlers are running
+BULK_YIELD_DELAY = 0.01
+# Number of updates waiting to be handled before new ones are dropped
+DISPATCH_BACKLOG = 1000
+# Seconds a handler may run before it is cancelled
+HANDLER_TIMEOUT = 60
+# Seconds handlers working on whole secret collections may run
+LONG_HANDLER_TIMEOUT = 600
+
+Handler = Callable[[Any], Awaitable[None]]
+
+
+class Priority(Enum):
+    """Scheduling class of a handler."""
+
+    # Short requests a user is waiting on
+    INTERACTIVE = "interactive"
+    # Work on whole secret collections, like imports and exports
+    BULK = "bulk"
+
+
+def handler_timeout(seconds: float) -> Callable[[Handler], Handler]:
+    """Give a handler its own timeout instead of ``HANDLER_TIMEOUT``.
+
+    Apply it below ``events.register`` so the registered handler carries it.
+    """
+
+    def decorator(handler: Handler) -> Handler:
+        handler.dispatch_timeout = seconds  # type: ignore[attr-defined]
+        return handler
+
+    return decorator
+
+
+def handler_priority(priority: Priority) -> Callable[[Handler], Handler]:
+    """Put a handler in another priority class than ``Priority.INTERACTIVE``.
+
+    Apply it below ``events.register`` so the registered handler carries it.
+    """
+
+    def decorator(handler: Handler) -> Handler:
+        handler.dispatch_priority = priority  # type: ignore[attr-defined]
+        return handler
+
+    return decorator
+
+
+async def concurrently(*steps: Coroutine[Any, Any, Any]) -> tuple[Any, ...]:
+    """Run independent steps of a handler at the same time and return their results in order.
+
+    Steps run in a task group. Once a step fails the others are cancelled and the failed step's own exception is
+    raised, so handlers catch it just like when the steps ran one after the other.
+
+    Use it whenever a handler awaits things that don't depend on each other, e.g.::
+
+        _, user = await concurrently(event.answer(), get_user(event))
+    """
+    try:
+        async with asyncio.TaskGroup() as group:
+            tasks = [group.create_task(step) for step in steps]
+    except BaseExceptionGroup as error:
+        raise error.exceptions[0] from None
+    return tuple(task.result() for task in tasks)
+
+
+def update_key(update: Any) -> int:
+    """Return the id of the user an update belongs to, 0 when it has none."""
+    if (user_id := getattr(update, "user_id", None)) is not None:
+        return int(user_id)
+    message = getattr(update, "message", None)
+    if peer := getattr(message, "from_id", None) or getattr(message, "peer_id", None):
+        return int(utils.get_peer_id(peer))
+    return 0
+
+
+class UpdateDispatcher(object):
+    """Handles updates of different users concurrently while keeping each user's updates in order.
+
+    Updates are appended to a queue per user. Each user with queued updates gets a lane task that handles them one by
+    one. Handlers are cancelled once they run past their timeout, and updates arriving while ``backlog`` updates are
+    already waiting are dropped.
+
+    Every priority class has its own pool of slots, so bulk handlers can never take the capacity reserved for
+    interactive ones. Bulk handlers should call ``yield_to_interactive`` between chunks of work.
+    """
+
+    def __init__(self: Self) -> None:
+        self.processed = 0
+        self.dropped = 0
+        self.timed_out = 0
+        # Handler name to [calls, total seconds, slowest seconds]
+        self.latency: dict[str, list[float]] = {}
+        self.configure()
+        self._queues: dict[int, deque[Any]] = {}
+        self._lanes: dict[int, asyncio.Task[None]] = {}
+        self._waiting = 0
+        self._dispatch: Callable[[Any], Awaitable[None]] | None = None
+
+    def configure(
+        self: Self,
+        concurrency: int = DISPATCH_CONCURRENCY,
+        bulk_concurrency: int = BULK_CONCURRENCY,
+        backlog: int = DISPATCH_BACKLOG,
+        timeout: float = HANDLER_TIMEOUT,
+    ) -> None:
+        """Set limits of the dispatcher. Call it before ``install``.
+
+        Args:
+            concurrency (int): Number of interactive handlers running at the same time.
+            bulk_concurrency (int): Number of bulk handlers running at the same time.
+            backlog (int): Maximum number of waiting updates.
+            timeout (float): Default seconds a handler may run.
+        """
+        self.backlog = backlog
+        self.timeout = timeout
+        self._slots = {
+            Priority.INTERACTIVE: asyncio.Semaphore(concurrency),
+            Priority.BULK: asyncio.Semaphore(bulk_concurrency),
+        }
+        self._running = dict.fromkeys(Priority, 0)
+
+    def install(self: Self, client: TelegramClient) -> None:
+        """Route updates of client through the dispatcher. Call it after every handler has been added.
+
+        The client keeps reading updates in order (``sequential_updates=True``), but instead of handling each one
+        before reading the next, it hands them over to the dispatcher.
+        """
+        # Telethon has no public hooks around its handlers and update dispatch
+        client._event_builders = [  # noqa: SLF001
+            (builder, self._wrap_handler(callback, builder))
+            for builder, callback in client._event_builders  # noqa: SLF001
+        ]
+        self._dispatch = client._dispatch_update  # noqa: SLF001
+        client._dispatch_update = self.submit  # noqa: SLF001
+
+    def _wrap_handler(self: Self, callback: Handler, builder: Any = None) -> Handler:
+        """Wrap a handler so it runs within the sender's rate limit, in a slot of its priority and until its timeout."""
+        timeout = getattr(callback, "dispatch_timeout", self.timeout)
+        priority = getattr(callback, "dispatch_priority", Priority.INTERACTIVE)
+        default_class = RateClass.CALLBACK if isinstance(builder, events.CallbackQuery) else RateClass.COMMAND
+        rate_class = getattr(callback, "rate_class", default_class)
+
+        @functools.wraps(callback)
+        async def wrapper(event: Any) -> None:
+            # Checked before anything is looked up, so over budget users cost next to nothing
+            if event.sender_id is not None and not rate_limiter.allow(event.sender_id, rate_class):
+                await self._reject(event)
+                return
+            async with self._slots[priority]:
+                self._running[priority] += 1
+                started = time.perf_counter()
+                try:
+                    async with asyncio.timeout(timeout):
+                        await callback(event)
+                except TimeoutError:
+                    self.timed_out += 1
+                    logger.warning(f"{callback.__name__} timed out after {timeout}s")
+                    with contextlib.suppress(Exception):
+                        await event.reply(request_timed_out)
+                finally:
+                    self._running[priority] -= 1
+                    self._record_latency(callback.__name__, time.perf_counter() - started)
+
+        return wrapper
+
+    async def _reject(self: Self, event: Any) -> None:
+        """Tell the sender of an event over their budget to slow down.
+
+        Callbacks are always answered, the button would keep loading otherwise. Messages get a reply at most once
+        every ``RATE_WARN_INTERVAL`` seconds, so the replies don't add to the flood.
+        """
+        with contextlib.suppress(Exception):
+            if isinstance(event, events.CallbackQuery.Event):
+                await event.answer(slow_down, alert=False)
+            elif rate_limiter.should_warn(event.sender_id):
+                await event.reply(too_many_requests)
+
+    def _record_latency(self: Self, name: str, seconds: float) -> None:
+        latency = self.latency.setdefault(name, [0, 0.0, 0.0])
+        latency[0] += 1
+        latency[1] += seconds
+        latency[2] = max(latency[2], seconds)
+
+    async def submit(self: Self, update: Any) -> None:
+        """Queue an update behind earlier updates of the same user, unless the user is blocked."""
+        key = update_key(update)
+        if rate_limiter.is_blocked(key):
+            return
+        if self._waiting >= self.backlog:
+            self.dropped += 1
+            logger.warning(f"Dropping update, {self._waiting} updates are already waiting")
+            return
+        self._queues.setdefault(key, deque()).append(update)
+        self._waiting += 1
+        if key not in self._lanes:
+            self._lanes[key] = asyncio.create_task(self._run_lane(key))
+
+    async def _run_lane(self: Self, key: int) -> None:
+        """Handle queued updates of a user in order until none are left."""
+        queue = self._queues[key]
+        try:
+            while queue:
+                update = queue.popleft()
+                self._waiting -= 1
+                try:
+                    await self._dispatch(update)  # type: ignore[misc]
+                except Exception as e:  # noqa: BLE001
+                    logger.error(f"Unable to dispatch update {e}")
+                self.processed += 1
+        finally:
+            self._waiting -= len(queue)
+            del self._queues[key]
+            del self._lanes[key]
+
+    async def yield_to_interactive(self: Self) -> None:
+        """Let other tasks run, pausing a little longer while interactive handlers are running."""
+        await asyncio.sleep(BULK_YIELD_DELAY if self._running[Priority.INTERACTIVE] else 0)
+
+    async def close(self: Self) -> None:
+        """Cancel running handlers and drop waiting updates."""
+        lanes = list(self._lanes.values())
+        for lane in lanes:
+            lane.cancel()
+        await asyncio.gather(*lanes, return_exceptions=True)
+        # Lanes cancelled before they started never cleaned up after themselves
+        self._queues.clear()
+        self._lanes.clear()
+        self._waiting = 0
+
+    def stats(self: Self) -> dict[str, int]:
+        """Return dispatch counters."""
+        return {
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "timed_out": self.timed_out,
+            "waiting": self._waiting,
+            "users": len(self._lanes),
+            **{f"running_{priority.value}": running for priority, running in self._running.items()},
+        }
+
+    def latency_stats(self: Self) -> dict[str, dict[str, float]]:
+        """Return number of calls, mean and slowest run time in milliseconds of every handler."""
+        return {
+            name: {"calls": calls, "mean_ms": round(total / calls * 1000, 2), "max_ms": round(slowest * 1000, 2)}
+            for name, (calls, total, slowest) in sorted(self.latency.items())
+        }
+
+
+dispatcher = UpdateDispatcher()
@@ -7,6 +7,14 @@ class TGOtpError(Exception):
     """Base Project Error."""
 
 
+class JobCancelledError(TGOtpError):
+    """Job was cancelled while running."""
+
+
+class OutboundQueueFullError(TGOtpError):
+    """Too many messages are waiting to be sent."""
+
+
 class DuplicateSecretError(IntegrityError):
     """Duplicate Secret."""
 
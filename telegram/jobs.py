@@ -0,0 +1,280 @@
+"""Background jobs for long-running commands."""
+
+import asyncio
+import contextlib
+import time
+from collections.abc import Awaitable, Callable
+from datetime import UTC, datetime, timedelta
+from typing import Any, Self
+
+from asgiref.sync import sync_to_async
+from loguru import logger
+from telethon import TelegramClient, events
+from telethon.errors import RPCError
+from telethon.tl.custom import Message
+
+from sqlitedb.models import Job, User
+from sqlitedb.utils import JobKind, JobStatus
+from telegram.dispatcher import BULK_CONCURRENCY, LONG_HANDLER_TIMEOUT
+from telegram.exceptions import JobCancelledError
+from telegram.strings import job_cancelled, processing_request
+
+# Number of running jobs allowed per user
+JOB_USER_LIMIT = 1
+# Number of times a job is attempted before it is marked failed
+JOB_MAX_ATTEMPTS = 3
+# Seconds before a failed job is retried, multiplied by the number of attempts so far
+JOB_RETRY_DELAY = 30
+# Seconds idle workers wait before looking for queued jobs again
+JOB_POLL_INTERVAL = 5
+# Seconds between two heartbeats of running jobs
+JOB_HEARTBEAT_INTERVAL = 30
+# Seconds without heartbeat after which a running job is considered abandoned and queued again
+JOB_STALE_AFTER = 120
+# Minimum seconds between two progress edits of a job's status message
+JOB_PROGRESS_INTERVAL = 2
+# Days jobs that ended are kept before they are deleted
+JOB_RETENTION_DAYS = 7
+
+JobHandler = Callable[["JobContext"], Awaitable[None]]
+
+# Function running each kind of job, filled by ``register_job``
+job_handlers: dict[JobKind, JobHandler] = {}
+
+
+def register_job(kind: JobKind) -> Callable[[JobHandler], JobHandler]:
+    """Register the function running jobs of kind."""
+
+    def decorator(handler: JobHandler) -> JobHandler:
+        job_handlers[kind] = handler
+        return handler
+
+    return decorator
+
+
+class JobContext(object):
+    """What a job function needs to report back to the user who queued the job.
+
+    Offers ``sender_id`` and ``reply`` like a message event, so helpers such as ``reply_with_file`` work with it.
+    """
+
+    def __init__(self: Self, client: TelegramClient, job: Job) -> None:
+        self.client = client
+        self.job = job
+        self.id = job.id
+        self.user: User = job.user
+        self.sender_id = job.user.telegram_id
+        self.payload: dict[str, Any] = job.payload
+        # Checkpoint left by an earlier attempt, empty on the first one
+        self.state: dict[str, Any] = job.progress
+        self._last_progress = time.monotonic()
+
+    async def reply(self: Self, message: str = "", file: Any = None) -> Any:
+        """Reply to the message that queued the job."""
+        return await self.client.send_message(
+            self.payload["chat_id"],
+            message,
+            file=file,
+            reply_to=self.payload["reply_to"],
+        )
+
+    async def edit_status(self: Self, text: str) -> None:
+        """Replace the text of the job's status message."""
+        with contextlib.suppress(RPCError):
+            await self.client.edit_message(self.payload["chat_id"], self.payload["message_id"], text)
+
+    async def delete_status(self: Self) -> None:
+        """Delete the job's status message."""
+        with contextlib.suppress(RPCError):
+            await self.client.delete_messages(self.payload["chat_id"], [self.payload["message_id"]])
+
+    async def progress(self: Self, text: str, state: dict[str, Any] | None = None) -> None:
+        """Report progress of the job.
+
+        A given state is saved as checkpoint right away, the status message is edited at most every
+        ``JOB_PROGRESS_INTERVAL`` seconds.
+
+        Raises
+        ------
+            JobCancelledError: If the job was cancelled meanwhile.
+        """
+        due = time.monotonic() - self._last_progress >= JOB_PROGRESS_INTERVAL
+        if state is None and not due:
+            return
+        if not await Job.objects.checkpoint(self.job, state):
+            raise JobCancelledError
+        if due:
+            self._last_progress = time.monotonic()
+            await self.edit_status(text)
+
+
+class JobRunner(object):
+    """Pool of asyncio workers running queued jobs.
+
+    Jobs are claimed from the database, so they survive restarts and can be shared by several processes. Running
+    jobs send heartbeats. Jobs whose heartbeats stop, because their process died or restarted, are queued again and
+    resume from their last checkpoint. Failed jobs are retried with a growing delay.
+    """
+
+    def __init__(self: Self) -> None:
+        self.configure()
+        self._client: TelegramClient | None = None
+        self._wakeup = asyncio.Event()
+        self._workers: list[asyncio.Task[None]] = []
+        self._running: dict[int, asyncio.Task[None]] = {}
+        self._cancelled: set[int] = set()
+
+    def configure(
+        self: Self,
+        workers: int = BULK_CONCURRENCY,
+        user_limit: int = JOB_USER_LIMIT,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+        timeout: float = LONG_HANDLER_TIMEOUT,
+    ) -> None:
+        """Set limits of the runner. Call it before ``start``.
+
+        Args:
+            workers (int): Number of jobs running at the same time.
+            user_limit (int): Number of running jobs allowed per user.
+            max_attempts (int): Number of attempts before a job is marked failed.
+            timeout (float): Seconds an attempt may run.
+        """
+        self.workers = workers
+        self.user_limit = user_limit
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+
+    def start(self: Self, client: TelegramClient) -> None:
+        """Start the workers on the loop of client."""
+        self._client = client
+        self._workers = [client.loop.create_task(self._work()) for _ in range(self.workers)]
+        self._workers.append(client.loop.create_task(self._maintain()))
+        logger.info(f"Started {self.workers} job workers")
+
+    async def submit(
+        self: Self,
+        event: events.NewMessage.Event,
+        user: User,
+        kind: JobKind,
+        payload: dict[str, Any],
+        status: Message | None = None,
+    ) -> Job:
+        """Queue a job on behalf of the sender of event, whose progress is shown in a reply to it.
+
+        Args:
+            event (events.NewMessage.Event): Message that asked for the job.
+            user (User): Owner of the job.
+            kind (JobKind): What the job does.
+            payload (dict): Arguments of the job.
+            status (Message | None): Reply showing the job's progress, sent here when None. Handlers can send it
+                while they are still fetching the user.
+
+        Returns
+        -------
+            Job: The queued job.
+        """
+        message = status if status is not None else await event.reply(processing_request)
+        job = await Job.objects.enqueue(
+            user,
+            kind,
+            {**payload, "chat_id": event.chat_id, "reply_to": event.id, "message_id": message.id},
+        )
+        self._wakeup.set()
+        return job
+
+    async def cancel(self: Self, job_id: int, user: User | None = None) -> bool:
+        """Cancel a queued or running job, only among jobs of user if given.
+
+        Returns
+        -------
+            bool: Whether a job was cancelled.
+        """
+        job = await Job.objects.cancel(job_id, user)
+        if job is None:
+            return False
+        if task := self._running.get(job_id):
+            self._cancelled.add(job_id)
+            task.cancel()
+        elif job.status == JobStatus.QUEUED.value:
+            await JobContext(self._client, job).edit_status(job_cancelled)
+        # Jobs running in other processes notice at their next progress report
+        return True
+
+    async def _work(self: Self) -> None:
+        """Run queued jobs one after the other."""
+        while True:
+            self._wakeup.clear()
+            try:
+                job = await sync_to_async(Job.objects.claim)(self.user_limit)
+            except Exception as e:  # noqa: BLE001
+                logger.error(f"Unable to claim job {e}")
+                job = None
+            if job is None:
+                with contextlib.suppress(TimeoutError):
+                    async with asyncio.timeout(JOB_POLL_INTERVAL):
+                        await self._wakeup.wait()
+                continue
+            task = asyncio.create_task(self._run(job))
+            self._running[job.id] = task
+            try:
+                await task
+            finally:
+                del self._running[job.id]
+
+    async def _run(self: Self, job: Job) -> None:
+        """Run one attempt of a job and record its outcome."""
+        context = JobContext(self._client, job)
+        if job.attempts > self.max_attempts:
+            # Picked up again after its process died during the last attempt
+            await Job.objects.finish(job, JobStatus.FAILED, job.error)
+            await context.edit_status(f"Unable to finish the request\n`{job.error}`.")
+            return
+        logger.info(f"Running {job}")
+        try:
+            async with asyncio.timeout(self.timeout):
+                await job_handlers[JobKind(job.kind)](context)
+        except (JobCancelledError, asyncio.CancelledError) as e:
+            # Shutdown cancels jobs too, those are resumed after the restart
+            if isinstance(e, asyncio.CancelledError) and job.id not in self._cancelled:
+                raise
+            self._cancelled.discard(job.id)
+            asyncio.current_task().uncancel()  # type: ignore[union-attr]
+            await context.edit_status(job_cancelled)
+        except Exception as e:  # noqa: BLE001
+            logger.error(f"{job} failed {e}")
+            if job.attempts < self.max_attempts:
+                run_after = datetime.now(UTC) + timedelta(seconds=JOB_RETRY_DELAY * job.attempts)
+                await Job.objects.retry(job, str(e), run_after)
+                await context.edit_status(f"{processing_request} Attempt {job.attempts} failed, retrying.")
+                return
+            await Job.objects.finish(job, JobStatus.FAILED, str(e))
+            await context.edit_status(f"Unable to finish the request\n`{e}`.")
+        else:
+            await Job.objects.finish(job, JobStatus.DONE)
+
+    async def _maintain(self: Self) -> None:
+        """Send heartbeats of running jobs, queue abandoned jobs again and delete old finished jobs."""
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+            try:
+                if self._running:
+                    await Job.objects.heartbeat(self._running)
+                stale = datetime.now(UTC) - timedelta(seconds=JOB_STALE_AFTER)
+                if requeued := await Job.objects.requeue_stale(before=stale):
+                    logger.info(f"Queued {requeued} abandoned jobs again")
+                    self._wakeup.set()
+                expired = datetime.now(UTC) - timedelta(days=JOB_RETENTION_DAYS)
+                if purged := await Job.objects.purge_finished(before=expired):
+                    logger.info(f"Deleted {purged} finished jobs")
+            except Exception as e:  # noqa: BLE001
+                logger.error(f"Unable to maintain jobs {e}")
+
+    async def close(self: Self) -> None:
+        """Stop the workers. Running jobs are left running in the database and resumed after a restart."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+
+job_runner = JobRunner()
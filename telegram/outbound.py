@@ -0,0 +1,261 @@
+"""Scheduling of outgoing messages within Telegram's rate limits."""
+
+import asyncio
+import contextlib
+import functools
+from collections import deque
+from collections.abc import Awaitable, Callable
+from contextvars import ContextVar
+from typing import Any, Self
+
+from loguru import logger
+from telethon import TelegramClient, utils
+from telethon.errors import FloodWaitError
+
+from telegram.cache import LRUCache
+from telegram.exceptions import OutboundQueueFullError
+from telegram.ratelimit import TokenBucket
+
+# Messages per second a bot may send in total
+OUTBOUND_GLOBAL_RATE = 30
+# Messages per second sent to a single chat on average
+OUTBOUND_CHAT_RATE = 1
+# Messages sent to a single chat at once before the chat rate applies
+OUTBOUND_CHAT_BURST = 3
+# Number of sends waiting before new ones are dropped
+OUTBOUND_BACKLOG = 1000
+# Seconds of the longest flood wait a send waits out, longer ones fail the send
+OUTBOUND_MAX_FLOOD_WAIT = 300
+# Number of chats whose rate budget is remembered
+OUTBOUND_CHATS_SIZE = 4096
+
+# Set while a scheduled send runs, so the client methods it calls internally go straight through
+_sending: ContextVar[bool] = ContextVar("outbound_sending", default=False)
+
+
+def chat_key(entity: Any) -> int:
+    """Return the id of the chat a send goes to, 0 for inline messages and chats only known by name."""
+    with contextlib.suppress(TypeError, ValueError):
+        return int(utils.get_peer_id(getattr(entity, "peer_id", entity)))
+    return 0
+
+
+def edited_message_id(entity: Any, args: tuple[Any, ...], kwargs: dict[str, Any]) -> int | None:
+    """Return the id of the message an ``edit_message`` call edits, None if it can't be told."""
+    message = args[0] if args else kwargs.get("message")
+    if isinstance(message, int):
+        return message
+    return getattr(message, "id", None) or getattr(entity, "id", None)
+
+
+class OutboundSend(object):
+    """A send waiting in the queue of its chat."""
+
+    def __init__(
+        self: Self,
+        method: Callable[..., Awaitable[Any]],
+        entity: Any,
+        args: tuple[Any, ...],
+        kwargs: dict[str, Any],
+    ) -> None:
+        self.method = method
+        self.entity = entity
+        self.args = args
+        self.kwargs = kwargs
+        self.edit_key: tuple[int, int] | None = None
+        self.future: asyncio.Future[Any] = asyncio.get_running_loop().create_future()
+        # Callers may stop waiting, e.g. on timeout, keep their failures out of the log
+        self.future.add_done_callback(lambda future: future.cancelled() or future.exception())
+
+
+class OutboundScheduler(object):
+    """Sends replies, edits and files within Telegram's per-chat and global rate limits.
+
+    Sends are queued per chat and sent in order by a lane task per chat, so a flood wait only pauses the chat it
+    was raised for. Edits of a message that is already waiting to be edited replace the waiting edit, only the
+    latest text is sent and every caller gets its result.
+    """
+
+    def __init__(self: Self) -> None:
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.failed = 0
+        self.flood_waits = 0
+        self.configure()
+        self._client: TelegramClient | None = None
+        self._queues: dict[int, deque[OutboundSend]] = {}
+        self._lanes: dict[int, asyncio.Task[None]] = {}
+        self._edits: dict[tuple[int, int], OutboundSend] = {}
+        self._waiting = 0
+
+    def configure(
+        self: Self,
+        global_rate: float = OUTBOUND_GLOBAL_RATE,
+        chat_rate: float = OUTBOUND_CHAT_RATE,
+        chat_burst: int = OUTBOUND_CHAT_BURST,
+        backlog: int = OUTBOUND_BACKLOG,
+        max_flood_wait: int = OUTBOUND_MAX_FLOOD_WAIT,
+    ) -> None:
+        """Set limits of the scheduler. Call it before ``install``.
+
+        Args:
+            global_rate (float): Messages per second sent in total.
+            chat_rate (float): Messages per second sent to a single chat.
+            chat_burst (int): Messages sent to a single chat at once.
+            backlog (int): Maximum number of waiting sends.
+            max_flood_wait (int): Seconds of the longest flood wait waited out.
+        """
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.backlog = backlog
+        self.max_flood_wait = max_flood_wait
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats: LRUCache[int, TokenBucket] = LRUCache(maxsize=OUTBOUND_CHATS_SIZE)
+
+    def install(self: Self, client: TelegramClient) -> None:
+        """Route replies, edits and file sends of client through the scheduler."""
+        self._client = client
+        for name in ("send_message", "send_file", "edit_message"):
+            setattr(client, name, self._wrap(getattr(client, name), edit=name == "edit_message"))
+        # Telethon's flood sleep can only be turned off per request below its public API
+        call = client._call  # noqa: SLF001
+
+        @functools.wraps(call)
+        async def call_without_flood_sleep(
+            sender: Any,
+            request: Any,
+            ordered: bool = False,  # noqa: FBT001, FBT002
+            flood_sleep_threshold: int | None = None,
+        ) -> Any:
+            # Scheduled sends wait out flood waits themselves, per chat
+            return await call(sender, request, ordered, 0 if _sending.get() else flood_sleep_threshold)
+
+        client._call = call_without_flood_sleep  # noqa: SLF001
+
+    def _wrap(self: Self, method: Callable[..., Awaitable[Any]], *, edit: bool) -> Callable[..., Awaitable[Any]]:
+        @functools.wraps(method)
+        async def wrapper(entity: Any, *args: Any, **kwargs: Any) -> Any:
+            if _sending.get():
+                return await method(entity, *args, **kwargs)
+            return await self.submit(method, entity, args, kwargs, edit=edit)
+
+        return wrapper
+
+    async def submit(
+        self: Self,
+        method: Callable[..., Awaitable[Any]],
+        entity: Any,
+        args: tuple[Any, ...],
+        kwargs: dict[str, Any],
+        *,
+        edit: bool = False,
+    ) -> Any:
+        """Queue a call of method behind earlier sends to the same chat and return its result once sent.
+
+        Raises
+        ------
+            OutboundQueueFullError: If ``backlog`` sends are already waiting.
+        """
+        key = chat_key(entity)
+        message_id = edited_message_id(entity, args, kwargs) if edit else None
+        if message_id is not None and (waiting := self._edits.get((key, message_id))):
+            waiting.args, waiting.kwargs = args, kwargs
+            self.coalesced += 1
+            return await asyncio.shield(waiting.future)
+        if self._waiting >= self.backlog:
+            self.dropped += 1
+            logger.warning(f"Dropping send, {self._waiting} sends are already waiting")
+            raise OutboundQueueFullError
+        send = OutboundSend(method, entity, args, kwargs)
+        if message_id is not None:
+            send.edit_key = (key, message_id)
+            self._edits[send.edit_key] = send
+        self._queues.setdefault(key, deque()).append(send)
+        self._waiting += 1
+        if key not in self._lanes:
+            self._lanes[key] = asyncio.create_task(self._run_lane(key))
+        return await asyncio.shield(send.future)
+
+    async def _run_lane(self: Self, key: int) -> None:
+        """Send queued sends of a chat in order, within the rate limits, until none are left."""
+        queue = self._queues[key]
+        if (bucket := self._chats.get(key)) is None:
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chats.set(key, bucket)
+        send = None
+        try:
+            while queue:
+                await asyncio.sleep(bucket.delay())
+                await asyncio.sleep(self._global.delay())
+                # Taken only now, so edits arriving while waiting still replace it
+                send = queue.popleft()
+                self._waiting -= 1
+                if send.edit_key:
+                    del self._edits[send.edit_key]
+                await self._deliver(key, send)
+        finally:
+            self._waiting -= len(queue)
+            for unsent in [send, *queue] if send else queue:
+                unsent.future.cancel()
+                if unsent.edit_key:
+                    self._edits.pop(unsent.edit_key, None)
+            del self._queues[key]
+            del self._lanes[key]
+
+    async def _deliver(self: Self, key: int, send: OutboundSend) -> None:
+        """Make a send, waiting out flood waits of its chat."""
+        token = _sending.set(True)
+        try:
+            while True:
+                try:
+                    result = await send.method(send.entity, *send.args, **send.kwargs)
+                except FloodWaitError as e:
+                    # Telethon would hold back the same request to every chat, only this chat has to wait
+                    if e.request is not None:
+                        # Telethon keeps flood waits per request type only, privately
+                        flood_waited = self._client._flood_waited_requests  # type: ignore[union-attr] # noqa: SLF001
+                        flood_waited.pop(e.request.CONSTRUCTOR_ID, None)
+                    self.flood_waits += 1
+                    if e.seconds > self.max_flood_wait:
+                        raise
+                    logger.warning(f"Flood wait of {e.seconds}s sending to chat {key}")
+                    await asyncio.sleep(e.seconds)
+                    continue
+                break
+        except Exception as e:  # noqa: BLE001
+            self.failed += 1
+            if not send.future.done():
+                send.future.set_exception(e)
+        else:
+            self.sent += 1
+            if not send.future.done():
+                send.future.set_result(result)
+        finally:
+            _sending.reset(token)
+
+    async def close(self: Self) -> None:
+        """Cancel waiting sends."""
+        lanes = list(self._lanes.values())
+        for lane in lanes:
+            lane.cancel()
+        await asyncio.gather(*lanes, return_exceptions=True)
+        self._queues.clear()
+        self._lanes.clear()
+        self._edits.clear()
+        self._waiting = 0
+
+    def stats(self: Self) -> dict[str, int]:
+        """Return outbound counters."""
+        return {
+            "queued": self._waiting,
+            "chats": len(self._lanes),
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "flood_waits": self.flood_waits,
+        }
+
+
+outbound = OutboundScheduler()
@@ -0,0 +1,58 @@
+"""QR code rendering in worker processes."""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+import qrcode
+from loguru import logger
+from qrcode.image.styledpil import StyledPilImage
+from qrcode.image.styles.colormasks import VerticalGradiantColorMask
+from qrcode.image.styles.moduledrawers import HorizontalBarsDrawer
+
+# Pool rendering QR codes, started by ``start_render_pool`` or on first use
+_render_pool: ProcessPoolExecutor | None = None
+
+
+def render_qr(uri: str) -> bytes:
+    """Render a styled QR code of uri as PNG bytes.
+
+    Runs in the worker processes, so it only depends on this module.
+    """
+    qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_L)
+    qr.add_data(uri)
+    qr_code = qr.make_image(
+        image_factory=StyledPilImage,
+        module_drawer=HorizontalBarsDrawer(),
+        color_mask=VerticalGradiantColorMask(),
+    )
+    buffer = BytesIO()
+    qr_code.save(buffer)
+    return buffer.getvalue()
+
+
+def start_render_pool(workers: int | None = None) -> ProcessPoolExecutor:
+    """Start the pool rendering QR codes.
+
+    Args:
+        workers (int | None): Number of processes, None for one per core.
+
+    Returns
+    -------
+        ProcessPoolExecutor: The pool.
+    """
+    global _render_pool  # noqa: PLW0603
+    if _render_pool is None:
+        # Forking a process running an event loop and threads is unsafe
+        _render_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        logger.info(f"Rendering QR codes with {workers or os.cpu_count()} processes")
+    return _render_pool
+
+
+def shutdown_render_pool() -> None:
+    """Stop the rendering processes."""
+    global _render_pool  # noqa: PLW0603
+    if _render_pool is not None:
+        _render_pool.shutdown(cancel_futures=True)
+        _render_pool = None
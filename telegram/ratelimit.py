@@ -0,0 +1,177 @@
+"""Per-user rate limiting of incoming updates."""
+
+import asyncio
+import time
+from collections.abc import Awaitable, Callable, Iterable
+from enum import Enum
+from typing import Any, Self
+
+from loguru import logger
+
+from sqlitedb.utils import UserStatus
+from telegram.cache import LRUCache
+
+# Number of users whose rate budget is remembered
+RATE_USERS_SIZE = 16384
+# Seconds between two reloads of the ids of suspended and banned users
+RATE_STATUS_REFRESH_INTERVAL = 60
+# Seconds a user over budget is told so at most once
+RATE_WARN_INTERVAL = 60
+
+
+class RateClass(Enum):
+    """Budget a handler draws from, every user has a bucket per class."""
+
+    # Commands answered right away
+    COMMAND = "command"
+    # Button presses, like turning pages of /list
+    CALLBACK = "callback"
+    # Commands queuing imports and exports
+    BULK = "bulk"
+    # Messages no command matches
+    UNKNOWN = "unknown"
+
+
+# Updates per second and burst allowed per user for each class
+RATE_LIMITS = {
+    RateClass.COMMAND: (1.0, 5),
+    RateClass.CALLBACK: (2.0, 5),
+    RateClass.BULK: (1 / 30, 2),
+    RateClass.UNKNOWN: (0.2, 3),
+}
+
+
+def handler_rate_class(rate_class: RateClass) -> Callable[[Any], Any]:
+    """Make a handler draw from another budget than the one of its event type.
+
+    Apply it below ``events.register`` so the registered handler carries it.
+    """
+
+    def decorator(handler: Any) -> Any:
+        handler.rate_class = rate_class
+        return handler
+
+    return decorator
+
+
+class TokenBucket(object):
+    """Allows rate operations per second on average, and bursts of up to burst operations."""
+
+    def __init__(self: Self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+
+    def _refill(self: Self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self: Self) -> float:
+        """Take a token and return the seconds to wait before using it."""
+        self._refill()
+        self._tokens -= 1
+        return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def take(self: Self) -> bool:
+        """Take a token if one is available right now.
+
+        Returns
+        -------
+            bool: Whether a token was taken.
+        """
+        self._refill()
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+class RateLimiter(object):
+    """Rejects updates of blocked users and of users who send more than their budget allows.
+
+    Checks run on the event loop with data kept in memory, so rejected updates cost neither the user lookup nor the
+    database. Suspended and temporarily banned users are kept as a set of telegram ids, reloaded periodically.
+    """
+
+    def __init__(self: Self) -> None:
+        self.limited = 0
+        self.blocked = 0
+        self.configure()
+        self._blocked_ids: set[int] = set()
+
+    def configure(
+        self: Self,
+        limits: dict[RateClass, tuple[float, int]] | None = None,
+        exempt: Iterable[int] = (),
+    ) -> None:
+        """Set the budgets of the limiter.
+
+        Args:
+            limits (dict): Updates per second and burst of each class, ``RATE_LIMITS`` for missing classes.
+            exempt (Iterable[int]): Telegram ids never rate limited, like admins.
+        """
+        self.limits = {**RATE_LIMITS, **(limits or {})}
+        self.exempt = set(exempt)
+        self._buckets: LRUCache[tuple[int, RateClass], TokenBucket] = LRUCache(maxsize=RATE_USERS_SIZE)
+        self._warned: LRUCache[int, bool] = LRUCache(maxsize=RATE_USERS_SIZE, ttl=RATE_WARN_INTERVAL)
+
+    def is_blocked(self: Self, telegram_id: int) -> bool:
+        """Return whether updates of the user are rejected because of their status."""
+        if telegram_id in self._blocked_ids:
+            self.blocked += 1
+            return True
+        return False
+
+    def allow(self: Self, telegram_id: int, rate_class: RateClass) -> bool:
+        """Take a token from the user's bucket of rate_class.
+
+        Returns
+        -------
+            bool: Whether the user is within budget.
+        """
+        if telegram_id in self.exempt:
+            return True
+        key = (telegram_id, rate_class)
+        if (bucket := self._buckets.get(key)) is None:
+            bucket = TokenBucket(*self.limits[rate_class])
+            self._buckets.set(key, bucket)
+        if bucket.take():
+            return True
+        self.limited += 1
+        return False
+
+    def should_warn(self: Self, telegram_id: int) -> bool:
+        """Return whether a user over budget is to be told so, at most once every ``RATE_WARN_INTERVAL`` seconds."""
+        if self._warned.get(telegram_id):
+            return False
+        self._warned.set(telegram_id, True)  # noqa: FBT003
+        return True
+
+    def record_status(self: Self, telegram_id: int, status: str) -> None:
+        """Note the status of a user loaded from the database."""
+        if status == UserStatus.ACTIVE.value:
+            self._blocked_ids.discard(telegram_id)
+        else:
+            self._blocked_ids.add(telegram_id)
+
+    async def refresh_periodically(
+        self: Self,
+        load: Callable[[], Awaitable[set[int]]],
+        interval: int = RATE_STATUS_REFRESH_INTERVAL,
+    ) -> None:
+        """Reload the ids of blocked users with load now and every interval seconds."""
+        while True:
+            try:
+                self._blocked_ids = await load()
+            except Exception as e:  # noqa: BLE001
+                logger.error(f"Unable to load blocked users {e}")
+            await asyncio.sleep(interval)
+
+    def stats(self: Self) -> dict[str, int]:
+        """Return rate limit counters."""
+        return {"limited": self.limited, "blocked": self.blocked, "blocked_users": len(self._blocked_ids)}
+
+
+rate_limiter = RateLimiter()
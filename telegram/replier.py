@@ -1,12 +1,23 @@
 """Reply to messages."""
 
+import asyncio
+import contextlib
+import os
+import signal
 import sys
+import tempfile
+from pathlib import Path
 from typing import Self
 
 from loguru import logger
 from telethon import TelegramClient
 
 from main import env
+from sqlitedb.backup import periodic_backup
+from sqlitedb.invalidation import create_transport, invalidation_bus
+from sqlitedb.models import User
+from sqlitedb.usage import USAGE_FLUSH_INTERVAL, usage_tracker
+from telegram.catchup import CATCHUP_STALE_AFTER, catch_up
 from telegram.commands.add import add_add_handlers
 from telegram.commands.adduri import add_adduri_handlers
 from telegram.commands.addurifile import add_addurifile_handlers
@@ -15,6 +26,7 @@ from telegram.commands.exportqr import add_exportqr_handlers
 from telegram.commands.general import add_general_handlers
 from telegram.commands.get import add_get_handlers
 from telegram.commands.help import add_help_handlers
+from telegram.commands.jobs import add_jobs_handlers
 from telegram.commands.list import add_list_handlers
 from telegram.commands.reset import add_reset_handlers
 from telegram.commands.rm import add_rm_handlers
@@ -22,40 +34,68 @@ from telegram.commands.settings import add_settings_handlers
 from telegram.commands.start import add_start_handlers
 from telegram.commands.temp import add_temp_handlers
 from telegram.commands.total import add_total_handlers
-from telegram.utils import CustomMarkdown
+from telegram.dispatcher import BULK_CONCURRENCY, DISPATCH_BACKLOG, DISPATCH_CONCURRENCY, HANDLER_TIMEOUT, dispatcher
+from telegram.jobs import JOB_MAX_ATTEMPTS, JOB_USER_LIMIT, job_runner
+from telegram.outbound import OUTBOUND_CHAT_RATE, OUTBOUND_GLOBAL_RATE, outbound
+from telegram.qr import shutdown_render_pool, start_render_pool
+from telegram.ratelimit import RATE_STATUS_REFRESH_INTERVAL, rate_limiter
+from telegram.session import SESSION_ENTITY_LIMIT, SESSION_FLUSH_INTERVAL, BufferedSession
+from telegram.utils import CustomMarkdown, admin_ids, cache_stats, preparse_static_replies
+from telegram.warm_cache import load_warm_cache, save_warm_cache
+from telegram.workers import UpdateReceiver, WorkerClient
 
 
 class Telegram(object):
     """A class representing a Telegram bot."""
 
+    # Invalidation transport used when INVALIDATION_TRANSPORT is not set
+    default_transport = "none"
+
     def __init__(self: Self, session_file: str) -> None:
         """Create a new Telegram object and connect to the Telegram API using the given session file.
 
         Args:
             session_file (str): The path to the session file to use for connecting to the Telegram API.
         """
-        # Create a new TelegramClient instance with the given session file and API credentials
+        # Number of worker processes handling commands, 0 to handle them in this process
+        self.workers = env.int("WORKERS", 0)
+        # Optional snapshot of hot caches carried across restarts
+        warm_cache_file = env.str("WARM_CACHE_FILE", "")
+        self.warm_cache_file = Path(warm_cache_file) if warm_cache_file else None
+        # Session state lives in memory and is flushed to the session file periodically and on disconnect
+        self.session = BufferedSession(session_file)
+        # Create a new TelegramClient instance with the given session file and API credentials.
+        # Updates are read in order and handed to the dispatcher, which handles different users concurrently.
         self.client: TelegramClient = TelegramClient(
-            session_file,
+            self.session,
             env.int("API_ID"),
             env.str("API_HASH"),
             sequential_updates=True,
+            # Telethon's own in-memory entities are trimmed to the size of the session's
+            entity_cache_limit=SESSION_ENTITY_LIMIT,
         )
         # Connect to the Telegram API using bot authentication
         logger.debug("Trying to connect using bot token")
         self.client.start(bot_token=env.str("BOT_TOKEN"))
         # Check if the connection was successful
         if self.client.is_connected():
-            self.client.parse_mode = CustomMarkdown()
+            if not self.workers:
+                self.prepare_client()
             logger.info("Connected to Telegram")
             logger.info("Using bot authentication. Only bot messages are recognized.")
         else:
             logger.info("Unable to connect with Telegram exiting.")
             sys.exit(1)
 
-    def bot_listener(self: Self) -> None:
-        """Listen for incoming bot messages and handle them based on the command."""
-        # Register event handlers for each command the bot can handle
+    def prepare_client(self: Self) -> None:
+        """Set up parsing of the client and fill the in-process caches of the process handling commands."""
+        self.client.parse_mode = CustomMarkdown()
+        if self.warm_cache_file:
+            load_warm_cache(self.warm_cache_file)
+        preparse_static_replies()
+
+    def add_handlers(self: Self) -> None:
+        """Register event handlers for each command the bot can handle and route updates through the dispatcher."""
         add_start_handlers(self.client)
         add_temp_handlers(self.client)
         add_add_handlers(self.client)
@@ -71,9 +111,189 @@ class Telegram(object):
         add_general_handlers(self.client)
         add_exportqr_handlers(self.client)
         add_help_handlers(self.client)
+        add_jobs_handlers(self.client)
+
+        dispatcher.configure(
+            concurrency=env.int("DISPATCH_CONCURRENCY", DISPATCH_CONCURRENCY),
+            bulk_concurrency=env.int("BULK_CONCURRENCY", BULK_CONCURRENCY),
+            backlog=env.int("DISPATCH_BACKLOG", DISPATCH_BACKLOG),
+            timeout=env.int("HANDLER_TIMEOUT", HANDLER_TIMEOUT),
+        )
+        dispatcher.install(self.client)
+
+    def start_services(self: Self) -> None:
+        """Start background work of the process handling commands."""
+        admin_ids.update(env.list("ADMIN_IDS", [], subcast=int))
+
+        # Updates of blocked users and users over their budget are rejected before any lookup
+        rate_limiter.configure(exempt=admin_ids)
+        self.client.loop.create_task(
+            rate_limiter.refresh_periodically(
+                User.objects.blocked_telegram_ids,
+                env.int("RATE_STATUS_REFRESH_INTERVAL", RATE_STATUS_REFRESH_INTERVAL),
+            ),
+        )
+
+        # Worker processes share the rate limits, job slots and render processes evenly
+        shares = max(env.int("WORKERS", 0), 1)
+
+        # Replies, edits and files are sent within Telegram's rate limits
+        outbound.configure(
+            global_rate=env.float("OUTBOUND_GLOBAL_RATE", OUTBOUND_GLOBAL_RATE) / shares,
+            chat_rate=env.float("OUTBOUND_CHAT_RATE", OUTBOUND_CHAT_RATE),
+        )
+        outbound.install(self.client)
+
+        # Imports and exports run as persistent background jobs
+        job_runner.configure(
+            workers=max(env.int("BULK_CONCURRENCY", BULK_CONCURRENCY) // shares, 1),
+            user_limit=env.int("JOB_USER_LIMIT", JOB_USER_LIMIT),
+            max_attempts=env.int("JOB_MAX_ATTEMPTS", JOB_MAX_ATTEMPTS),
+        )
+        job_runner.start(self.client)
+        # QR codes are rendered in separate processes so the event loop stays responsive
+        start_render_pool(max((env.int("QR_RENDER_WORKERS", 0) or os.cpu_count() or 1) // shares, 1))
+
+        # Secret usage is buffered in memory and written in batches
+        self.client.loop.create_task(
+            usage_tracker.flush_periodically(env.int("USAGE_FLUSH_INTERVAL", USAGE_FLUSH_INTERVAL)),
+        )
+
+        # Share cache invalidations with other processes using the same database
+        transport = create_transport(
+            env.str("INVALIDATION_TRANSPORT", self.default_transport),
+            Path(env.str("INVALIDATION_SOCKET_DIR", str(Path(tempfile.gettempdir(), "tg-totp-invalidation")))),
+        )
+        if transport:
+            invalidation_bus.connect(transport, self.client.loop)
+
+    def stop_services(self: Self) -> None:
+        """Stop background work of the process handling commands and persist what is kept in memory."""
+        self.client.loop.run_until_complete(dispatcher.close())
+        self.client.loop.run_until_complete(job_runner.close())
+        self.client.loop.run_until_complete(outbound.close())
+        shutdown_render_pool()
+        usage_tracker.flush()
+        invalidation_bus.close()
+        if self.warm_cache_file:
+            try:
+                save_warm_cache(self.warm_cache_file)
+            except OSError as e:
+                logger.error(f"Unable to save warm cache {e}")
+        logger.info(f"Cache stats {cache_stats()}")
+        logger.info(f"Dispatch stats {dispatcher.stats()}")
+        logger.info(f"Handler latency {dispatcher.latency_stats()}")
+        logger.info(f"Outbound stats {outbound.stats()}")
+        logger.info(f"Rate limit stats {rate_limiter.stats()}")
 
-        # Start listening for incoming bot messages
-        self.client.run_until_disconnected()
+    def start_connection_services(self: Self) -> None:
+        """Start background work of the process owning the Telegram connection."""
+        # Referenced until stopped, the loop only keeps weak references to tasks
+        self.connection_tasks = [
+            self.client.loop.create_task(
+                self.session.flush_periodically(env.int("SESSION_FLUSH_INTERVAL", SESSION_FLUSH_INTERVAL)),
+            ),
+        ]
 
+        # Optionally back up the database in the background
+        if backup_interval := env.int("BACKUP_INTERVAL", 0):
+            backup_keep = env.int("BACKUP_KEEP", 7)
+            if backup_keep < 1:
+                logger.error(f"BACKUP_KEEP must be at least 1, got {backup_keep}")
+                sys.exit(1)
+            logger.info(f"Backing up database every {backup_interval} minutes")
+            self.connection_tasks.append(
+                self.client.loop.create_task(
+                    periodic_backup(Path(env.str("BACKUP_DIR", "backups")), backup_interval * 60, backup_keep),
+                ),
+            )
+
+    def stop_connection_services(self: Self) -> None:
+        """Stop background work of the process owning the Telegram connection."""
+        for task in self.connection_tasks:
+            task.cancel()
+        self.client.loop.run_until_complete(asyncio.gather(*self.connection_tasks, return_exceptions=True))
+
+    def start_catch_up(self: Self) -> None:
+        """Drop duplicate updates and shrink the backlog delivered after downtime before it is handled."""
+        catch_up.configure(
+            stale_after=env.int("CATCHUP_STALE_AFTER", CATCHUP_STALE_AFTER),
+            backlog=env.int("DISPATCH_BACKLOG", DISPATCH_BACKLOG),
+        )
+        catch_up.install(self.client)
+
+    def bot_listener(self: Self) -> None:
+        """Listen for incoming bot messages and handle them based on the command."""
+        self.start_connection_services()
+        if self.workers:
+            # This process only receives updates, worker processes handle them
+            receiver = UpdateReceiver(
+                self.client,
+                self.workers,
+                run_worker,
+                backlog=env.int("DISPATCH_BACKLOG", DISPATCH_BACKLOG),
+            )
+            self.client.loop.run_until_complete(receiver.start())
+            self.start_catch_up()
+            self.client.run_until_disconnected()
+            self.client.loop.run_until_complete(catch_up.close())
+            self.client.loop.run_until_complete(receiver.close())
+            self.stop_connection_services()
+            logger.info(f"Receiver stats {receiver.stats()}")
+        else:
+            self.add_handlers()
+            self.start_services()
+            self.start_catch_up()
+            # Start listening for incoming bot messages
+            self.client.run_until_disconnected()
+            self.client.loop.run_until_complete(catch_up.close())
+            self.stop_services()
+            self.stop_connection_services()
+        logger.info(f"Catch-up stats {catch_up.stats()}")
+        logger.info(f"Session stats {self.session.stats()}")
         # Log a message when the bot stops running
         logger.info("Stopped!")
+
+
+class TelegramWorker(Telegram):
+    """Worker process handling the commands of the users the receiver routes to it."""
+
+    # Jobs of a user may run in any worker, their changes must reach the worker caching the user
+    default_transport = "auto"
+
+    def __init__(self: Self, socket_path: str, index: int) -> None:
+        """Connect to the receiver instead of Telegram.
+
+        Args:
+            socket_path (str): Socket the receiver listens on.
+            index (int): Number of this worker.
+        """
+        self.index = index
+        self.workers = 0
+        warm_cache_file = env.str("WARM_CACHE_FILE", "")
+        # Every worker caches different users, so each keeps its own snapshot
+        self.warm_cache_file = (
+            Path(warm_cache_file).with_suffix(f".{index}{Path(warm_cache_file).suffix}") if warm_cache_file else None
+        )
+        self.client = WorkerClient(env.int("API_ID"), env.str("API_HASH"))
+        self.client.loop.run_until_complete(self.client.connect_receiver(Path(socket_path), index))
+        self.prepare_client()
+        logger.info(f"Worker {index} connected to the receiver")
+
+    def bot_listener(self: Self) -> None:
+        """Handle updates sent by the receiver until it goes away or the process is asked to stop."""
+        self.add_handlers()
+        self.start_services()
+        serving = self.client.loop.create_task(self.client.serve())
+        for stop_signal in (signal.SIGINT, signal.SIGTERM):
+            self.client.loop.add_signal_handler(stop_signal, serving.cancel)
+        with contextlib.suppress(asyncio.CancelledError):
+            self.client.loop.run_until_complete(serving)
+        self.stop_services()
+        self.client.loop.run_until_complete(self.client.close_receiver())
+        logger.info(f"Worker {self.index} stopped")
+
+
+def run_worker(socket_path: str, index: int) -> None:
+    """Run a worker process, started by the receiver."""
+    TelegramWorker(socket_path, index).bot_listener()
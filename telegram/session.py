@@ -0,0 +1,277 @@
+"""Telethon session kept in memory and flushed to disk periodically."""
+
+import asyncio
+import itertools
+import time
+from collections import OrderedDict
+from typing import Any, Self
+
+from loguru import logger
+from telethon import TelegramClient
+from telethon.sessions import MemorySession, SQLiteSession
+from telethon.sessions.memory import _SentFileType
+from telethon.tl.types import PeerChannel, PeerChat, PeerUser
+from telethon.utils import get_peer_id
+
+# Seconds between two flushes of the session to disk
+SESSION_FLUSH_INTERVAL = 60
+# Number of entities kept in memory, less recently used ones are forgotten until they are seen again
+SESSION_ENTITY_LIMIT = 4096
+
+EntityRow = tuple[int, int, str | None, str | None, str | None]
+# Session file column of each field of an entity row
+ENTITY_COLUMNS = ("id", "hash", "username", "phone", "name")
+
+
+def trim_entity_cache(client: TelegramClient, limit: int = SESSION_ENTITY_LIMIT) -> None:
+    """Keep the bot and half of limit most recently added entities once Telethon's in-memory cache reaches limit.
+
+    Telethon only trims its cache in the update loop of a connected client, so clients fed updates some other way
+    trim it themselves.
+    """
+    entities = client._mb_entity_cache  # noqa: SLF001 Telethon has no public access to its in-memory entity cache
+    if len(entities) < limit:
+        return
+    recent = set(itertools.islice(reversed(entities.hash_map), limit // 2))
+    entities.retain(lambda entity_id: entity_id in recent or entity_id == entities.self_id)
+
+
+class BufferedSession(MemorySession):  # type: ignore[misc]
+    """Session that serves everything from memory and persists to a regular SQLite session file.
+
+    Telethon saves entities and update state as updates arrive. With the default SQLite session that means a disk
+    write on the event loop for most updates. This session keeps the state in memory, writes it to the same file
+    format on a timer from a worker thread, and flushes one last time when the client disconnects.
+
+    Only the ``entity_limit`` most recently used entities are kept in memory, lookups never touch the disk. Others stay
+    in the session file, updates carry the entities they mention, so a forgotten entity is learned again the next
+    time it writes to the bot.
+    """
+
+    def __init__(self: Self, session_id: str, entity_limit: int = SESSION_ENTITY_LIMIT) -> None:
+        """Load a session, creating the file if it doesn't exist yet.
+
+        Args:
+            session_id (str): Session name, the file is ``<session_id>.session`` like for the default session.
+            entity_limit (int): Number of entities kept in memory.
+        """
+        super().__init__()
+        self.save_entities = True
+        self.entity_limit = entity_limit
+        self.hits = 0
+        self.misses = 0
+        self._entity_rows: OrderedDict[int, EntityRow] = OrderedDict()
+        self._pending_entities: dict[int, EntityRow] = {}
+        self._dirty = False
+        disk = SQLiteSession(session_id)
+        self.filename = disk.filename
+        try:
+            self._load(disk)
+        finally:
+            disk.close()
+
+    def _load(self: Self, disk: SQLiteSession) -> None:
+        """Copy everything stored on disk into memory."""
+        self._dc_id = disk.dc_id
+        self._server_address = disk.server_address
+        self._port = disk.port
+        self._auth_key = disk.auth_key
+        self._takeout_id = disk.takeout_id
+        self._update_states = dict(disk.get_update_states())
+        # Telethon's session API has no way to read entity rows or sent files in bulk
+        cursor = disk._cursor()  # noqa: SLF001
+        try:
+            # Most recently seen last, so they are the last to be evicted
+            rows = cursor.execute(
+                f"select {', '.join(ENTITY_COLUMNS)} from entities order by date desc limit ?",  # noqa: S608
+                (self.entity_limit,),
+            ).fetchall()
+            for row in reversed(rows):
+                self._entity_rows[row[0]] = tuple(row)
+            for md5_digest, file_size, file_type, file_id, file_hash in cursor.execute(
+                "select md5_digest, file_size, type, id, hash from sent_files",
+            ):
+                self._files[(md5_digest, file_size, _SentFileType(file_type))] = (file_id, file_hash)
+        finally:
+            cursor.close()
+        logger.debug(f"Loaded session with {len(self._entity_rows)} entities")
+
+    # State changes are only recorded in memory and marked for the next flush
+
+    def set_dc(self: Self, dc_id: int, server_address: str, port: int) -> None:
+        """Set data center and mark the session dirty."""
+        super().set_dc(dc_id, server_address, port)
+        self._dirty = True
+
+    @MemorySession.auth_key.setter  # type: ignore[untyped-decorator]
+    def auth_key(self: Self, value: Any) -> None:
+        """Set auth key and mark the session dirty."""
+        self._auth_key = value
+        self._dirty = True
+
+    @MemorySession.takeout_id.setter  # type: ignore[untyped-decorator]
+    def takeout_id(self: Self, value: Any) -> None:
+        """Set takeout id and mark the session dirty."""
+        self._takeout_id = value
+        self._dirty = True
+
+    def set_update_state(self: Self, entity_id: int, state: Any) -> None:
+        """Set update state and mark the session dirty."""
+        super().set_update_state(entity_id, state)
+        self._dirty = True
+
+    def cache_file(self: Self, md5_digest: bytes, file_size: int, instance: Any) -> None:
+        """Cache sent file and mark the session dirty."""
+        super().cache_file(md5_digest, file_size, instance)
+        self._dirty = True
+
+    def process_entities(self: Self, tlo: Any) -> None:
+        """Remember entities found in tlo, replacing older rows of the same entity."""
+        if not self.save_entities:
+            return
+        for row in self._entities_to_rows(tlo):
+            if self._entity_rows.get(row[0]) != row:
+                self._pending_entities[row[0]] = row
+                self._dirty = True
+            self._remember(row)
+
+    def _remember(self: Self, row: EntityRow) -> None:
+        """Keep row in memory as most recently used entity, evicting the least recently used one when full.
+
+        Evicted rows not flushed yet stay pending until the next flush writes them.
+        """
+        self._entity_rows[row[0]] = row
+        self._entity_rows.move_to_end(row[0])
+        while len(self._entity_rows) > self.entity_limit:
+            self._entity_rows.popitem(last=False)
+
+    # Lookups are served by id from a dict instead of scanning every known entity
+
+    def get_entity_rows_by_id(self: Self, id: int, exact: bool = True) -> tuple[int, int] | None:  # noqa: A002, FBT001, FBT002
+        """Return (id, hash) of an entity."""
+        ids = [id] if exact else [get_peer_id(PeerUser(id)), get_peer_id(PeerChat(id)), get_peer_id(PeerChannel(id))]
+        for entity_id in ids:
+            if row := self._entity_rows.get(entity_id) or self._pending_entities.get(entity_id):
+                self.hits += 1
+                self._remember(row)
+                return row[0], row[1]
+        return self._miss()
+
+    def get_entity_rows_by_phone(self: Self, phone: str) -> tuple[int, int] | None:
+        """Return (id, hash) of an entity by phone."""
+        return self._find_entity_row(3, phone)
+
+    def get_entity_rows_by_username(self: Self, username: str) -> tuple[int, int] | None:
+        """Return (id, hash) of an entity by username."""
+        return self._find_entity_row(2, username)
+
+    def get_entity_rows_by_name(self: Self, name: str) -> tuple[int, int] | None:
+        """Return (id, hash) of an entity by display name."""
+        return self._find_entity_row(4, name)
+
+    def _find_entity_row(self: Self, index: int, value: Any) -> tuple[int, int] | None:
+        """Return (id, hash) of the first entity whose column index has value."""
+        for row in itertools.chain(self._entity_rows.values(), self._pending_entities.values()):
+            if row[index] == value:
+                self.hits += 1
+                self._remember(row)
+                return row[0], row[1]
+        return self._miss()
+
+    def _miss(self: Self) -> None:
+        """Count a lookup of an entity not in memory.
+
+        Lookups run synchronously on the event loop, so entities evicted from memory are not read back from disk.
+        """
+        self.misses += 1
+
+    def stats(self: Self) -> dict[str, Any]:
+        """Return number of entities in memory and hit/miss counters of lookups."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entity_rows),
+            "maxsize": self.entity_limit,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    # Persistence
+
+    def snapshot(self: Self) -> dict[str, Any] | None:
+        """Capture the state to persist and reset the dirty markers, None if nothing changed since last flush.
+
+        Must be called from the event loop thread so the captured state is consistent.
+        """
+        if not self._dirty:
+            return None
+        snapshot = {
+            "dc": (self._dc_id, self._server_address, self._port),
+            "auth_key": self._auth_key,
+            "takeout_id": self._takeout_id,
+            "update_states": list(self._update_states.items()),
+            "entities": list(self._pending_entities.values()),
+            "files": [(*key[:2], key[2].value, *value) for key, value in self._files.items()],
+        }
+        self._pending_entities = {}
+        self._dirty = False
+        return snapshot
+
+    def write(self: Self, snapshot: dict[str, Any]) -> None:
+        """Write a snapshot into the session file. Safe to call from a worker thread."""
+        started = time.monotonic()
+        disk = SQLiteSession(self.filename)
+        try:
+            if snapshot["dc"][0]:
+                disk.set_dc(*snapshot["dc"])
+            disk.auth_key = snapshot["auth_key"]
+            disk.takeout_id = snapshot["takeout_id"]
+            for entity_id, state in snapshot["update_states"]:
+                disk.set_update_state(entity_id, state)
+            # Telethon's session API has no way to write entity rows or sent files in bulk
+            cursor = disk._cursor()  # noqa: SLF001
+            try:
+                now = int(time.time())
+                cursor.executemany(
+                    "insert or replace into entities values (?,?,?,?,?,?)",
+                    [(*row, now) for row in snapshot["entities"]],
+                )
+                cursor.executemany("insert or replace into sent_files values (?,?,?,?,?)", snapshot["files"])
+            finally:
+                cursor.close()
+            disk.save()
+        finally:
+            disk.close()
+        logger.debug(
+            f"Flushed session with {len(snapshot['entities'])} new entities in {time.monotonic() - started:.3f}s",
+        )
+
+    def flush(self: Self) -> None:
+        """Persist pending changes right away."""
+        if snapshot := self.snapshot():
+            self.write(snapshot)
+
+    async def flush_periodically(self: Self, interval: int = SESSION_FLUSH_INTERVAL) -> None:
+        """Persist pending changes every interval seconds without blocking the event loop."""
+        while True:
+            await asyncio.sleep(interval)
+            if snapshot := self.snapshot():
+                try:
+                    await asyncio.to_thread(self.write, snapshot)
+                except Exception as e:  # noqa: BLE001
+                    logger.error(f"Unable to flush session {e}")
+                    self._dirty = True
+                    self._pending_entities = {row[0]: row for row in snapshot["entities"]} | self._pending_entities
+
+    def close(self: Self) -> None:
+        """Flush everything when the client disconnects."""
+        self.flush()
+
+    def save(self: Self) -> None:
+        """Telethon calls this often, persistence happens in flushes instead."""
+
+    def delete(self: Self) -> None:
+        """Forget the session, including the file on disk."""
+        disk = SQLiteSession(self.filename)
+        disk.close()
+        disk.delete()
@@ -11,8 +11,14 @@ processing_request = "Processing request."
 invalid_page_size = "Invalid value for page size."
 page_size_updated = "Page size successfully updated."
 no_result = "No result."
+request_timed_out = "Request took too long and was cancelled. Please try again later."
+too_many_requests = "Too many requests. Please wait a moment before trying again."
+slow_down = "Slow down."
+no_recent_secrets = "No recently used secrets yet. Try /get <filter>."
 ignore = "Ignoring request. 💤💤💤."
 cleanup_success = "Gone.🧹"
 no_export = "Nothing to export."
+job_cancelled = "Request cancelled."
+no_jobs = "No queued or running requests."
 command_not_found = "Command not found. Must've gone on vacation! 🏖️ Try another one!"
 docs_not_found = "Docs not found. Must've gone on vacation! 🏖️ Try another one!"
@@ -27,8 +27,7 @@ async def modify_page_size(
             raise ValueError
 
         user_settings[UserSettings.PAGE_SIZE.value] = str(page_size)
-        user.settings = user_settings
-        await user.asave()
+        await User.objects.update_settings(user, user_settings)
         await event.reply(page_size_updated)
     except ValueError:
         await event.reply(invalid_page_size)
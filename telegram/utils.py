@@ -1,35 +1,40 @@
 """Utility functions."""
 
+import asyncio
+import copy
+import hashlib
 import json
 import operator
-import os
+import re
+import tempfile
+from datetime import UTC, datetime
 from enum import Enum
 from functools import reduce
 from pathlib import Path
-from shutil import rmtree
-from typing import Any, Self
+from typing import IO, Any, Self
 from urllib.parse import quote_plus
-from zipfile import ZipFile
+from zipfile import ZipFile, ZipInfo
 
 import pyotp
-import qrcode
 from django.db.models import Q
 from django.utils.translation import gettext as _
 from loguru import logger
-from qrcode.image.styledpil import StyledPilImage
-from qrcode.image.styles.colormasks import VerticalGradiantColorMask
-from qrcode.image.styles.moduledrawers import HorizontalBarsDrawer
 from telethon import events, types
+from telethon.errors import FileReferenceExpiredError
 from telethon.extensions import markdown
 from telethon.tl.types import User as TelegramUser
 
-from sqlitedb.models import Secret, User
+from sqlitedb.invalidation import InvalidationKind, invalidation_bus
+from sqlitedb.models import Secret, SecretView, User, secret_versions
+from telegram import strings
+from telegram.cache import DiskCache, LRUCache
 from telegram.commands.add import add_usage
 from telegram.commands.adduri import adduri_usage
 from telegram.commands.addurifile import addurifile_usage
 from telegram.commands.export import export_usage
 from telegram.commands.exportqr import exportqr_usage
-from telegram.commands.help import help_usage
+from telegram.commands.help import help_message, help_usage
+from telegram.commands.jobs import jobs_usage
 from telegram.commands.list import list_usage
 from telegram.commands.reset import reset_usage
 from telegram.commands.rm import rm_usage
@@ -37,13 +42,51 @@ from telegram.commands.settings import settings_usage
 from telegram.commands.start import start_usage
 from telegram.commands.temp import temp_usage
 from telegram.commands.total import total_usage
+from telegram.dispatcher import concurrently, dispatcher
 from telegram.exceptions import DuplicateSecretError, FileProcessFailError, InvalidSecretError, TGOtpError
+from telegram.qr import render_qr, start_render_pool
+from telegram.ratelimit import rate_limiter
 from telegram.strings import added_secret, no_input
 from totp.totp import OTP
 
 # Number of records per page
 PAGE_SIZE = 10
 MIN_PAGE_SIZE = 1
+# Number of users kept in the in-process user cache
+USER_CACHE_SIZE = 4096
+# Seconds a cached user is trusted before it is fetched again
+USER_CACHE_TTL = 300
+# Folder and total size of the rendered QR code cache
+QR_CACHE_DIR = "qrcache"
+QR_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Identifies the look of rendered QR codes, change it whenever render_qr changes so cached images are not reused
+QR_STYLE = "v1:ERROR_CORRECT_L:HorizontalBarsDrawer:VerticalGradiantColorMask"
+# Timestamp of every file inside exported zip archives
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+# Number of uploaded export files remembered for reuse
+UPLOAD_CACHE_SIZE = 1024
+# Number of rendered /list pages kept in memory
+PAGE_CACHE_SIZE = 1024
+# Seconds a rendered /list page is reused
+PAGE_CACHE_TTL = 600
+# Number of records streamed per chunk while exporting
+EXPORT_CHUNK_SIZE = 1000
+# Number of secrets imported between two yields to interactive handlers
+IMPORT_CHUNK_SIZE = 50
+# Days for which tombstones of deleted secrets are kept for delta exports
+TOMBSTONE_RETENTION_DAYS = 90
+# Bytes of a sent or received file kept in memory before it spills to a private temporary file
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+
+user_cache: LRUCache[int, User] = LRUCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+qr_cache = DiskCache(Path(QR_CACHE_DIR), max_bytes=QR_CACHE_MAX_BYTES, suffix=".png")
+# Uploaded files keyed by telegram id, secrets version and content hash
+upload_cache: LRUCache[tuple[int, int, str], Any] = LRUCache(maxsize=UPLOAD_CACHE_SIZE)
+invalidation_bus.subscribe(InvalidationKind.USER, user_cache.invalidate)
+upload_bytes_saved = 0
+# Telegram ids allowed to act on every user's jobs, filled from ADMIN_IDS at startup
+admin_ids: set[int] = set()
 
 
 class CustomMarkdown:
@@ -51,7 +94,17 @@ class CustomMarkdown:
 
     @staticmethod
     def parse(text: str) -> Any:
-        """Parse."""
+        """Parse.
+
+        Static replies registered with ``register_static_replies`` are served pre-parsed.
+        """
+        if (parsed := static_replies.get(text)) is not None:
+            return parsed[0], list(parsed[1])
+        return CustomMarkdown.parse_text(text)
+
+    @staticmethod
+    def parse_text(text: str) -> Any:
+        """Parse text with the markdown parser."""
         text, entities = markdown.parse(text)
         for i, e in enumerate(entities):
             if isinstance(e, types.MessageEntityTextUrl):
@@ -72,6 +125,84 @@ class CustomMarkdown:
         return markdown.unparse(text, entities)
 
 
+# Pre-parsed (text, entities) of static replies, keyed by their markdown source
+static_replies: dict[str, tuple[str, list[Any]]] = {}
+
+
+def register_static_replies(*texts: str) -> None:
+    """Parse static replies once so sending them costs no markdown parsing."""
+    for text in texts:
+        static_replies[text] = CustomMarkdown.parse_text(text)
+
+
+def utf16_len(text: str) -> int:
+    """Return length of text in UTF-16 code units, the unit of telegram entity offsets."""
+    return len(text.encode("utf-16-le")) // 2
+
+
+class MarkdownTemplate(object):
+    """Markdown message with ``{name}`` placeholders, parsed once.
+
+    Formatting substitutes the values into the parsed text and shifts the entity offsets accordingly, so no markdown
+    parsing happens per message. Values are inserted verbatim, markdown inside them is not interpreted.
+    """
+
+    placeholder = re.compile(r"\{(\w+)\}")
+
+    def __init__(self: Self, template: str) -> None:
+        self.text, self.entities = CustomMarkdown.parse_text(template)
+        self._fields = [
+            (
+                match.group(1),
+                utf16_len(self.text[: match.start()]),
+                utf16_len(match.group(0)),
+                match.start(),
+                match.end(),
+            )
+            for match in self.placeholder.finditer(self.text)
+        ]
+
+    def format(self: Self, **values: Any) -> tuple[str, list[Any]]:
+        """Return (text, entities) with placeholders replaced by values."""
+        pieces = []
+        shifts = []
+        last = 0
+        for name, offset, length, start, end in self._fields:
+            value = str(values[name])
+            pieces.append(self.text[last:start])
+            pieces.append(value)
+            shifts.append((offset, length, utf16_len(value) - length))
+            last = end
+        pieces.append(self.text[last:])
+        entities = []
+        for entity in self.entities:
+            shifted = copy.copy(entity)
+            for offset, length, delta in shifts:
+                if offset + length <= entity.offset:
+                    shifted.offset += delta
+                elif entity.offset <= offset and offset + length <= entity.offset + entity.length:
+                    shifted.length += delta
+            # Entities around empty values vanish
+            if shifted.length > 0:
+                entities.append(shifted)
+        return "".join(pieces), entities
+
+
+def join_parsed(*parts: tuple[str, list[Any]]) -> tuple[str, list[Any]]:
+    """Concatenate (text, entities) pairs into one message."""
+    text = ""
+    entities = []
+    offset = 0
+    for part_text, part_entities in parts:
+        for entity in part_entities:
+            shifted = copy.copy(entity)
+            shifted.offset += offset
+            entities.append(shifted)
+        text += part_text
+        offset += utf16_len(part_text)
+    return text, entities
+
+
 # Define a list of supported commands
 class SupportedCommands(Enum):
     """Enum for supported commands."""
@@ -90,6 +221,7 @@ class SupportedCommands(Enum):
     RM = "/rm"
     EXPORTQR = "/exportqr"
     HELP = "/help"
+    JOBS = "/jobs"
 
     @classmethod
     def get_values(cls: Any) -> list[str]:
@@ -121,15 +253,27 @@ async def get_telegram_user(event: events.NewMessage.Event) -> TelegramUser:
     -------
         User: The User entity associated with the message event.
     """
+    # Entities delivered along with the update, no request needed
+    if (user := event.sender) is not None:
+        return user
     try:
-        # Get the user entity from the peer ID of the message event, Uses cache
-        user: TelegramUser = await event.client.get_entity(event.peer_id)
+        # Get the user entity from the peer ID of the message event, served by the bounded session cache
+        user = await event.client.get_entity(event.peer_id)
     except (ValueError, AttributeError):
         logger.debug("Couldn't get user from cache. Invalid Peer ID")
         user = await event.get_sender()
     return user
 
 
+def cache_stats() -> dict[str, dict[str, Any]]:
+    """Return size and hit rate of the in-process caches."""
+    return {
+        "users": user_cache.stats(),
+        "qr": qr_cache.stats(),
+        "uploads": {**upload_cache.stats(), "bytes_saved": upload_bytes_saved},
+    }
+
+
 def get_regex() -> str:
     """Generate a regex pattern that matches any message that is not a supported command.
 
@@ -171,6 +315,38 @@ class UserSettings(Enum):
         return self._description_
 
 
+class UserState(Enum):
+    """Internal per user state kept in ``User.settings``. These are not user editable settings."""
+
+    LAST_EXPORT = "last_export"
+
+    def __str__(self: Self) -> str:
+        """Returns a string representation."""
+        return str(self.value)
+
+
+def parse_export_since(since: str, user_settings: dict[str, str]) -> datetime | None:
+    """Parse the ``since:<timestamp|last>`` argument of export.
+
+    Args:
+        since (str): Value after ``since:``. Either ``last`` or an ISO 8601 timestamp.
+        user_settings (dict): The user's settings dictionary holding the export watermark.
+
+    Returns
+    -------
+        datetime | None: Lower bound for the delta export, None if everything should be exported.
+
+    Raises
+    ------
+        ValueError: If the timestamp is invalid.
+    """
+    if since == "last":
+        last_export = user_settings.get(UserState.LAST_EXPORT.value)
+        return datetime.fromisoformat(last_export) if last_export else None
+    parsed = datetime.fromisoformat(since)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=UTC)
+
+
 def parse_secret(secret_string: str) -> dict[str, str]:
     """Parse Secret."""
     # Split the input string into key-value pairs
@@ -219,7 +395,9 @@ async def bulk_add_secret_data(
     """Add secret data."""
     import_status = {"invalid": 0, "duplicate": 0, "success": 0}
     failed_secrets: dict[str, list[dict[str, str]]] = {"invalid": [], "duplicate": []}
-    for secret_data in secrets:
+    for index, secret_data in enumerate(secrets, start=1):
+        if index % IMPORT_CHUNK_SIZE == 0:
+            await dispatcher.yield_to_interactive()
         try:
             await add_secret_data(secret_data, user)
             import_status["success"] += 1
@@ -229,30 +407,54 @@ async def bulk_add_secret_data(
     return import_status, failed_secrets
 
 
-async def get_uri_file_from_message(event: events.NewMessage.Event) -> str:
-    """Get file from message."""
-    # Define a prefix for the image URL
-    temp_file = await event.message.download_media()
-    if not temp_file and event.message.is_reply:
-        logger.debug("Checking replied message for file.")
-        replied_msg = await event.message.get_reply_message()
-        temp_file = await replied_msg.download_media()
-    if not temp_file:
-        raise FileNotFoundError
-    return str(temp_file)
+class SpooledFile(tempfile.SpooledTemporaryFile):  # type: ignore[type-arg]
+    """Named binary file kept in memory until it grows past ``SPOOL_MAX_SIZE``, then moved to a private temporary file.
+
+    Telegram takes the file name of sent files from ``name``. Nothing is left on disk once the file is closed.
+    """
+
+    def __init__(self: Self, name: str, max_size: int = SPOOL_MAX_SIZE) -> None:
+        """Create a new empty file.
 
+        Args:
+            name (str): File name shown to the user.
+            max_size (int): Bytes kept in memory before spilling to disk.
+        """
+        super().__init__(max_size=max_size, mode="w+b")
+        self.file_name = name
+
+    @property
+    def name(self: Self) -> str:
+        """Return the file name shown to the user."""
+        return self.file_name
 
-def process_uri_file(temp_file: str) -> list[str]:
+
+async def get_uri_file_from_message(event: events.NewMessage.Event) -> SpooledFile:
+    """Download the file of the message, or of the message it replies to, straight into memory."""
+    uri_file = SpooledFile("uris.txt")
+    try:
+        if not await event.message.download_media(file=uri_file) and event.message.is_reply:
+            logger.debug("Checking replied message for file.")
+            replied_msg = await event.message.get_reply_message()
+            await replied_msg.download_media(file=uri_file)
+        if not uri_file.tell():
+            raise FileNotFoundError
+    except BaseException:
+        # Also when the download is cancelled because fetching the user failed
+        uri_file.close()
+        raise
+    return uri_file
+
+
+def process_uri_file(uri_file: IO[bytes]) -> list[str]:
     """Process URI file."""
     try:
-        with Path(temp_file).open() as uri_file:
-            uris = [uri.strip() for uri in uri_file]
-    except TGOtpError as e:
+        uri_file.seek(0)
+        uris = [uri.decode().strip() for uri in uri_file]
+    except (TGOtpError, UnicodeDecodeError) as e:
         raise FileProcessFailError from e
     else:
         return uris
-    finally:
-        Path(temp_file).unlink()
 
 
 def extract_secret_from_uri(
@@ -270,18 +472,43 @@ def extract_secret_from_uri(
     return secrets, failed
 
 
-def import_failure_output_file(import_failures: dict[str, list[dict[str, str]]]) -> str:
+def import_failure_output_file(import_failures: dict[str, list[dict[str, str]]]) -> SpooledFile:
     """Prepare failed record file."""
-    output_file = "output-data.json"
-    with Path(output_file).open("w", encoding="utf-8") as f:
-        json.dump(import_failures, f, ensure_ascii=False, indent=2)
+    output_file = SpooledFile("output-data.json")
+    output_file.write(json.dumps(import_failures, ensure_ascii=False, indent=2).encode())
+    output_file.seek(0)
     return output_file
 
 
+def is_admin(telegram_id: int) -> bool:
+    """Return whether the user with telegram id is a bot admin."""
+    return telegram_id in admin_ids
+
+
+def get_telegram_id(event: events.NewMessage.Event) -> int:
+    """Get telegram id of the sender without any network or DB round trip."""
+    return int(event.sender_id)
+
+
 async def get_user(event: events.NewMessage.Event) -> User:
-    """Get out user from telegram user."""
-    telegram_user: TelegramUser = await get_telegram_user(event)
-    return await User.objects.get_user(telegram_user=telegram_user)
+    """Get out user from telegram user.
+
+    Users are served from an in-process cache keyed by telegram id, so a hit needs neither the entity lookup nor the
+    database. On a miss the entity, only needed to create new users, is looked up while the database is queried.
+    """
+    telegram_id = get_telegram_id(event)
+    if (user := user_cache.get(telegram_id)) is not None:
+        return user
+    telegram_user, user = await concurrently(
+        get_telegram_user(event),
+        User.objects.filter(telegram_id=telegram_id).afirst(),
+    )
+    if user is None:
+        user = await User.objects.get_user(telegram_user=telegram_user)
+    user_cache.set(telegram_id, user)
+    # Users blocked since the last reload of blocked users are rejected from their next update on
+    rate_limiter.record_status(telegram_id, user.status)
+    return user
 
 
 def or_filters(filters: dict[str, Any]) -> list[Any]:
@@ -295,63 +522,126 @@ def or_filters(filters: dict[str, Any]) -> list[Any]:
 
 def prepare_user_filter(user: User) -> dict[str, Any]:
     """Prepare queryset fileter for user."""
-    return {"user__in": [user]}
-
-
-def create_qr(uris: dict[str, Secret], zip_file_name: str) -> Path:
-    """Create qr image from uris list."""
-    folder_name = "qrexports/"
-    for uri, secret in uris.items():
-        qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_L)
-        qr.add_data(uri)
-        qr_code = qr.make_image(
-            image_factory=StyledPilImage,
-            module_drawer=HorizontalBarsDrawer(),
-            color_mask=VerticalGradiantColorMask(),
-        )
-        file_name = f"{secret.id}_{quote_plus(secret.issuer)}_{quote_plus(secret.account_id)}.png"
-        qr_code.save(
-            f"{folder_name}/{file_name}",
-        )
-    if not uris:
-        visible_files = [file for file in Path(folder_name).iterdir() if not file.name.startswith(".")]
-        return visible_files[0]
-    zip_name = f"{zip_file_name}.zip"
-    # Create object of ZipFile
-    with ZipFile(zip_name, "w") as zip_object:
-        # Traverse all files in directory
-        for foldername, _sub_folders, file_names in os.walk(folder_name):
-            for filename in file_names:
-                file_path = Path(foldername, filename)
-                zip_object.write(file_path, Path(file_path).name)
-    all_files(Path(folder_name))
-    return Path(zip_name)
-
-
-def all_files(folder_name: Path) -> None:
-    """Delete all files from given folder."""
-    for path in Path(folder_name).glob("**/*"):
-        if path.is_file() and path.name != "README.md":
-            path.unlink()
-        elif path.is_dir():
-            rmtree(path)
+    return {"user": user}
+
+
+def prepare_telegram_user_filter(telegram_id: int) -> dict[str, Any]:
+    """Prepare queryset filter for the user with given telegram id, resolved with a join."""
+    return {"user__telegram_id": telegram_id}
+
+
+async def create_qr(uris: dict[str, Secret | SecretView], zip_file_name: str, telegram_id: int) -> SpooledFile:
+    """Create a zip archive of qr images for uris of a user.
+
+    Images are rendered out of the event loop by the render pool.
+    """
+    pngs = await get_qr_pngs(list(uris), telegram_id)
+    files = sorted(
+        (f"{secret.id}_{quote_plus(secret.issuer)}_{quote_plus(secret.account_id)}.png", png)
+        for secret, png in zip(uris.values(), pngs, strict=True)
+    )
+    zip_file = SpooledFile(f"{zip_file_name}.zip")
+    with ZipFile(zip_file, "w") as zip_object:
+        for file_name, png in files:
+            # Fixed timestamp keeps the archive identical for identical secrets, so its upload can be reused
+            zip_object.writestr(ZipInfo(file_name, date_time=ZIP_DATE_TIME), png)
+    zip_file.seek(0)
+    return zip_file
+
+
+async def get_qr_pngs(uris: list[str], telegram_id: int) -> list[bytes]:
+    """Return PNG bytes of the QR codes for uris of a user.
+
+    Cached images are read in a thread, the others are rendered in parallel by the render pool and cached with the
+    user's other images. Images are keyed by their URI, so changed secrets get new ones.
+    """
+    group = str(telegram_id)
+    keys = [DiskCache.key(uri, QR_STYLE) for uri in uris]
+    pngs = await asyncio.to_thread(qr_cache.get_many, group, keys)
+    missing = [index for index, png in enumerate(pngs) if png is None]
+    loop = asyncio.get_running_loop()
+    pool = start_render_pool()
+    rendered = await asyncio.gather(*(loop.run_in_executor(pool, render_qr, uris[index]) for index in missing))
+    for index, png in zip(missing, rendered, strict=True):
+        pngs[index] = png
+    rendered_keys = [keys[index] for index in missing]
+    await asyncio.to_thread(qr_cache.set_many, group, dict(zip(rendered_keys, rendered, strict=True)))
+    return pngs  # type: ignore[return-value]
+
+
+async def discard_qr_pngs(telegram_id: int, uris: list[str] | None = None) -> None:
+    """Drop cached QR codes of a user, only those of uris if given. Call it once the secrets they encode are deleted."""
+    group = str(telegram_id)
+    if uris is None:
+        await asyncio.to_thread(qr_cache.discard_group, group)
+    else:
+        await asyncio.to_thread(qr_cache.discard, group, [DiskCache.key(uri, QR_STYLE) for uri in uris])
+
+
+async def reply_with_file(event: events.NewMessage.Event, message: str, file: SpooledFile) -> None:
+    """Reply with a file, reusing an earlier upload if the user was already sent the same content.
+
+    Uploads are remembered per user and secrets version, so any change to the user's secrets invalidates them.
+
+    Args:
+        event (events.NewMessage.Event): The event to reply to.
+        message (str): Caption of the file.
+        file (SpooledFile): Named binary file to send.
+    """
+    global upload_bytes_saved  # noqa: PLW0603
+    telegram_id = get_telegram_id(event)
+    file.seek(0)
+    digest = hashlib.file_digest(file, "sha256").hexdigest()
+    size = file.tell()
+    file.seek(0)
+    key = (telegram_id, secret_versions.get(telegram_id), digest)
+    if (uploaded := upload_cache.get(key)) is not None:
+        try:
+            await event.reply(message=message, file=uploaded)
+        except FileReferenceExpiredError:
+            logger.debug("Uploaded file reference expired, uploading again")
+            upload_cache.invalidate(key)
+        else:
+            upload_bytes_saved += size
+            return
+    sent = await event.reply(message=message, file=file)
+    if uploaded := sent.document or sent.photo:
+        upload_cache.set(key, uploaded)
+
+
+command_usages = {
+    "add": add_usage(),
+    "adduri": adduri_usage(),
+    "addurifile": addurifile_usage(),
+    "export": export_usage(),
+    "exportqr": exportqr_usage(),
+    "help": help_usage(),
+    "jobs": jobs_usage(),
+    "list": list_usage(),
+    "reset": reset_usage(),
+    "rm": rm_usage(),
+    "settings": settings_usage(),
+    "start": start_usage(),
+    "temp": temp_usage(),
+    "total": total_usage(),
+}
 
 
 def command_help(command: str) -> str:
     """Return func for command helper."""
-    mapper = {
-        "add": add_usage(),
-        "adduri": adduri_usage(),
-        "addurifile": addurifile_usage(),
-        "export": export_usage(),
-        "exportqr": exportqr_usage(),
-        "help": help_usage(),
-        "list": list_usage(),
-        "reset": reset_usage(),
-        "rm": rm_usage(),
-        "settings": settings_usage(),
-        "start": start_usage(),
-        "temp": temp_usage(),
-        "total": total_usage(),
-    }
-    return mapper[command]
+    return command_usages[command]
+
+
+def static_reply_texts() -> list[str]:
+    """Return markdown source of every static reply of the bot."""
+    return [
+        *(value for name, value in vars(strings).items() if not name.startswith("_") and isinstance(value, str)),
+        *command_usages.values(),
+        help_message,
+    ]
+
+
+def preparse_static_replies() -> None:
+    """Parse every static reply of the bot once at startup, skipping ones restored from a warm cache snapshot."""
+    register_static_replies(*(text for text in static_reply_texts() if text not in static_replies))
+    logger.debug(f"Pre-parsed {len(static_replies)} static replies")
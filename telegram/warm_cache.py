@@ -0,0 +1,112 @@
+"""Snapshot of hot in-memory state carried across restarts."""
+
+import json
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+from loguru import logger
+from telethon.extensions import BinaryReader
+from telethon.tl.alltlobjects import LAYER
+
+from sqlitedb.models import User
+from telegram.utils import static_replies, static_reply_texts, user_cache
+
+# Format of the snapshot file, bump it whenever its content changes
+WARM_CACHE_VERSION = 2
+# Seconds after which a snapshot is considered too old to be loaded
+WARM_CACHE_MAX_AGE = 24 * 60 * 60
+# Number of most recently active users kept in the snapshot
+WARM_CACHE_SIZE = 1000
+
+
+def _tl_to_hex(tl_object: Any) -> str:
+    return bytes(tl_object).hex()
+
+
+def _tl_from_hex(data: str) -> Any:
+    with BinaryReader(bytes.fromhex(data)) as reader:
+        return reader.tgread_object()
+
+
+def save_warm_cache(path: Path, size: int = WARM_CACHE_SIZE) -> None:
+    """Write the hot part of the in-process caches to path.
+
+    Only telegram ids of recently active users are stored, the users themselves are fetched again on load. Parsed
+    static replies are stored in Telegram's own serialization. Entities are kept by the session file already.
+
+    Args:
+        path (Path): Snapshot file.
+        size (int): Number of most recently used users to keep.
+    """
+    static_texts = set(static_reply_texts())
+    snapshot = {
+        "version": WARM_CACHE_VERSION,
+        "layer": LAYER,
+        "created": time.time(),
+        "users": [telegram_id for telegram_id, _ in user_cache.items()[:size]],
+        "static_replies": [
+            [source, text, [_tl_to_hex(entity) for entity in entities]]
+            for source, (text, entities) in static_replies.items()
+            if source in static_texts
+        ],
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Temporary files are private, which suits a snapshot holding access hashes
+    with tempfile.NamedTemporaryFile("w", dir=path.parent, delete=False) as temp_file:
+        json.dump(snapshot, temp_file)
+    Path(temp_file.name).replace(path)
+    logger.info(
+        f"Saved warm cache with {len(snapshot['users'])} users and "
+        f"{len(snapshot['static_replies'])} static replies",
+    )
+
+
+def load_warm_cache(path: Path, max_age: float = WARM_CACHE_MAX_AGE) -> bool:
+    """Fill the in-process caches from a snapshot written by ``save_warm_cache``.
+
+    Snapshots of another format or Telegram layer, older than max_age or unreadable are ignored. Static replies whose
+    source text changed since the snapshot are skipped and parsed again as usual.
+
+    Args:
+        path (Path): Snapshot file.
+        max_age (float): Seconds after which a snapshot is ignored.
+
+    Returns
+    -------
+        bool: Whether the snapshot was loaded.
+    """
+    try:
+        snapshot = json.loads(path.read_text())
+    except FileNotFoundError:
+        return False
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable warm cache {e}")
+        return False
+    if snapshot.get("version") != WARM_CACHE_VERSION or snapshot.get("layer") != LAYER:
+        logger.info("Ignoring warm cache of another version")
+        return False
+    if time.time() - snapshot.get("created", 0) > max_age:
+        logger.info("Ignoring stale warm cache")
+        return False
+    try:
+        static_texts = set(static_reply_texts())
+        for source, text, entities in snapshot["static_replies"]:
+            if source in static_texts:
+                static_replies[source] = (text, [_tl_from_hex(entity) for entity in entities])
+        users = {user.telegram_id: user for user in User.objects.filter(telegram_id__in=snapshot["users"])}
+        # Oldest first so the most recently used entries end up most recent again
+        for telegram_id in reversed(snapshot["users"]):
+            if telegram_id in users:
+                user_cache.set(telegram_id, users[telegram_id])
+    except Exception as e:  # noqa: BLE001
+        logger.warning(f"Ignoring invalid warm cache {e}")
+        static_replies.clear()
+        user_cache.clear()
+        return False
+    logger.info(
+        f"Loaded warm cache with {len(user_cache)} users and "
+        f"{len(static_replies)} static replies",
+    )
+    return True
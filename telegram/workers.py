@@ -0,0 +1,427 @@
+"""Receiver and worker processes sharing a single Telegram connection."""
+
+import asyncio
+import contextlib
+import itertools
+import json
+import multiprocessing
+import shutil
+import tempfile
+from collections import deque
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any, Self
+
+from loguru import logger
+from telethon import TelegramClient, errors, utils
+from telethon.errors import RPCError
+from telethon.extensions import BinaryReader
+from telethon.sessions import MemorySession
+from telethon.tl.tlobject import TLObject, TLRequest
+from telethon.tl.types import User as TelegramUser
+
+from telegram.dispatcher import DISPATCH_BACKLOG, update_key
+from telegram.session import trim_entity_cache
+
+# Seconds between two checks that every worker process is still alive
+WORKER_CHECK_INTERVAL = 5
+# Seconds a worker process gets to finish after being asked to stop
+WORKER_STOP_TIMEOUT = 30
+# Bytes of the length prefix of every frame
+FRAME_HEADER_SIZE = 4
+
+
+def _tl_from_bytes(data: bytes) -> Any:
+    with BinaryReader(data) as reader:
+        return reader.tgread_object()
+
+
+def write_frame(writer: asyncio.StreamWriter, header: dict[str, Any], blobs: list[bytes] | None = None) -> None:
+    """Write a message made of a JSON header and Telegram objects in Telegram's own serialization.
+
+    Nothing received is ever unpickled, so a worker can't make the receiver run code and the other way round.
+    """
+    parts = [json.dumps(header).encode(), *(blobs or [])]
+    writer.write(len(parts).to_bytes(FRAME_HEADER_SIZE, "big"))
+    for part in parts:
+        writer.write(len(part).to_bytes(FRAME_HEADER_SIZE, "big"))
+        writer.write(part)
+
+
+async def read_frame(reader: asyncio.StreamReader) -> tuple[dict[str, Any], list[bytes]]:
+    """Read a message written by ``write_frame``.
+
+    Raises
+    ------
+        asyncio.IncompleteReadError: If the other side closed the connection.
+    """
+    count = int.from_bytes(await reader.readexactly(FRAME_HEADER_SIZE), "big")
+    parts = [
+        await reader.readexactly(int.from_bytes(await reader.readexactly(FRAME_HEADER_SIZE), "big"))
+        for _ in range(count)
+    ]
+    return json.loads(parts[0]), parts[1:]
+
+
+def _encode_result(result: Any) -> tuple[dict[str, Any], list[bytes]]:
+    """Split the result of a request into a header and serialized objects."""
+    if isinstance(result, TLObject):
+        return {"tl": "object"}, [bytes(result)]
+    if isinstance(result, list) and result and all(isinstance(item, TLObject) for item in result):
+        return {"tl": "list"}, [bytes(item) for item in result]
+    # Bools, numbers and vectors of numbers
+    return {"value": result}, []
+
+
+def _decode_result(header: dict[str, Any], blobs: list[bytes]) -> Any:
+    if header.get("tl") == "object":
+        return _tl_from_bytes(blobs[0])
+    if header.get("tl") == "list":
+        return [_tl_from_bytes(blob) for blob in blobs]
+    return header["value"]
+
+
+def _encode_error(error: Exception) -> dict[str, Any]:
+    """Describe an error raised by a request, so the worker can raise the same one."""
+    if isinstance(error, RPCError):
+        # Arguments after the request, e.g. the seconds of a flood wait
+        error_type, arguments = error.__reduce__()[:2]
+        return {"error": error_type.__name__, "arguments": list(arguments[1:])}
+    return {"error": None, "message": str(error)}
+
+
+def _decode_error(header: dict[str, Any], request: Any) -> Exception:
+    error_type = getattr(errors, header["error"] or "", None)
+    if isinstance(error_type, type) and issubclass(error_type, RPCError):
+        error: Exception = error_type(request, *header["arguments"])
+        return error
+    return ConnectionError(f"Request failed in the receiver {header.get('message')}")
+
+
+class RemoteSender(object):
+    """Stands for a connection to another data center, which only exists in the receiver."""
+
+    def __init__(self: Self, dc_id: int) -> None:
+        self.dc_id = dc_id
+
+
+class WorkerClient(TelegramClient):  # type: ignore[misc]
+    """Client of a worker process.
+
+    It never connects to Telegram. Updates are read from the receiver and every request is sent to the receiver,
+    which makes it on its own connection and sends back the result. Everything else, from building events to
+    uploading files, works like for a regular client.
+    """
+
+    def __init__(self: Self, api_id: int, api_hash: str) -> None:
+        super().__init__(MemorySession(), api_id, api_hash)
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._calls: dict[int, asyncio.Future[tuple[dict[str, Any], list[bytes]]]] = {}
+        self._call_ids = itertools.count()
+
+    async def connect_receiver(self: Self, path: Path, index: int) -> None:
+        """Connect to the receiver listening on path and take over its data center and bot identity."""
+        self._reader, self._writer = await asyncio.open_unix_connection(str(path))
+        write_frame(self._writer, {"type": "hello", "index": index})
+        await self._writer.drain()
+        ready, _ = await read_frame(self._reader)
+        self.session.set_dc(ready["dc_id"], ready["server_address"], ready["port"])
+        self._mb_entity_cache.set_self_user(ready["self_id"], ready["bot"], ready["access_hash"])
+
+    def is_connected(self: Self) -> bool:
+        """Return whether the receiver connection is open."""
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def serve(self: Self) -> None:
+        """Handle updates and results sent by the receiver until it closes the connection."""
+        try:
+            while True:
+                header, blobs = await read_frame(self._reader)  # type: ignore[arg-type]
+                if header["type"] == "update":
+                    await self._receive_update(blobs)
+                elif future := self._calls.get(header["id"]):
+                    future.set_result((header, blobs))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            logger.info("Receiver closed the connection")
+        finally:
+            self._writer.close()  # type: ignore[union-attr]
+            for future in self._calls.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Receiver closed the connection"))
+
+    async def _receive_update(self: Self, blobs: list[bytes]) -> None:
+        """Learn the entities shipped with an update and hand the update to the event handlers."""
+        update, *entities = (_tl_from_bytes(blob) for blob in blobs)
+        users = [entity for entity in entities if isinstance(entity, TelegramUser)]
+        chats = [entity for entity in entities if not isinstance(entity, TelegramUser)]
+        # Kept in Telethon's in-memory cache only, the session would keep every entity ever seen
+        self._mb_entity_cache.extend(users, chats)
+        trim_entity_cache(self)
+        # Telethon's events read the entities of an update from this private attribute
+        update._entities = {utils.get_peer_id(entity): entity for entity in entities}  # noqa: SLF001
+        # Replaced by the dispatcher, which only queues the update, so reading goes on right away
+        await self._dispatch_update(update)
+
+    async def _call(
+        self: Self,
+        sender: Any,
+        request: Any,
+        ordered: bool = False,  # noqa: FBT001, FBT002
+        flood_sleep_threshold: int | None = None,
+    ) -> Any:
+        """Make request through the receiver."""
+        is_list = utils.is_list_like(request)
+        requests = list(request) if is_list else [request]
+        for item in requests:
+            if not isinstance(item, TLRequest):
+                msg = "You can only invoke requests, not types!"
+                raise TypeError(msg)
+            await item.resolve(self, utils)
+        if not self.is_connected():
+            msg = "Not connected to the receiver"
+            raise ConnectionError(msg)
+        call_id = next(self._call_ids)
+        future = asyncio.get_running_loop().create_future()
+        self._calls[call_id] = future
+        try:
+            write_frame(
+                self._writer,  # type: ignore[arg-type]
+                {
+                    "type": "call",
+                    "id": call_id,
+                    "dc_id": sender.dc_id if isinstance(sender, RemoteSender) else None,
+                    "ordered": ordered,
+                    "list": is_list,
+                    "flood_sleep_threshold": flood_sleep_threshold,
+                },
+                [bytes(item) for item in requests],
+            )
+            await self._writer.drain()  # type: ignore[union-attr]
+            header, blobs = await future
+        finally:
+            del self._calls[call_id]
+        if "error" in header:
+            raise _decode_error(header, requests[0])
+        result = _decode_result(header, blobs)
+        for item in result if is_list else [result]:
+            self._mb_entity_cache.extend(getattr(item, "users", []), getattr(item, "chats", []))
+        trim_entity_cache(self)
+        return result
+
+    async def _borrow_exported_sender(self: Self, dc_id: int) -> RemoteSender:
+        return RemoteSender(dc_id)
+
+    async def _return_exported_sender(self: Self, sender: RemoteSender) -> None:
+        pass
+
+    async def close_receiver(self: Self) -> None:
+        """Close the receiver connection."""
+        if self._writer is not None:
+            self._writer.close()
+            with contextlib.suppress(ConnectionError):
+                await self._writer.wait_closed()
+            self._writer = None
+
+
+class UpdateReceiver(object):
+    """Owns the only connection consuming the bot's updates and spreads the work over worker processes.
+
+    Each update is sent to the worker chosen by its user, so updates of a user keep their order and the user's
+    cached data stays in one worker. Workers send their requests back, which are made on the receiver's connection.
+    Worker processes that die are started again, updates for them are held until they are back.
+    """
+
+    def __init__(
+        self: Self,
+        client: TelegramClient,
+        workers: int,
+        target: Callable[[str, int], None],
+        backlog: int = DISPATCH_BACKLOG,
+    ) -> None:
+        """Create a new receiver.
+
+        Args:
+            client (TelegramClient): Connected client whose updates are received.
+            workers (int): Number of worker processes.
+            target (Callable[[str, int], None]): Function running a worker, called with the receiver's socket path
+                and the worker's index in a new process.
+            backlog (int): Number of updates held per worker while it is not connected.
+        """
+        self.client = client
+        self.workers = workers
+        self.target = target
+        self.backlog = backlog
+        self.forwarded = 0
+        self.dropped = 0
+        self.calls = 0
+        self.restarts = 0
+        self.path: Path | None = None
+        self._directory: Path | None = None
+        self._server: asyncio.Server | None = None
+        self._ready: dict[str, Any] = {}
+        self._processes: dict[int, Any] = {}
+        self._writers: dict[int, asyncio.StreamWriter] = {}
+        self._pending: dict[int, deque[list[bytes]]] = {index: deque() for index in range(workers)}
+        self._supervisor: asyncio.Task[None] | None = None
+        self._closing = False
+
+    async def start(self: Self) -> None:
+        """Listen for workers, start them and route updates of the client to them."""
+        # Private folder, only this user may connect to the socket
+        self._directory = Path(tempfile.mkdtemp(prefix="tg-totp-workers-"))
+        self.path = Path(self._directory, "receiver.sock")
+        self._server = await asyncio.start_unix_server(self._serve, path=str(self.path))
+        me = await self.client.get_me()
+        session = self.client.session
+        self._ready = {
+            "type": "ready",
+            "self_id": me.id,
+            "bot": me.bot,
+            "access_hash": me.access_hash,
+            "dc_id": session.dc_id,
+            "server_address": session.server_address,
+            "port": session.port,
+        }
+        for index in range(self.workers):
+            self._spawn(index)
+        self._supervisor = asyncio.create_task(self._supervise())
+        # Telethon has no public hook in front of its update dispatch
+        self.client._dispatch_update = self.submit  # noqa: SLF001
+        logger.info(f"Receiving updates for {self.workers} worker processes")
+
+    def _spawn(self: Self, index: int) -> None:
+        # Spawned rather than forked, the parent's event loop and connection must not be shared
+        process = multiprocessing.get_context("spawn").Process(
+            target=self.target,
+            args=(str(self.path), index),
+            name=f"tg-totp-worker-{index}",
+        )
+        process.start()
+        self._processes[index] = process
+
+    async def submit(self: Self, update: Any) -> None:
+        """Send an update, with the entities it refers to, to the worker of its user."""
+        index = update_key(update) % self.workers
+        try:
+            blobs = [bytes(update), *(bytes(entity) for entity in getattr(update, "_entities", {}).values())]
+        except (TypeError, AttributeError) as e:
+            logger.debug(f"Skipping update that can't be serialized {e}")
+            return
+        writer = self._writers.get(index)
+        if writer is None:
+            pending = self._pending[index]
+            if len(pending) >= self.backlog:
+                self.dropped += 1
+                logger.warning(f"Dropping update, worker {index} is not connected")
+                return
+            pending.append(blobs)
+            return
+        write_frame(writer, {"type": "update"}, blobs)
+        self.forwarded += 1
+        with contextlib.suppress(ConnectionError):
+            await writer.drain()
+
+    async def _serve(self: Self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Talk to one worker: greet it, send it held updates and make its requests."""
+        tasks: set[asyncio.Task[None]] = set()
+        index = None
+        try:
+            hello, _ = await read_frame(reader)
+            index = int(hello["index"])
+            write_frame(writer, self._ready)
+            pending = self._pending[index]
+            while pending:
+                write_frame(writer, {"type": "update"}, pending.popleft())
+                self.forwarded += 1
+            self._writers[index] = writer
+            logger.info(f"Worker {index} connected")
+            while True:
+                header, blobs = await read_frame(reader)
+                task = asyncio.create_task(self._execute(writer, header, blobs))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            logger.info(f"Worker {index} disconnected")
+        finally:
+            if index is not None and self._writers.get(index) is writer:
+                del self._writers[index]
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def _execute(self: Self, writer: asyncio.StreamWriter, header: dict[str, Any], blobs: list[bytes]) -> None:
+        """Make a request of a worker and send back its result or error."""
+        self.calls += 1
+        requests = [_tl_from_bytes(blob) for blob in blobs]
+        dc_id = header["dc_id"]
+        response: dict[str, Any] = {"type": "result", "id": header["id"]}
+        result_blobs: list[bytes] = []
+        # Requests of workers are made with Telethon's private senders, the public API would resolve them again
+        try:
+            sender = (
+                self.client._sender  # noqa: SLF001
+                if dc_id is None
+                else await self.client._borrow_exported_sender(dc_id)  # noqa: SLF001
+            )
+            try:
+                result = await self.client._call(  # noqa: SLF001
+                    sender,
+                    requests if header["list"] else requests[0],
+                    ordered=header["ordered"],
+                    flood_sleep_threshold=header["flood_sleep_threshold"],
+                )
+            finally:
+                if dc_id is not None:
+                    await self.client._return_exported_sender(sender)  # noqa: SLF001
+        except Exception as e:  # noqa: BLE001
+            if isinstance(e, errors.FloodWaitError) and header["flood_sleep_threshold"] == 0:
+                # The worker waits out the flood wait itself, don't hold back other workers' requests
+                self.client._flood_waited_requests.pop(e.request.CONSTRUCTOR_ID, None)  # noqa: SLF001
+            response.update(_encode_error(e))
+        else:
+            result_header, result_blobs = _encode_result(result)
+            response.update(result_header)
+        write_frame(writer, response, result_blobs)
+        with contextlib.suppress(ConnectionError):
+            await writer.drain()
+
+    async def _supervise(self: Self) -> None:
+        """Start worker processes again when they die."""
+        while True:
+            await asyncio.sleep(WORKER_CHECK_INTERVAL)
+            for index, process in list(self._processes.items()):
+                if not process.is_alive() and not self._closing:
+                    logger.warning(f"Worker {index} exited with {process.exitcode}, starting it again")
+                    self.restarts += 1
+                    self._spawn(index)
+
+    async def close(self: Self) -> None:
+        """Ask the workers to stop, wait for them and stop listening."""
+        self._closing = True
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+        for process in self._processes.values():
+            process.terminate()
+        for index, process in self._processes.items():
+            await asyncio.to_thread(process.join, WORKER_STOP_TIMEOUT)
+            if process.is_alive():
+                logger.warning(f"Worker {index} didn't stop in time, killing it")
+                process.kill()
+        if self._server is not None:
+            self._server.close()
+        for writer in list(self._writers.values()):
+            writer.close()
+        if self._directory is not None:
+            shutil.rmtree(self._directory, ignore_errors=True)
+
+    def stats(self: Self) -> dict[str, int]:
+        """Return receiver counters."""
+        return {
+            "forwarded": self.forwarded,
+            "dropped": self.dropped,
+            "calls": self.calls,
+            "restarts": self.restarts,
+            "connected": len(self._writers),
+            "pending": sum(len(pending) for pending in self._pending.values()),
+        }
@@ -0,0 +1,120 @@
+"""Tests of the filter shrinking the update backlog delivered after downtime."""
+
+import asyncio
+from datetime import UTC, datetime, timedelta
+from typing import Any, Self
+
+from telethon import types
+
+from telegram.catchup import CatchUpFilter, update_id
+
+
+def message(user: int, message_id: int, text: str, age: float = 600) -> types.UpdateNewMessage:
+    """Return an update of a message user sent age seconds ago."""
+    date = datetime.now(UTC) - timedelta(seconds=age)
+    return types.UpdateNewMessage(
+        types.Message(message_id, types.PeerUser(user), date, text, from_id=types.PeerUser(user)),
+        0,
+        0,
+    )
+
+
+def callback(user: int, query_id: int, message_id: int, data: bytes) -> types.UpdateBotCallbackQuery:
+    """Return an update of user pressing a button of a message."""
+    return types.UpdateBotCallbackQuery(query_id, user, types.PeerUser(user), message_id, 0, data)
+
+
+def kept_of(updates: list[Any]) -> list[Any]:
+    """Return what a fresh filter keeps of updates."""
+    return CatchUpFilter().coalesce(updates)
+
+
+def test_repeated_commands_run_once() -> None:
+    """Identical commands a user sent in a row are handled once, at the position of the latest."""
+    first, second, third = message(1, 1, "/get x"), message(1, 2, "/get x"), message(1, 3, "/get x")
+    other = message(2, 4, "/get x")
+    assert kept_of([first, other, second, third]) == [other, third]
+
+
+def test_different_commands_are_kept() -> None:
+    """A command is only dropped when the next message of its user is the same command."""
+    updates = [message(1, 1, "/get x"), message(1, 2, "/total"), message(1, 3, "/get x")]
+    assert kept_of(updates) == updates
+
+
+def test_superseded_page_callbacks_are_dropped() -> None:
+    """Only the latest page callback of a message is kept, other callbacks are left alone."""
+    first, second = callback(1, 1, 5, b"next_page:2"), callback(1, 2, 5, b"prev_page:1")
+    other_message = callback(1, 3, 6, b"next_page:2")
+    confirm = callback(1, 4, 5, b"reset_yes")
+    catch_up = CatchUpFilter()
+    assert catch_up.coalesce([first, other_message, second, confirm]) == [other_message, second, confirm]
+    assert catch_up.stats()["superseded"] == 1
+
+
+def test_every_edit_of_a_message_has_its_own_id() -> None:
+    """Edits of a message are told apart from each other, deliveries of the same edit are not."""
+    first, second = message(1, 1, "/get x"), message(1, 1, "/get y")
+    first.message.edit_date = datetime(2026, 1, 1, tzinfo=UTC)
+    second.message.edit_date = datetime(2026, 1, 2, tzinfo=UTC)
+    first_edit = types.UpdateEditMessage(first.message, 0, 0)
+    second_edit = types.UpdateEditMessage(second.message, 0, 0)
+    assert update_id(first_edit) != update_id(second_edit)
+    assert update_id(first_edit) == update_id(types.UpdateEditMessage(first.message, 0, 0))
+    assert update_id(first_edit) != update_id(first)
+
+
+class Client(object):
+    """Collects the updates the filter hands over and the requests it makes."""
+
+    def __init__(self: Self) -> None:
+        self.handed_over: list[Any] = []
+        self.requests: list[Any] = []
+
+    async def __call__(self: Self, request: Any) -> bool:
+        """Record a request."""
+        self.requests.append(request)
+        return True
+
+    async def _dispatch_update(self: Self, update: Any) -> None:
+        self.handed_over.append(update)
+
+
+def test_backlog_is_drained_once_a_fresh_message_arrives() -> None:
+    """Stale updates wait for the backlog to end, duplicates are dropped and the rest is handed over in order."""
+
+    async def run() -> tuple[Client, CatchUpFilter]:
+        client = Client()
+        catch_up = CatchUpFilter()
+        catch_up.configure(idle=60)
+        catch_up.install(client)
+        stale = [message(1, 1, "/get x"), message(1, 2, "/get x"), message(2, 3, "/list")]
+        for update in [*stale, stale[2]]:
+            await client._dispatch_update(update)
+        assert client.handed_over == []
+        await client._dispatch_update(message(3, 4, "/start", age=0))
+        await catch_up.close()
+        return client, catch_up
+
+    client, catch_up = asyncio.run(run())
+    assert [update.message.id for update in client.handed_over] == [2, 3, 4]
+    assert catch_up.stats() == {"drained": 4, "duplicates": 1, "coalesced": 1, "superseded": 0, "buffered": 0}
+
+
+def test_superseded_callbacks_are_answered() -> None:
+    """Dropped page callbacks are answered so their buttons stop loading, kept ones are left to the handlers."""
+
+    async def run() -> Client:
+        client = Client()
+        catch_up = CatchUpFilter()
+        catch_up.configure(idle=0)
+        catch_up.install(client)
+        await client._dispatch_update(message(1, 1, "/list"))
+        await client._dispatch_update(callback(1, 11, 5, b"next_page:2"))
+        await client._dispatch_update(callback(1, 12, 5, b"next_page:3"))
+        await client._dispatch_update(message(1, 2, "/total", age=0))
+        return client
+
+    client = asyncio.run(run())
+    assert [getattr(update, "query_id", None) for update in client.handed_over] == [None, 12, None]
+    assert [(request.query_id, request.cache_time) for request in client.requests] == [(11, 0)]
@@ -0,0 +1,127 @@
+"""Tests of the outbound scheduler."""
+
+import asyncio
+import time
+from typing import Any, Self
+
+import pytest
+from telethon import errors, functions
+
+from telegram.exceptions import OutboundQueueFullError
+from telegram.outbound import OutboundScheduler
+
+
+class FakeClient(object):
+    """Records sends instead of making them, chats in flood_chats raise one flood wait first."""
+
+    def __init__(self: Self, flood_chats: tuple[int, ...] = ()) -> None:
+        self.flood_chats = set(flood_chats)
+        self.sent: list[tuple[float, int, Any]] = []
+        self.started = time.monotonic()
+        self._flood_waited_requests: dict[int, float] = {}
+
+    async def _call(self: Self, *args: Any) -> None:
+        """Stand in for Telethon's request method, which the scheduler wraps."""
+
+    async def send_message(self: Self, entity: int, text: str = "") -> str:
+        """Record a message."""
+        if entity in self.flood_chats:
+            self.flood_chats.discard(entity)
+            request = functions.messages.SendMessageRequest(peer=None, message=text)
+            self._flood_waited_requests[request.CONSTRUCTOR_ID] = time.monotonic() + 1
+            raise errors.FloodWaitError(request, capture=1)
+        self.sent.append((time.monotonic() - self.started, entity, text))
+        return text
+
+    async def send_file(self: Self, entity: int, file: Any = None) -> None:
+        """Record a file."""
+        self.sent.append((time.monotonic() - self.started, entity, file))
+
+    async def edit_message(self: Self, entity: int, message: int, text: str = "") -> str:
+        """Record an edit."""
+        self.sent.append((time.monotonic() - self.started, entity, (message, text)))
+        return text
+
+
+def scheduler(client: FakeClient, **limits: Any) -> OutboundScheduler:
+    """Return a scheduler installed on client."""
+    outbound = OutboundScheduler()
+    outbound.configure(**{"global_rate": 100, "chat_rate": 20, "chat_burst": 1, **limits})
+    outbound.install(client)
+    return outbound
+
+
+def test_waiting_edits_of_a_message_are_coalesced() -> None:
+    """Only the latest text of a message waiting to be edited is sent, and every caller gets its result."""
+
+    async def run() -> tuple[list[Any], OutboundScheduler, FakeClient]:
+        client = FakeClient()
+        outbound = scheduler(client)
+        results = await asyncio.gather(
+            client.send_message(1, "first"),
+            client.edit_message(1, 10, "one"),
+            client.edit_message(1, 10, "two"),
+            client.edit_message(1, 10, "three"),
+            client.edit_message(1, 11, "other"),
+        )
+        return list(results), outbound, client
+
+    results, outbound, client = asyncio.run(run())
+    assert results == ["first", "three", "three", "three", "other"]
+    assert [text for _, _, text in client.sent] == ["first", (10, "three"), (11, "other")]
+    assert outbound.stats()["coalesced"] == 2
+
+
+def test_flood_wait_only_holds_back_its_chat() -> None:
+    """A flood wait pauses the chat it was raised for while other chats keep being sent to."""
+
+    async def run() -> tuple[list[Any], OutboundScheduler, FakeClient]:
+        client = FakeClient(flood_chats=(1,))
+        outbound = scheduler(client)
+        results = await asyncio.gather(client.send_message(1, "flooded"), client.send_message(2, "free"))
+        return list(results), outbound, client
+
+    results, outbound, client = asyncio.run(run())
+    assert results == ["flooded", "free"]
+    (free_at, _, _), (flooded_at, _, _) = client.sent
+    assert free_at < 0.5 <= flooded_at
+    # Telethon's shared flood wait would hold back the same request to every chat
+    assert client._flood_waited_requests == {}
+    assert outbound.stats()["flood_waits"] == 1
+
+
+def test_sends_beyond_the_backlog_are_dropped() -> None:
+    """Sends arriving while backlog sends are already waiting fail right away."""
+
+    async def run() -> tuple[list[Any], OutboundScheduler]:
+        client = FakeClient()
+        outbound = scheduler(client, backlog=2)
+        results = await asyncio.gather(
+            client.send_message(1, "one"),
+            client.send_message(2, "two"),
+            client.send_message(3, "three"),
+            return_exceptions=True,
+        )
+        return list(results), outbound
+
+    results, outbound = asyncio.run(run())
+    assert results[:2] == ["one", "two"]
+    assert isinstance(results[2], OutboundQueueFullError)
+    assert outbound.stats()["dropped"] == 1
+    assert outbound.stats()["queued"] == 0
+
+
+def test_close_cancels_waiting_sends() -> None:
+    """Closing the scheduler cancels sends still waiting for their chat's budget."""
+
+    async def run() -> None:
+        client = FakeClient()
+        outbound = scheduler(client, chat_rate=0.1)
+        first = asyncio.ensure_future(client.send_message(1, "sent"))
+        waiting = asyncio.ensure_future(client.send_message(1, "waiting"))
+        await first
+        await outbound.close()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+
+    asyncio.run(run())
@@ -0,0 +1,140 @@
+"""Tests of per-user rate limiting."""
+
+import asyncio
+from typing import Any, Self
+
+import pytest
+from telethon import events, types
+
+from telegram import cache, ratelimit
+from telegram.dispatcher import UpdateDispatcher
+from telegram.ratelimit import RateClass, RateLimiter, TokenBucket
+from telegram.strings import slow_down, too_many_requests
+
+
+class Clock(object):
+    """Time that only moves when told to."""
+
+    def __init__(self: Self) -> None:
+        self.now = 1000.0
+
+    def monotonic(self: Self) -> float:
+        """Return the current time."""
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> Clock:
+    """Make the rate limiter and its caches run on a clock moved by the test."""
+    fake = Clock()
+    monkeypatch.setattr(ratelimit, "time", fake)
+    monkeypatch.setattr(cache, "time", fake)
+    return fake
+
+
+def test_bucket_allows_burst_then_rate(clock: Clock) -> None:
+    """A full bucket allows burst operations at once, then one every 1 / rate seconds."""
+    bucket = TokenBucket(rate=2, burst=3)
+    assert [bucket.take() for _ in range(4)] == [True, True, True, False]
+    clock.now += 0.5
+    assert bucket.take()
+    assert not bucket.take()
+
+
+def test_bucket_refills_up_to_burst(clock: Clock) -> None:
+    """Tokens don't pile up beyond burst however long the bucket is unused."""
+    bucket = TokenBucket(rate=1, burst=2)
+    clock.now += 3600
+    assert [bucket.take() for _ in range(3)] == [True, True, False]
+
+
+@pytest.mark.usefixtures("clock")
+def test_bucket_delay_spaces_operations() -> None:
+    """Delays grow by 1 / rate seconds per operation once the burst is used up."""
+    bucket = TokenBucket(rate=4, burst=1)
+    assert [bucket.delay() for _ in range(3)] == [0.0, 0.25, 0.5]
+
+
+def test_limiter_budgets_users_and_classes_apart(clock: Clock) -> None:
+    """Every user has a bucket per class, exempt users are never limited."""
+    limiter = RateLimiter()
+    limiter.configure(limits={RateClass.COMMAND: (1, 2)}, exempt=[9])
+    assert [limiter.allow(1, RateClass.COMMAND) for _ in range(3)] == [True, True, False]
+    assert limiter.allow(2, RateClass.COMMAND)
+    assert limiter.allow(1, RateClass.CALLBACK)
+    assert all(limiter.allow(9, RateClass.COMMAND) for _ in range(10))
+    clock.now += 1
+    assert limiter.allow(1, RateClass.COMMAND)
+    assert limiter.stats()["limited"] == 1
+
+
+def test_limiter_blocks_users_by_status() -> None:
+    """Users with a status other than active are blocked until they are active again."""
+    limiter = RateLimiter()
+    limiter.record_status(1, "suspended")
+    assert limiter.is_blocked(1)
+    assert not limiter.is_blocked(2)
+    limiter.record_status(1, "active")
+    assert not limiter.is_blocked(1)
+    assert limiter.stats()["blocked"] == 1
+
+
+def test_limiter_warns_once_per_interval(clock: Clock) -> None:
+    """A user over budget is told so at most once every RATE_WARN_INTERVAL seconds."""
+    limiter = RateLimiter()
+    assert [limiter.should_warn(1) for _ in range(3)] == [True, False, False]
+    assert limiter.should_warn(2)
+    clock.now += ratelimit.RATE_WARN_INTERVAL + 1
+    assert limiter.should_warn(1)
+
+
+class FakeEvent(object):
+    """Records what a handler answers to an update."""
+
+    def __init__(self: Self, sender_id: int) -> None:
+        self.sender_id = sender_id
+        self.replies: list[tuple[str, dict[str, Any]]] = []
+
+    async def reply(self: Self, text: str, **kwargs: Any) -> None:
+        """Record a reply."""
+        self.replies.append((text, kwargs))
+
+
+class FakeCallbackEvent(events.CallbackQuery.Event):  # type: ignore[misc]
+    """Records what a handler answers to a button press."""
+
+    def __init__(self: Self, sender_id: int) -> None:
+        query = types.UpdateBotCallbackQuery(1, sender_id, types.PeerUser(sender_id), 5, 0, b"next_page:2")
+        super().__init__(query, query.peer, query.msg_id)
+        self.replies: list[tuple[str, dict[str, Any]]] = []
+
+    async def answer(self: Self, text: str, **kwargs: Any) -> None:
+        """Record a callback answer."""
+        self.replies.append((text, kwargs))
+
+
+@pytest.mark.usefixtures("clock")
+def test_rejected_updates_are_answered(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Every rejected callback is answered, rejected messages get a single reply."""
+    limiter = RateLimiter()
+    limiter.configure(limits={RateClass.COMMAND: (1, 1), RateClass.CALLBACK: (1, 1)})
+    monkeypatch.setattr("telegram.dispatcher.rate_limiter", limiter)
+    handled: list[Any] = []
+
+    async def handler(event: Any) -> None:
+        handled.append(event)
+
+    async def run() -> tuple[FakeEvent, FakeCallbackEvent]:
+        dispatcher = UpdateDispatcher()
+        on_message = dispatcher._wrap_handler(handler, events.NewMessage())
+        on_callback = dispatcher._wrap_handler(handler, events.CallbackQuery())
+        message, button = FakeEvent(1), FakeCallbackEvent(1)
+        for _ in range(3):
+            await on_message(message)
+            await on_callback(button)
+        return message, button
+
+    message, button = asyncio.run(run())
+    assert handled == [message, button]
+    assert message.replies == [(too_many_requests, {})]
+    assert button.replies == [(slow_down, {"alert": False})] * 2
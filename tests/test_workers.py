@@ -0,0 +1,70 @@
+"""Tests of the messages exchanged by the update receiver and the worker processes."""
+
+import asyncio
+from typing import Any, Self
+
+import pytest
+from telethon.tl.types import Message, PeerUser, UpdateNewMessage, User
+
+from telegram.workers import read_frame, write_frame
+
+
+class BufferWriter(object):
+    """Collects what is written like the write side of a connection."""
+
+    def __init__(self: Self) -> None:
+        self.data = bytearray()
+
+    def write(self: Self, data: bytes) -> None:
+        """Append data."""
+        self.data += data
+
+
+def frames(*messages: tuple[dict[str, Any], list[bytes] | None]) -> bytes:
+    """Return the bytes of messages written one after the other."""
+    writer = BufferWriter()
+    for header, blobs in messages:
+        write_frame(writer, header, blobs)  # type: ignore[arg-type]
+    return bytes(writer.data)
+
+
+def read_all(data: bytes, count: int) -> list[tuple[dict[str, Any], list[bytes]]]:
+    """Read count messages from data."""
+
+    async def run() -> list[tuple[dict[str, Any], list[bytes]]]:
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return [await read_frame(reader) for _ in range(count)]
+
+    return asyncio.run(run())
+
+
+def test_frames_carry_header_and_telegram_objects() -> None:
+    """Messages are read back with their header and the objects in Telegram's serialization."""
+    update = UpdateNewMessage(
+        message=Message(id=1, peer_id=PeerUser(5), date=None, message="/get", from_id=PeerUser(5)),
+        pts=1,
+        pts_count=1,
+    )
+    user = User(id=5, access_hash=7, first_name="Ann")
+    data = frames(({"type": "update"}, [bytes(update), bytes(user)]), ({"type": "ready", "id": 3}, None))
+    (header, blobs), (second_header, second_blobs) = read_all(data, 2)
+    assert header == {"type": "update"}
+    assert blobs == [bytes(update), bytes(user)]
+    assert second_header == {"type": "ready", "id": 3}
+    assert second_blobs == []
+
+
+def test_empty_blobs_are_kept() -> None:
+    """Objects serialized to no bytes are not lost."""
+    ((header, blobs),) = read_all(frames(({"id": 1}, [b"", b"x"])), 1)
+    assert header == {"id": 1}
+    assert blobs == [b"", b"x"]
+
+
+def test_cut_off_frame_raises() -> None:
+    """A connection closed in the middle of a message is noticed."""
+    data = frames(({"type": "update"}, [b"payload"]))
+    with pytest.raises(asyncio.IncompleteReadError):
+        read_all(data[:-3], 1)